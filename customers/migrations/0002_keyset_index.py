@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customeractivity',
+            index=models.Index(fields=['created_at', 'id'], name='customers_a_created_217cac_idx'),
+        ),
+    ]
@@ -196,6 +196,7 @@ class CustomerActivity(models.Model):
     class Meta:
         db_table = 'customers_activity'
         indexes = [
+            models.Index(fields=['created_at', 'id']),  # keyset pagination
             models.Index(fields=['customer', 'created_at']),
             models.Index(fields=['activity_type', 'created_at']),
             models.Index(fields=['ip_address']),
@@ -0,0 +1,38 @@
+from rest_framework import serializers
+
+from .models import CustomerActivity, CustomerKYC, CustomerProfile
+
+
+class CustomerProfileSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = CustomerProfile
+        fields = [
+            'id', 'user_id', 'username', 'first_name', 'last_name', 'phone_number', 'country',
+            'verification_level', 'status', 'is_premium', 'created_at',
+        ]
+
+
+class CustomerKYCSerializer(serializers.ModelSerializer):
+    customer_id = serializers.UUIDField(read_only=True)
+    username = serializers.CharField(source='customer.user.username', read_only=True)
+
+    class Meta:
+        model = CustomerKYC
+        fields = [
+            'id', 'customer_id', 'username', 'document_type', 'issuing_country', 'status',
+            'expiry_date', 'reviewed_at', 'created_at',
+        ]
+
+
+class CustomerActivitySerializer(serializers.ModelSerializer):
+    customer_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = CustomerActivity
+        fields = [
+            'id', 'customer_id', 'activity_type', 'description', 'ip_address', 'user_agent',
+            'is_suspicious', 'risk_score', 'created_at',
+        ]
@@ -1,3 +1,31 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from mtt_gateway.testing import PageQueryCountMixin
+
+from .models import CustomerActivity, CustomerKYC, CustomerProfile
+
+
+class ListQueryCountTests(PageQueryCountMixin, TestCase):
+    """Every page is one query, whatever its size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'customer{n}') for n in range(50)])
+        profiles = CustomerProfile.objects.bulk_create([CustomerProfile(user=user) for user in users])
+        CustomerKYC.objects.bulk_create([
+            CustomerKYC(customer=profile, document_type='PASSPORT') for profile in profiles
+        ])
+        CustomerActivity.objects.bulk_create([
+            CustomerActivity(customer=profile, activity_type='LOGIN') for profile in profiles
+        ])
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_profiles(self):
+        self.assertPageQueries('/api/customers/profiles/')
+
+    def test_kyc(self):
+        self.assertPageQueries('/api/customers/kyc/')
+
+    def test_activities(self):
+        self.assertPageQueries('/api/customers/activities/')
@@ -2,7 +2,10 @@ from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from mtt_gateway.filters import filter_params
+from mtt_gateway.pagination import KeysetPagination
 from .models import CustomerProfile, CustomerKYC, CustomerActivity
+from .serializers import CustomerActivitySerializer, CustomerKYCSerializer, CustomerProfileSerializer
 
 # Create your views here.
 
@@ -25,68 +28,42 @@ def api_root(request):
 @api_view(['GET'])
 def customer_profiles_list(request):
     """
-    List customer profiles
+    List customer profiles (?status=<status>)
     """
-    profiles = CustomerProfile.objects.all()[:10]
-    data = []
-    for profile in profiles:
-        data.append({
-            'id': profile.id,
-            'user_id': profile.user.id if profile.user else None,
-            'username': profile.user.username if profile.user else None,
-            'phone_number': profile.phone_number,
-            'verification_status': profile.verification_status,
-            'is_active': profile.is_active,
-            'created_at': profile.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    profiles = CustomerProfile.objects.select_related('user').only(
+        'id', 'user__username', 'first_name', 'last_name', 'phone_number', 'country',
+        'verification_level', 'status', 'is_premium', 'created_at',
+    )
+    profiles = filter_params(profiles, request, ('status',))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(profiles, request)
+    return paginator.get_paginated_response(CustomerProfileSerializer(page, many=True).data)
 
 @api_view(['GET'])
 def customer_kyc_list(request):
     """
-    List customer KYC records
+    List customer KYC records (?status=<status>)
     """
-    kyc_records = CustomerKYC.objects.all()[:10]
-    data = []
-    for kyc in kyc_records:
-        data.append({
-            'id': kyc.id,
-            'customer_id': kyc.customer.id if kyc.customer else None,
-            'kyc_level': kyc.kyc_level,
-            'verification_status': kyc.verification_status,
-            'document_type': kyc.document_type,
-            'is_verified': kyc.is_verified,
-            'submitted_at': kyc.submitted_at.isoformat() if kyc.submitted_at else None
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    kyc_records = CustomerKYC.objects.select_related('customer__user').only(
+        'id', 'customer__user__username', 'document_type', 'issuing_country', 'status',
+        'expiry_date', 'reviewed_at', 'created_at',
+    )
+    kyc_records = filter_params(kyc_records, request, ('status',))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(kyc_records, request)
+    return paginator.get_paginated_response(CustomerKYCSerializer(page, many=True).data)
 
 @api_view(['GET'])
 def customer_activities_list(request):
     """
-    List customer activities
+    List customer activities, newest first, with cursor pagination
+    (?customer=<id>|activity_type=<type>&cursor=<next cursor>)
     """
-    activities = CustomerActivity.objects.all()[:20]
-    data = []
-    for activity in activities:
-        data.append({
-            'id': activity.id,
-            'customer_id': activity.customer.id if activity.customer else None,
-            'activity_type': activity.activity_type,
-            'description': activity.description,
-            'ip_address': activity.ip_address,
-            'user_agent': activity.user_agent,
-            'created_at': activity.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    activities = CustomerActivity.objects.only(*CustomerActivitySerializer.Meta.fields)
+    activities = filter_params(activities, request, ('customer', 'activity_type'))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(activities, request)
+    return paginator.get_paginated_response(CustomerActivitySerializer(page, many=True).data)
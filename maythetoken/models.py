@@ -4,6 +4,8 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import uuid
 
+from tokens.fixedpoint import from_units, percent_to_rate, swap_out, to_units
+
 class TradingPair(models.Model):
     """Trading pairs for MTT token"""
     base_currency = models.CharField(max_length=10)  # MTT
@@ -402,5 +404,16 @@ class LiquidityPool(models.Model):
             return 0
         return self.quote_reserve / self.base_reserve
     
+    def quote_swap(self, amount_in, sell_base=True):
+        """Output of swapping ``amount_in`` base (or quote) units through the pool"""
+        if sell_base:
+            reserve_in, reserve_out = self.base_reserve, self.quote_reserve
+        else:
+            reserve_in, reserve_out = self.quote_reserve, self.base_reserve
+        return from_units(swap_out(
+            to_units(amount_in), to_units(reserve_in), to_units(reserve_out),
+            percent_to_rate(self.fee_rate),
+        ))
+    
     def __str__(self):
         return f"{self.name} - {self.trading_pair.symbol}"
@@ -0,0 +1,289 @@
+"""
+HMAC request signing for merchant API keys.
+
+A signed request carries three headers, and optionally a fourth:
+
+    X-MTT-Key:        MerchantApiKey.api_key
+    X-MTT-Timestamp:  unix seconds
+    X-MTT-Signature:  hex HMAC-SHA256(api_secret, canonical request)
+    X-MTT-Nonce:      any string unique per request (optional)
+
+where the canonical request is
+
+    "{timestamp}\\n{METHOD}\\n{path with query string}\\n{hex SHA-256 of the body}"
+
+followed by "\\n{nonce}" when a nonce is sent. The timestamp must be within
+``MAX_SKEW_SECONDS`` of the server clock, and each signature is accepted
+once: it is remembered in the shared cache for that window, so a captured
+request cannot be replayed. Clients that send identical requests within
+the same second must vary them with a nonce.
+
+That only holds if every process sees the same cache, so signed requests
+are refused while the Django cache is process-local (no
+``CACHE_REDIS_URL``) unless ``ALLOW_LOCAL_CACHE`` is set for development.
+
+Key records are resolved through two cache tiers so the database is not
+read per request: a per-process map (``CACHE_TTL_SECONDS``) in front of the
+shared Django cache (``SHARED_CACHE_TTL_SECONDS``), which holds the secret
+Fernet-encrypted. Unknown keys are cached briefly in the shared tier only,
+so a flood of bad keys reaches neither the database nor process memory.
+
+Revoking, editing or deleting a key (or changing its merchant or the
+merchant's user) deletes the shared entries and broadcasts the key ids once
+the transaction commits; every process drops its copies, and a load that
+raced the revocation is never stored. Expiry is checked against the cached
+``expires_at`` on every request.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import authentication, exceptions, permissions
+
+from mtt_gateway import activity, broadcast, keystore
+
+from .models import MerchantApiKey
+
+CHANNEL = 'mtt:api-keys'
+
+KEY_HEADER = 'HTTP_X_MTT_KEY'
+TIMESTAMP_HEADER = 'HTTP_X_MTT_TIMESTAMP'
+SIGNATURE_HEADER = 'HTTP_X_MTT_SIGNATURE'
+NONCE_HEADER = 'HTTP_X_MTT_NONCE'
+
+ApiKeyRecord = namedtuple('ApiKeyRecord', [
+    'id', 'api_key', 'secret', 'merchant_id', 'environment',
+    'can_read', 'can_write', 'can_refund', 'rate_limit_per_minute', 'rate_limit_per_hour',
+    'expires_at', 'user_id', 'username', 'is_staff',
+])
+
+_MISSING = object()
+_UNKNOWN = 'unknown'  # shared-cache marker for keys that do not resolve
+
+# Django cache backends whose entries are not seen by other processes
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _auth_setting(name, default):
+    return getattr(settings, 'API_KEY_AUTH_SETTINGS', {}).get(name, default)
+
+
+def _has_shared_cache():
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return backend not in LOCAL_CACHE_BACKENDS or _auth_setting('ALLOW_LOCAL_CACHE', False)
+
+
+def _shared_key(api_key):
+    return f'merchant:api-key:{api_key}'
+
+
+def _replay_key(sent):
+    return f'merchant:signature:{sent}'
+
+
+def _load(api_key):
+    """The usable key record for ``api_key`` from the database, or None"""
+    row = MerchantApiKey.objects.filter(
+        api_key=api_key, is_active=True, merchant__status='ACTIVE', merchant__user__is_active=True,
+    ).values_list(
+        'id', 'api_key', 'api_secret', 'merchant_id', 'environment',
+        'can_read', 'can_write', 'can_refund', 'rate_limit_per_minute', 'rate_limit_per_hour',
+        'expires_at', 'merchant__user_id', 'merchant__user__username', 'merchant__user__is_staff',
+    ).first()
+    return ApiKeyRecord(*row) if row else None
+
+
+def _resolve(api_key):
+    """Shared cache, then database; fills the shared cache on a miss"""
+    cached = shared_cache.get(_shared_key(api_key))
+    if cached == _UNKNOWN:
+        return None
+    if cached is not None:
+        fields = dict(cached)
+        secret = keystore._decrypt(fields.pop('secret'))
+        fields['secret'] = bytes(secret)
+        keystore._zero(secret)
+        return ApiKeyRecord(**fields)
+    record = _load(api_key)
+    if record is None:
+        shared_cache.set(_shared_key(api_key), _UNKNOWN, _auth_setting('NEGATIVE_TTL_SECONDS', 5))
+    else:
+        fields = record._asdict()
+        fields['secret'] = keystore.encrypt_secret(record.secret)
+        shared_cache.set(_shared_key(api_key), fields, _auth_setting('SHARED_CACHE_TTL_SECONDS', 300))
+        record = record._replace(secret=record.secret.encode())
+    return record
+
+
+class ApiKeyCache:
+    """
+    Per-process api_key -> ApiKeyRecord map with hit/miss counters. Only
+    keys that resolve are kept, so clients cannot grow it with made-up keys.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._version = 0  # bumped by revocations so a slow load cannot resurrect a key
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, api_key, loader):
+        now = time.monotonic()
+        with self._lock:
+            record, expires = self._entries.get(api_key, (_MISSING, 0))
+            if expires > now:
+                self.hits += 1
+                return record
+            self.misses += 1
+            version = self._version
+        record = loader(api_key)
+        with self._lock:
+            if record is not None and self._version == version:
+                self._entries[api_key] = (record, now + self.ttl)
+        return record
+
+    def invalidate(self, key_ids=None):
+        with self._lock:
+            if key_ids is None:
+                self._entries.clear()
+            else:
+                key_ids = set(key_ids)
+                for api_key, (record, _) in list(self._entries.items()):
+                    if str(record.id) in key_ids:
+                        del self._entries[api_key]
+            self._version += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process key cache, subscribed to revocations on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ApiKeyCache(_auth_setting('CACHE_TTL_SECONDS', 60))
+            broadcast.subscribe(CHANNEL, _on_message)
+        return _cache
+
+
+def revoke(keys):
+    """
+    Drop cached records for ``keys`` ((id, api_key) pairs) everywhere once
+    the current transaction commits
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    message = {'key_ids': [str(key_id) for key_id, _ in keys]}
+
+    def publish():
+        shared_cache.delete_many([_shared_key(api_key) for _, api_key in keys])
+        broadcast.publish(CHANNEL, message)
+
+    transaction.on_commit(publish)
+
+
+def _on_message(message):
+    _cache.invalidate(None if message is None else message['key_ids'])
+
+
+def signature(secret, timestamp, method, path, body, nonce=''):
+    """Hex HMAC-SHA256 of the canonical request; ``secret`` and ``body`` are bytes"""
+    canonical = f'{timestamp}\n{method.upper()}\n{path}\n{hashlib.sha256(body).hexdigest()}'
+    if nonce:
+        canonical = f'{canonical}\n{nonce}'
+    return hmac.new(secret, canonical.encode(), hashlib.sha256).hexdigest()
+
+
+class ApiKeyAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates HMAC-signed requests as the key's merchant user;
+    ``request.auth`` is the ApiKeyRecord
+    """
+
+    def authenticate(self, request):
+        meta = request.META
+        api_key = meta.get(KEY_HEADER)
+        if not api_key:
+            return None
+        timestamp, sent = meta.get(TIMESTAMP_HEADER, ''), meta.get(SIGNATURE_HEADER, '')
+        # isdigit() alone also accepts characters such as '²' that int() rejects
+        if not (timestamp.isascii() and timestamp.isdigit()) or not sent:
+            raise exceptions.AuthenticationFailed('Signed requests need X-MTT-Timestamp and X-MTT-Signature')
+        max_skew = _auth_setting('MAX_SKEW_SECONDS', 300)
+        if abs(time.time() - int(timestamp)) > max_skew:
+            raise exceptions.AuthenticationFailed('Request timestamp is outside the allowed window')
+        if not _has_shared_cache():
+            # Fail closed: with a per-process replay cache other workers would accept a captured request
+            raise exceptions.AuthenticationFailed('Signed requests are unavailable: no shared cache is configured')
+        if len(api_key) > MerchantApiKey._meta.get_field('api_key').max_length:
+            raise exceptions.AuthenticationFailed('Invalid or expired API key')
+
+        record = get_cache().get(api_key, _resolve)
+        if record is None or (record.expires_at is not None and record.expires_at <= timezone.now()):
+            raise exceptions.AuthenticationFailed('Invalid or expired API key')
+        expected = signature(
+            record.secret, timestamp, request.method, request.get_full_path(), request.body, meta.get(NONCE_HEADER, ''),
+        )
+        if not hmac.compare_digest(expected, sent.lower()):
+            raise exceptions.AuthenticationFailed('Invalid request signature')
+        # Outlives the timestamp window, after which the request is refused anyway
+        if not shared_cache.add(_replay_key(expected), 1, max_skew + 1):
+            raise exceptions.AuthenticationFailed('Request signature has already been used')
+
+        activity.touch('api_key', record.id)
+        activity.touch('merchant', record.merchant_id)
+        # Built from the cached record instead of read from the database
+        user = User(id=record.user_id, username=record.username, is_staff=record.is_staff, is_active=True)
+        return user, record
+
+    def authenticate_header(self, request):
+        return 'MTT-HMAC'
+
+
+class ApiKeyScope(permissions.BasePermission):
+    """API keys need can_read for safe methods and can_write for the rest"""
+
+    message = 'API key is not allowed to perform this action'
+
+    def has_permission(self, request, view):
+        if not isinstance(request.auth, ApiKeyRecord):
+            return True
+        if request.method in permissions.SAFE_METHODS:
+            return request.auth.can_read
+        return request.auth.can_write
+
+
+class CanRefund(permissions.BasePermission):
+    """For refund endpoints: API keys additionally need can_refund"""
+
+    message = 'API key is not allowed to issue refunds'
+
+    def has_permission(self, request, view):
+        return not isinstance(request.auth, ApiKeyRecord) or request.auth.can_refund
@@ -0,0 +1,73 @@
+import secrets
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from merchant import authentication
+from merchant.models import Merchant, MerchantApiKey, MerchantCategory
+
+
+class Command(BaseCommand):
+    help = 'Per-request cost of HMAC API-key authentication: cached key lookup vs a database read'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        category, _ = MerchantCategory.objects.get_or_create(name='Benchmark')
+        user = User.objects.create(username=f'api-key-bench-{run_id}')
+        merchant = Merchant.objects.create(
+            user=user, business_name='API key benchmark', category=category, support_email='bench@example.com',
+            address_line1='-', city='-', state='-', postal_code='-', country='US', status='ACTIVE',
+        )
+        key = MerchantApiKey.objects.create(
+            merchant=merchant, name='bench', environment='SANDBOX',
+            api_key=secrets.token_hex(16), api_secret=secrets.token_hex(32),
+        )
+        try:
+            factory = RequestFactory()
+            body = b'{"amount": "10.00"}'
+            timestamp = str(int(time.time()))
+            path = '/api/payments/transactions/?limit=50'
+
+            def signed(nonce):
+                # Every request gets its own nonce; a repeated signature is refused as a replay
+                return Request(factory.post(
+                    path, body, content_type='application/json', HTTP_X_MTT_KEY=key.api_key,
+                    HTTP_X_MTT_TIMESTAMP=timestamp, HTTP_X_MTT_NONCE=str(nonce),
+                    HTTP_X_MTT_SIGNATURE=authentication.signature(
+                        key.api_secret.encode(), timestamp, 'POST', path, body, str(nonce)
+                    ),
+                ))
+
+            count = options['requests']
+            requests = [signed(nonce) for nonce in range(count)]
+            cold = [signed(nonce) for nonce in range(count, count + max(count // 20, 1))]
+            backend = authentication.ApiKeyAuthentication()
+            cache = authentication.get_cache()
+
+            backend.authenticate(signed('warm'))
+            started = time.perf_counter()
+            for request in requests:
+                backend.authenticate(request)
+            cached = (time.perf_counter() - started) / len(requests)
+
+            started = time.perf_counter()
+            for request in cold:
+                cache.invalidate()
+                authentication.shared_cache.delete(authentication._shared_key(key.api_key))
+                backend.authenticate(request)
+            uncached = (time.perf_counter() - started) / len(cold)
+
+            self.stdout.write(
+                f"cached: {cached * 1e6:7.1f} us/request | database: {uncached * 1e6:7.1f} us/request | "
+                f"{uncached / cached:5.1f}x"
+            )
+            self.stdout.write(f"cache hit rate {cache.stats()['hit_rate']:.2%}")
+        finally:
+            user.delete()
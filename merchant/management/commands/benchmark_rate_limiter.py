@@ -0,0 +1,48 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from merchant.throttling import LocalBuckets, RateLimiter, RedisBuckets
+
+
+class _RemoteBuckets:
+    """Local buckets behind a simulated network round trip"""
+
+    def __init__(self, latency):
+        self.buckets = LocalBuckets()
+        self.latency = latency
+
+    def take(self, keys, specs, wanted):
+        time.sleep(self.latency)
+        return self.buckets.take(keys, specs, wanted)
+
+
+class Command(BaseCommand):
+    help = 'Per-request overhead of the API key rate limiter, with and without token leases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5_000)
+        parser.add_argument('--per-minute', type=int, default=6_000)
+        parser.add_argument('--per-hour', type=int, default=100_000)
+        parser.add_argument('--rtt-ms', type=float, default=0.5, help='Simulated Redis round-trip time')
+        parser.add_argument('--redis-url', help='Measure against a real Redis instead of the simulation')
+
+    def handle(self, *args, **options):
+        limits = [(options['per_minute'], 60), (options['per_hour'], 3600)]
+        for name, lease_fraction in (('one call per request', 0), ('leased', None)):
+            if options['redis_url']:
+                buckets = RedisBuckets(options['redis_url'])
+            else:
+                buckets = _RemoteBuckets(options['rtt_ms'] / 1000)
+            limiter = RateLimiter(buckets, lease_fraction=lease_fraction)
+            key_id = uuid.uuid4()
+            started = time.perf_counter()
+            allowed = sum(1 for _ in range(options['requests']) if limiter.acquire(key_id, limits).allowed)
+            elapsed = time.perf_counter() - started
+            stats = limiter.stats()
+            self.stdout.write(
+                f"{name:>20}: {elapsed * 1e6 / options['requests']:7.1f} us/request, "
+                f"{stats['round_trips_per_request']:.3f} round trips/request, "
+                f"{allowed} of {options['requests']} allowed"
+            )
@@ -0,0 +1,84 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from merchant.models import Merchant, MerchantCategory, MerchantGateway, MerchantTransaction
+from merchant.settlement import settle, submit
+
+
+class Command(BaseCommand):
+    help = 'Set-based settlement vs settling one gateway at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=5_000)
+        parser.add_argument('--payments', type=int, default=5, help='Completed payments per merchant')
+        parser.add_argument('--baseline', type=int, default=500, help='Gateways settled one at a time')
+        parser.add_argument('--partitions', type=int, default=2)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        count, payments = options['merchants'], options['payments']
+        category, _ = MerchantCategory.objects.get_or_create(name='Benchmark')
+        User.objects.bulk_create([User(username=f'settle-bench-{run_id}-{i}') for i in range(count)])
+        users = list(User.objects.filter(username__startswith=f'settle-bench-{run_id}-').values_list('id', flat=True))
+        try:
+            merchants = Merchant.objects.bulk_create([
+                Merchant(user_id=user_id, business_name=f'Bench {i}', category=category, support_email='b@example.com',
+                         address_line1='-', city='-', state='-', postal_code='-', country='US', status='ACTIVE')
+                for i, user_id in enumerate(users)
+            ])
+            gateways = MerchantGateway.objects.bulk_create([
+                MerchantGateway(merchant=merchant, name='main', gateway_type='CUSTODIAL',
+                                wallet_address=f'0x{run_id}{i:032x}', settlement_threshold=Decimal('50'))
+                for i, merchant in enumerate(merchants)
+            ])
+            MerchantTransaction.objects.bulk_create([
+                MerchantTransaction(merchant_id=gateway.merchant_id, gateway=gateway, transaction_type='PAYMENT',
+                                    amount_usd=Decimal('25.00'), amount_mtt=Decimal('25'), fee_amount=Decimal('0.50'),
+                                    net_amount=Decimal('24.50'), status='COMPLETED')
+                for gateway in gateways for _ in range(payments)
+            ], batch_size=5000)
+
+            started = time.perf_counter()
+            for gateway in gateways[:options['baseline']]:
+                unsettled = MerchantTransaction.objects.filter(
+                    gateway=gateway, transaction_type='PAYMENT', status='COMPLETED', settlement__isnull=True,
+                )
+                totals = unsettled.aggregate(net=Sum('net_amount'), gross=Sum('amount_usd'))
+                if totals['net'] and totals['net'] >= gateway.settlement_threshold:
+                    payout = MerchantTransaction.objects.create(
+                        merchant_id=gateway.merchant_id, gateway=gateway, transaction_type='SETTLEMENT',
+                        amount_usd=totals['gross'], amount_mtt=0, net_amount=totals['net'],
+                    )
+                    unsettled.update(settlement=payout)
+            per_gateway = options['baseline'] / (time.perf_counter() - started)
+            MerchantTransaction.objects.filter(merchant_id__in=[m.pk for m in merchants],
+                                               transaction_type='SETTLEMENT').delete()
+
+            started = time.perf_counter()
+            summaries = [settle(partition, options['partitions']) for partition in range(options['partitions'])]
+            seconds = time.perf_counter() - started
+            again = settle()
+            submitted = submit()
+
+            payouts = MerchantTransaction.objects.filter(merchant_id__in=[m.pk for m in merchants],
+                                                         transaction_type='SETTLEMENT')
+            self.stdout.write(
+                f"one gateway at a time: {per_gateway:8,.0f} gateways/sec ({options['baseline']} gateways)"
+            )
+            self.stdout.write(
+                f"            set-based: {count / seconds:8,.0f} gateways/sec "
+                f"({sum(s['payouts'] for s in summaries)} payouts, {sum(s['payments'] for s in summaries)} payments, "
+                f"{options['partitions']} partitions)"
+            )
+            self.stdout.write(
+                f"re-run created {again['payouts']} payouts; {payouts.count()} payouts for {count} merchants, "
+                f"{submitted['completed']} submitted; "
+                f"50k merchants would take about {50_000 / (count / seconds) / 60:.1f} min"
+            )
+        finally:
+            User.objects.filter(pk__in=users).delete()
@@ -0,0 +1,102 @@
+import asyncio
+import time
+import urllib.request
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from merchant.models import Merchant, MerchantCategory, MerchantGateway, MerchantWebhookDelivery
+from merchant.webhooks import Dispatcher, HttpPool, signature
+
+
+async def _stub(reader, writer):
+    """Keep-alive endpoint that answers every POST with 200 after ``delay``"""
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            headers = dict(
+                line.lower().split(': ', 1) for line in head.decode('latin-1').split('\r\n')[1:] if ': ' in line
+            )
+            body = await reader.readexactly(int(headers['content-length']))
+            ok = headers['x-mtt-signature'] == signature('bench-secret', headers['x-mtt-timestamp'], body)
+            await asyncio.sleep(_stub.delay)
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok' if ok
+                         else b'HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = 'Async outbox dispatcher vs posting webhooks one at a time, against a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deliveries', type=int, default=20_000)
+        parser.add_argument('--merchants', type=int, default=200)
+        parser.add_argument('--baseline', type=int, default=300, help='Webhooks posted one at a time')
+        parser.add_argument('--delay-ms', type=float, default=5, help='Stub server response time')
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        _stub.delay = options['delay_ms'] / 1000
+        server = await asyncio.start_server(_stub, '127.0.0.1', 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/hook"
+        from asgiref.sync import sync_to_async
+
+        run_id, users = await sync_to_async(self._seed)(options, url)
+        try:
+            started = time.perf_counter()
+            for _ in range(options['baseline']):
+                request = urllib.request.Request(url, data=b'{}', headers={
+                    'X-MTT-Timestamp': '0', 'X-MTT-Signature': signature('bench-secret', '0', b'{}'),
+                })
+                await asyncio.to_thread(lambda: urllib.request.urlopen(request, timeout=10).read())
+            one_at_a_time = options['baseline'] / (time.perf_counter() - started)
+
+            dispatcher = Dispatcher(pool=HttpPool(allow_private=True))  # the stub listens on 127.0.0.1
+            started = time.perf_counter()
+            await dispatcher.run(until_idle=True)
+            seconds = time.perf_counter() - started
+        finally:
+            server.close()
+            await sync_to_async(User.objects.filter(pk__in=users).delete)()
+
+        stats = dispatcher.stats()
+        self.stdout.write(f"one at a time: {one_at_a_time:8,.0f} deliveries/sec ({options['baseline']} webhooks)")
+        self.stdout.write(
+            f"   dispatcher: {stats['delivered'] / seconds:8,.0f} deliveries/sec "
+            f"({stats['delivered']} delivered, {stats['retried']} retried, {stats['connections']} connections "
+            f"for {stats['requests']} requests)"
+        )
+        for name in ('request_latency', 'delivery_latency'):
+            latency = stats[name]
+            self.stdout.write(
+                f"{name}: mean {latency['mean_ms']}ms p50 <={latency['p50_ms']}ms p95 <={latency['p95_ms']}ms "
+                f"p99 <={latency['p99_ms']}ms {latency['buckets']}"
+            )
+
+    def _seed(self, options, url):
+        run_id = uuid.uuid4().hex[:8]
+        category, _ = MerchantCategory.objects.get_or_create(name='Benchmark')
+        User.objects.bulk_create([User(username=f'webhook-bench-{run_id}-{i}') for i in range(options['merchants'])])
+        users = list(User.objects.filter(username__startswith=f'webhook-bench-{run_id}-').values_list('id', flat=True))
+        merchants = Merchant.objects.bulk_create([
+            Merchant(user_id=user_id, business_name=f'Bench {i}', category=category, support_email='b@example.com',
+                     address_line1='-', city='-', state='-', postal_code='-', country='US', status='ACTIVE')
+            for i, user_id in enumerate(users)
+        ])
+        gateways = MerchantGateway.objects.bulk_create([
+            MerchantGateway(merchant=merchant, name='main', gateway_type='CUSTODIAL', callback_url=url,
+                            webhook_secret='bench-secret', wallet_address=f'0x{run_id}{i:032x}')
+            for i, merchant in enumerate(merchants)
+        ])
+        MerchantWebhookDelivery.objects.bulk_create([
+            MerchantWebhookDelivery(merchant_id=gateways[i % len(gateways)].merchant_id,
+                                    gateway=gateways[i % len(gateways)], event_type='transaction.completed',
+                                    payload={'id': i, 'amount_usd': '25.00', 'status': 'COMPLETED'}, url=url)
+            for i in range(options['deliveries'])
+        ], batch_size=5000)
+        return run_id, users
@@ -0,0 +1,23 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+from merchant.webhooks import Dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued merchant webhooks from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+        parser.add_argument('--max-in-flight', type=int, default=None)
+        parser.add_argument('--max-per-merchant', type=int, default=None)
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(max_in_flight=options['max_in_flight'], max_per_merchant=options['max_per_merchant'])
+        try:
+            asyncio.run(dispatcher.run(until_idle=options['once']))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(json.dumps(dispatcher.stats(), indent=2))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from merchant.settlement import settle, submit
+
+
+class Command(BaseCommand):
+    help = 'Create settlement payouts for gateways over their threshold and submit pending payouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partition', type=int, default=0, help='This worker\'s partition (0-based)')
+        parser.add_argument('--partitions', type=int, default=1, help='Workers splitting the merchants')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Gateways per transaction')
+        parser.add_argument('--batch-size', type=int, default=None, help='Payouts per backend call')
+        parser.add_argument('--no-submit', action='store_true', help='Only create payouts')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, settling every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['partition'] < options['partitions']:
+            raise CommandError('--partition must be between 0 and --partitions - 1')
+        while True:
+            summary = settle(options['partition'], options['partitions'], options['chunk_size'])
+            self.stdout.write(
+                f"Checked {summary['gateways']} gateways: {summary['payouts']} payouts "
+                f"settling {summary['payments']} payments in {summary['seconds']:.2f}s"
+            )
+            if not options['no_submit']:
+                submitted = submit(options['batch_size'])
+                self.stdout.write(
+                    f"Submitted {submitted['submitted']} payouts: {submitted['completed']} completed, "
+                    f"{submitted['failed']} failed, {submitted['errors']} left for retry "
+                    f"in {submitted['seconds']:.2f}s"
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='merchanttransaction',
+            index=models.Index(fields=['created_at', 'id'], name='merchant_tr_created_f95401_idx'),
+        ),
+    ]
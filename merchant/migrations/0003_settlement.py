@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0002_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchanttransaction',
+            name='settlement',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='settled_transactions', to='merchant.merchanttransaction'),
+        ),
+        migrations.AddIndex(
+            model_name='merchanttransaction',
+            index=models.Index(fields=['gateway', 'status'], name='merchant_tr_gateway_729c92_idx'),
+        ),
+    ]
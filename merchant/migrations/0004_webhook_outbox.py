@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:25
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0003_settlement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantWebhookDelivery',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('event_type', models.CharField(max_length=50)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('url', models.URLField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('DELIVERING', 'Delivering'), ('DELIVERED', 'Delivered'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempt_id', models.CharField(blank=True, max_length=32)),
+                ('response_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('gateway', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_deliveries', to='merchant.merchantgateway')),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_deliveries', to='merchant.merchant')),
+            ],
+            options={
+                'db_table': 'merchant_webhook_delivery',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='merchant_we_status_bfcbbe_idx'), models.Index(fields=['attempt_id'], name='merchant_we_attempt_1b6ac5_idx'), models.Index(fields=['merchant', 'created_at'], name='merchant_we_merchan_a314d7_idx')],
+            },
+        ),
+    ]
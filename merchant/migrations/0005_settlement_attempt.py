@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0004_webhook_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchanttransaction',
+            name='attempt_id',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='merchanttransaction',
+            index=models.Index(fields=['attempt_id'], name='merchant_tr_attempt_8c1181_idx'),
+        ),
+    ]
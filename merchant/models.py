@@ -1,9 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
 import uuid
 
+from tokens.fixedpoint import fee, from_units, percent_to_rate, to_units
+
 class MerchantCategory(models.Model):
     """Merchant business categories"""
     name = models.CharField(max_length=100, unique=True)
@@ -171,6 +175,13 @@ class MerchantGateway(models.Model):
             models.Index(fields=['is_primary']),
         ]
     
+    def calculate_fee(self, amount_usd):
+        """Percentage plus flat fee for a payment, rounded down to the cent"""
+        return from_units(fee(
+            to_units(amount_usd, 2), percent_to_rate(self.transaction_fee_percentage),
+            to_units(self.flat_fee, 2),
+        ), 2)
+    
     def save(self, *args, **kwargs):
         # Ensure only one primary gateway per merchant
         if self.is_primary:
@@ -293,6 +304,10 @@ class MerchantTransaction(models.Model):
     merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='transactions')
     gateway = models.ForeignKey(MerchantGateway, on_delete=models.CASCADE, null=True, blank=True)
     product = models.ForeignKey(MerchantProduct, on_delete=models.SET_NULL, null=True, blank=True)
+    # The SETTLEMENT payout this payment was paid out in (see merchant.settlement)
+    settlement = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='settled_transactions'
+    )
     
     # Transaction details
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
@@ -313,6 +328,7 @@ class MerchantTransaction(models.Model):
     # Status and metadata
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     reference_id = models.CharField(max_length=100, null=True, blank=True)  # Merchant's reference
+    attempt_id = models.CharField(max_length=32, blank=True)  # set by the payout submitter that claimed it
     notes = models.TextField(blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -322,13 +338,54 @@ class MerchantTransaction(models.Model):
     class Meta:
         db_table = 'merchant_transaction'
         indexes = [
+            models.Index(fields=['created_at', 'id']),  # keyset pagination
             models.Index(fields=['merchant', 'created_at']),
+            models.Index(fields=['gateway', 'status']),  # settlement aggregation
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['transaction_hash']),
             models.Index(fields=['reference_id']),
+            models.Index(fields=['attempt_id']),
             models.Index(fields=['customer_email']),
         ]
         ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.merchant.business_name} - ${self.amount_usd} ({self.status})"
+
+class MerchantWebhookDelivery(models.Model):
+    """Outbox of gateway callbacks, delivered by merchant.webhooks"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('DELIVERING', 'Delivering'),
+        ('DELIVERED', 'Delivered'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='webhook_deliveries')
+    gateway = models.ForeignKey(MerchantGateway, on_delete=models.CASCADE, related_name='webhook_deliveries')
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    url = models.URLField()  # callback_url when the event was queued
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempt_id = models.CharField(max_length=32, blank=True)  # set by the dispatcher that claimed it
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    error_message = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'merchant_webhook_delivery'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['attempt_id']),
+            models.Index(fields=['merchant', 'created_at']),
+        ]
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.event_type} -> {self.url} ({self.status})"
@@ -0,0 +1,48 @@
+from rest_framework import serializers
+
+from .models import Merchant, MerchantGateway, MerchantProduct, MerchantTransaction
+
+
+class MerchantSerializer(serializers.ModelSerializer):
+    category = serializers.CharField(source='category.name', read_only=True)
+
+    class Meta:
+        model = Merchant
+        fields = [
+            'id', 'business_name', 'category', 'support_email', 'support_phone', 'country',
+            'status', 'verification_level', 'is_verified', 'created_at',
+        ]
+
+
+class MerchantGatewaySerializer(serializers.ModelSerializer):
+    merchant_id = serializers.UUIDField(read_only=True)
+    merchant_name = serializers.CharField(source='merchant.business_name', read_only=True)
+
+    class Meta:
+        model = MerchantGateway
+        fields = [
+            'id', 'merchant_id', 'merchant_name', 'name', 'gateway_type', 'wallet_address',
+            'status', 'is_primary', 'created_at',
+        ]
+
+
+class MerchantProductSerializer(serializers.ModelSerializer):
+    merchant_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = MerchantProduct
+        fields = [
+            'id', 'merchant_id', 'name', 'description', 'sku', 'price_usd', 'price_mtt',
+            'is_active', 'created_at',
+        ]
+
+
+class MerchantTransactionSerializer(serializers.ModelSerializer):
+    merchant_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = MerchantTransaction
+        fields = [
+            'id', 'merchant_id', 'transaction_type', 'amount_usd', 'amount_mtt', 'fee_amount',
+            'net_amount', 'status', 'reference_id', 'created_at',
+        ]
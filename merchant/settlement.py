@@ -0,0 +1,225 @@
+"""
+Settlement of merchant gateway balances.
+
+A gateway with ``auto_settlement`` is due once the net amount of its
+COMPLETED, not yet settled PAYMENT transactions reaches its
+``settlement_threshold`` (compared against ``net_amount``, in USD). Each due
+gateway gets one SETTLEMENT MerchantTransaction, the payout, carrying the
+summed gross, fee and net amounts of the payments it settles; the payments
+point at it through ``settlement``.
+
+``settle()`` walks the gateways in primary-key order, a chunk at a time,
+and settles every due gateway in the chunk with a fixed handful of
+set-based queries in one transaction: aggregate the unsettled payments per
+gateway, lock the due gateways (``SKIP LOCKED``, so concurrent workers
+never wait on each other), create the payouts, claim the payments with one
+UPDATE, and total the payouts from exactly the rows claimed. A payment can
+only be claimed while ``settlement`` is NULL, so overlapping runs can never
+settle it twice. ``--partition``/``--partitions`` split the merchants
+between workers by id.
+
+``submit()`` hands PENDING payouts to ``PAYOUT_BACKEND`` in batches. A
+batch is claimed with one conditional UPDATE that stamps it with an
+``attempt_id``, so any number of submitters can run at once without sending a payout
+twice. The backend gets payout dicts whose ``id`` is stable across attempts
+(use it as the idempotency key) and returns ``{id: transaction hash or
+None}`` for the payouts it sent. Payouts missing from the result are
+FAILED and their payments are released to the next settlement. If the
+backend raises, the batch is left PROCESSING and is submitted again after
+``RESUBMIT_AFTER_SECONDS``. Results are only written to payouts that still
+carry the submitter's ``attempt_id``: a submitter whose batch went stale and
+was claimed again records nothing for it. Completed and failed payouts
+queue ``settlement.completed`` and ``settlement.failed`` webhooks.
+"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import webhooks
+from .models import MerchantGateway, MerchantTransaction
+
+logger = logging.getLogger('mtt_gateway')
+
+PAYOUT_FIELDS = ('amount_usd', 'amount_mtt', 'fee_amount', 'net_amount')
+
+
+def _settlement_setting(name, default):
+    return getattr(settings, 'SETTLEMENT_SETTINGS', {}).get(name, default)
+
+
+def _unsettled():
+    return MerchantTransaction.objects.filter(
+        transaction_type='PAYMENT', status='COMPLETED', settlement__isnull=True,
+    )
+
+
+def _in_partition(merchant_id, partition, partitions):
+    return merchant_id.int % partitions == partition
+
+
+def _gateway_chunks(chunk_size, partition, partitions):
+    gateways = MerchantGateway.objects.filter(
+        auto_settlement=True, status='ACTIVE', merchant__status='ACTIVE',
+    ).order_by('pk')
+    last = None
+    while True:
+        page = gateways if last is None else gateways.filter(pk__gt=last)
+        rows = list(page.values_list('pk', 'merchant_id')[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield [pk for pk, merchant_id in rows if _in_partition(merchant_id, partition, partitions)]
+
+
+def _settle_chunk(gateway_ids, now):
+    """Settle the due gateways among ``gateway_ids``; returns (payouts, payments settled)"""
+    with transaction.atomic():
+        due = _unsettled().filter(gateway_id__in=gateway_ids).values(
+            'gateway_id', 'gateway__settlement_threshold',
+        ).annotate(net=Sum('net_amount')).filter(net__gt=0, net__gte=F('gateway__settlement_threshold'))
+        due = [row['gateway_id'] for row in due]
+        if not due:
+            return 0, 0
+        locked = list(MerchantGateway.objects.select_for_update(skip_locked=True).filter(
+            pk__in=due,
+        ).values_list('pk', 'merchant_id', 'wallet_address'))
+        if not locked:
+            return 0, 0
+
+        payouts = MerchantTransaction.objects.bulk_create([
+            MerchantTransaction(
+                merchant_id=merchant_id, gateway_id=gateway_id, transaction_type='SETTLEMENT',
+                amount_usd=0, amount_mtt=0, net_amount=0, to_address=wallet_address, status='PENDING',
+            )
+            for gateway_id, merchant_id, wallet_address in locked
+        ])
+        payout_ids = [payout.pk for payout in payouts]
+        claimed = _unsettled().filter(gateway_id__in=[row[0] for row in locked]).update(
+            settlement_id=Subquery(MerchantTransaction.objects.filter(
+                pk__in=payout_ids, gateway_id=OuterRef('gateway_id'),
+            ).values('pk')[:1]),
+            updated_at=now,
+        )
+
+        settled = MerchantTransaction.objects.filter(settlement_id=OuterRef('pk')).values('settlement_id')
+        MerchantTransaction.objects.filter(pk__in=payout_ids).update(**{
+            field: Coalesce(
+                Subquery(settled.annotate(total=Sum(field)).values('total')),
+                Value(0, output_field=DecimalField(max_digits=40, decimal_places=18)),
+            )
+            for field in PAYOUT_FIELDS
+        })
+        # Payments refunded between the aggregate and the claim can leave a payout empty
+        empty, _ = MerchantTransaction.objects.filter(pk__in=payout_ids, net_amount__lte=0).delete()
+    return len(payout_ids) - empty, claimed
+
+
+def settle(partition=0, partitions=1, chunk_size=None, progress=None):
+    """
+    Create payouts for every due gateway of the merchants in ``partition``.
+    Returns {'gateways', 'payouts', 'payments', 'seconds'}; ``progress(summary)``
+    is called after every chunk.
+    """
+    chunk_size = chunk_size or _settlement_setting('CHUNK_SIZE', 1000)
+    summary = {'gateways': 0, 'payouts': 0, 'payments': 0}
+    started = time.perf_counter()
+    for gateway_ids in _gateway_chunks(chunk_size, partition, partitions):
+        payouts, payments = _settle_chunk(gateway_ids, timezone.now())
+        summary['gateways'] += len(gateway_ids)
+        summary['payouts'] += payouts
+        summary['payments'] += payments
+        if progress:
+            progress(summary)
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def book_payouts(payouts):
+    """Default backend: the payout is recorded as paid with no on-chain transfer"""
+    return {payout['id']: None for payout in payouts}
+
+
+def _claim(batch_size, now):
+    stale = now - timedelta(seconds=_settlement_setting('RESUBMIT_AFTER_SECONDS', 900))
+    submittable = MerchantTransaction.objects.filter(transaction_type='SETTLEMENT').filter(
+        Q(status='PENDING') | Q(status='PROCESSING', updated_at__lt=stale)
+    )
+    candidates = list(submittable.order_by('created_at', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not candidates:
+        return None, []
+    attempt = uuid.uuid4().hex
+    submittable.filter(pk__in=candidates).update(
+        status='PROCESSING', attempt_id=attempt, updated_at=now,
+    )
+    return attempt, list(MerchantTransaction.objects.filter(attempt_id=attempt, status='PROCESSING').values(
+        'id', 'merchant_id', 'gateway_id', 'to_address', *PAYOUT_FIELDS,
+    ))
+
+
+def _record(attempt, payouts, sent, now):
+    """Write the backend's results for the payouts still held by ``attempt``; returns (completed, failed)"""
+    with transaction.atomic():
+        held = set(MerchantTransaction.objects.select_for_update().filter(
+            pk__in=[payout['id'] for payout in payouts], attempt_id=attempt, status='PROCESSING',
+        ).values_list('pk', flat=True))
+        completed = {pk: tx_hash for pk, tx_hash in sent.items() if pk in held}
+        failed = [pk for pk in held if pk not in completed]
+        hashes = {pk: tx_hash for pk, tx_hash in completed.items() if tx_hash}
+
+        MerchantTransaction.objects.filter(pk__in=list(completed)).update(
+            status='COMPLETED', completed_at=now, updated_at=now,
+        )
+        if hashes:
+            MerchantTransaction.objects.bulk_update(
+                [MerchantTransaction(pk=pk, transaction_hash=tx_hash) for pk, tx_hash in hashes.items()],
+                ['transaction_hash'],
+            )
+        if failed:
+            MerchantTransaction.objects.filter(pk__in=failed).update(
+                status='FAILED', notes='Payout was not sent; payments released', updated_at=now,
+            )
+            MerchantTransaction.objects.filter(settlement_id__in=failed).update(settlement=None, updated_at=now)
+            webhooks.enqueue_transactions(failed, 'settlement.failed')
+        if completed:
+            webhooks.enqueue_transactions(list(completed), 'settlement.completed')
+    return len(completed), len(failed)
+
+
+def submit(batch_size=None, backend=None, progress=None):
+    """
+    Send every submittable payout through the payout backend. Returns {'submitted', 'completed', 'failed', 'errors',
+    'reclaimed', 'seconds'}; ``reclaimed`` counts payouts claimed by another submitter before their results were
+    recorded.
+    """
+    batch_size = batch_size or _settlement_setting('SUBMIT_BATCH_SIZE', 500)
+    backend = backend or import_string(_settlement_setting('PAYOUT_BACKEND', 'merchant.settlement.book_payouts'))
+    summary = {'submitted': 0, 'completed': 0, 'failed': 0, 'errors': 0, 'reclaimed': 0}
+    started = time.perf_counter()
+    while True:
+        attempt, payouts = _claim(batch_size, timezone.now())
+        if not payouts:
+            break
+        summary['submitted'] += len(payouts)
+        try:
+            sent = backend(payouts)
+        except Exception:
+            # Some payouts may have gone out; leave the batch for a later resubmission
+            logger.exception('Payout backend failed for a batch of %s settlements', len(payouts))
+            summary['errors'] += len(payouts)
+            break
+        completed, failed = _record(attempt, payouts, sent, timezone.now())
+        summary['completed'] += completed
+        summary['failed'] += failed
+        summary['reclaimed'] += len(payouts) - completed - failed
+        if progress:
+            progress(summary)
+    summary['seconds'] = time.perf_counter() - started
+    return summary
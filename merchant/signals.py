@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from mtt_gateway import keystore
+
+from . import authentication, webhooks
+from .models import Merchant, MerchantApiKey, MerchantGateway, MerchantTransaction
+
+# Transaction statuses merchants are called back about
+WEBHOOK_STATUSES = ('COMPLETED', 'FAILED', 'CANCELLED', 'REFUNDED')
+
+
+@receiver(post_save, sender=MerchantGateway)
+def evict_inactive_gateway_key(sender, instance, **kwargs):
+    """Stop serving a cached private key once the gateway can no longer sign"""
+    if instance.status != 'ACTIVE':
+        keystore.evict('gateway', instance.pk)
+
+
+@receiver(post_delete, sender=MerchantGateway)
+def evict_deleted_gateway_key(sender, instance, **kwargs):
+    keystore.evict('gateway', instance.pk)
+
+
+@receiver(pre_save, sender=MerchantApiKey)
+def remember_previous_api_key(sender, instance, **kwargs):
+    # A rotated key must stop resolving under its old value too
+    if not instance._state.adding:
+        instance._previous_api_key = MerchantApiKey.objects.filter(pk=instance.pk).values_list(
+            'api_key', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=MerchantApiKey)
+@receiver(post_delete, sender=MerchantApiKey)
+def revoke_cached_api_key(sender, instance, **kwargs):
+    keys = [(instance.pk, instance.api_key)]
+    previous = getattr(instance, '_previous_api_key', None)
+    if previous and previous != instance.api_key:
+        keys.append((instance.pk, previous))
+    authentication.revoke(keys)
+
+
+@receiver(post_save, sender=Merchant)
+def revoke_merchant_api_keys(sender, instance, **kwargs):
+    """Cached keys carry the merchant's status"""
+    authentication.revoke(MerchantApiKey.objects.filter(merchant=instance).values_list('id', 'api_key'))
+
+
+@receiver(post_save, sender=User)
+def revoke_user_api_keys(sender, instance, update_fields=None, **kwargs):
+    """Cached keys carry their user's name, staff flag and active flag"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    authentication.revoke(
+        MerchantApiKey.objects.filter(merchant__user=instance).values_list('id', 'api_key')
+    )
+
+
+@receiver(pre_save, sender=MerchantTransaction)
+def remember_previous_status(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._previous_status = MerchantTransaction.objects.filter(pk=instance.pk).values_list(
+            'status', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=MerchantTransaction)
+def queue_transaction_webhook(sender, instance, **kwargs):
+    """Queue a callback when a transaction reaches a reportable status"""
+    if instance.status in WEBHOOK_STATUSES and instance.status != getattr(instance, '_previous_status', None):
+        webhooks.enqueue_transactions([instance.pk], f'transaction.{instance.status.lower()}')
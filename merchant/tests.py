@@ -1,3 +1,373 @@
-from django.test import TestCase
+import asyncio
+import time
+import uuid
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from mtt_gateway.testing import PageQueryCountMixin
+
+from . import authentication, settlement, throttling, webhooks
+from .models import (
+    Merchant, MerchantApiKey, MerchantCategory, MerchantGateway, MerchantProduct, MerchantTransaction,
+    MerchantWebhookDelivery,
+)
+from .throttling import LocalBuckets, RateLimiter
+from .webhooks import BlockedAddress, HttpPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_api_key(username='merchant', **fields):
+    # Key records outlive the test database in both cache tiers
+    cache.clear()
+    authentication.get_cache().invalidate()
+    user = User.objects.create_user(username)
+    category, _ = MerchantCategory.objects.get_or_create(name='Retail')
+    merchant = Merchant.objects.create(
+        user=user, business_name='Shop', category=category, support_email='shop@example.com',
+        address_line1='1 Main St', city='Town', state='ST', postal_code='00000', country='US', status='ACTIVE',
+    )
+    return MerchantApiKey.objects.create(**{
+        'merchant': merchant, 'name': 'server', 'api_key': f'key-{username}', 'api_secret': 'secret',
+        'environment': 'PRODUCTION', **fields,
+    })
+
+
+def signed_headers(api_key, method, path, body=b'', timestamp=None, nonce=None):
+    timestamp = str(int(time.time())) if timestamp is None else timestamp
+    nonce = uuid.uuid4().hex if nonce is None else nonce
+    return {
+        'HTTP_X_MTT_KEY': api_key.api_key,
+        'HTTP_X_MTT_TIMESTAMP': timestamp,
+        'HTTP_X_MTT_NONCE': nonce,
+        'HTTP_X_MTT_SIGNATURE': authentication.signature(
+            api_key.api_secret.encode(), timestamp, method, path, body, nonce,
+        ),
+    }
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.buckets = LocalBuckets(self.clock)
+
+    def limiter(self, **options):
+        return RateLimiter(self.buckets, clock=self.clock, **options)
+
+    def test_minute_window_refuses_past_its_limit_and_refills(self):
+        limiter = self.limiter(lease_fraction=0)
+        limits = [(5, 60), (1000, 3600)]
+        self.assertTrue(all(limiter.acquire('key', limits).allowed for _ in range(5)))
+        decision = limiter.acquire('key', limits)
+        self.assertFalse(decision.allowed)
+        self.assertEqual((decision.limit, decision.remaining, decision.retry_after), (5, 0, 12))
+
+        self.clock.now += 12
+        self.assertTrue(limiter.acquire('key', limits).allowed)
+
+    def test_hour_window_refuses_when_the_minute_window_has_room(self):
+        limiter = self.limiter(lease_fraction=0)
+        limits = [(100, 60), (3, 3600)]
+        self.assertTrue(all(limiter.acquire('key', limits).allowed for _ in range(3)))
+        decision = limiter.acquire('key', limits)
+        self.assertFalse(decision.allowed)
+        self.assertEqual((decision.limit, decision.retry_after), (3, 1200))
+
+    def test_allowed_decision_reports_the_tighter_window(self):
+        limiter = self.limiter(lease_fraction=0)
+        decision = limiter.acquire('key', [(10, 60), (20, 3600)])
+        self.assertEqual((decision.limit, decision.remaining), (10, 9))
+
+    def test_slow_key_shared_by_many_processes_is_not_refused(self):
+        processes = [self.limiter() for _ in range(8)]
+        limits = [(200, 60), (12000, 3600)]
+        refused = 0
+        for request in range(100):
+            self.clock.now += 1.5  # 40 requests a minute in total
+            refused += not processes[request % 8].acquire('key', limits).allowed
+        self.assertEqual(refused, 0)
+
+    def test_fast_key_is_served_from_leases(self):
+        limiter = self.limiter()
+        limits = [(6000, 60), (100000, 3600)]
+        for _ in range(1000):
+            self.assertTrue(limiter.acquire('key', limits).allowed)
+        self.assertLess(limiter.stats()['round_trips'], 50)
+
+    def test_unlimited_windows_are_not_tracked(self):
+        self.assertIsNone(self.limiter().acquire('key', [(0, 60), (0, 3600)]))
+
+
+class RateLimitResponseTests(TestCase):
+    path = '/api/merchant/list/'
+
+    def setUp(self):
+        self.previous, throttling._limiter = throttling._limiter, RateLimiter(LocalBuckets(), lease_fraction=0)
+        self.api_key = create_api_key(rate_limit_per_minute=2, rate_limit_per_hour=100)
+        self.client = APIClient()
+
+    def tearDown(self):
+        throttling._limiter = self.previous
+
+    def get(self):
+        return self.client.get(self.path, **signed_headers(self.api_key, 'GET', self.path))
+
+    def test_headers_report_the_remaining_requests(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Limit'], '2')
+        self.assertEqual(response['X-RateLimit-Remaining'], '1')
+        self.assertEqual(response['X-RateLimit-Reset'], '30')
+
+    def test_requests_past_the_limit_get_429_with_retry_after(self):
+        self.get()
+        self.get()
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+
+    def test_session_requests_are_not_rate_limited(self):
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-RateLimit-Limit', response)
+
+
+class ApiKeyAuthenticationTests(TestCase):
+    path = '/api/merchant/list/'
+
+    def setUp(self):
+        self.api_key = create_api_key()
+        self.client = APIClient()
+
+    def get(self, headers):
+        return self.client.get(self.path, **headers)
+
+    def test_signed_request_is_authenticated(self):
+        self.assertEqual(self.get(signed_headers(self.api_key, 'GET', self.path)).status_code, 200)
+
+    def test_non_ascii_digit_timestamp_is_rejected(self):
+        headers = signed_headers(self.api_key, 'GET', self.path, timestamp='\u00b2')
+        self.assertEqual(self.get(headers).status_code, 401)
+
+    def test_stale_timestamp_is_rejected(self):
+        headers = signed_headers(self.api_key, 'GET', self.path, timestamp=str(int(time.time()) - 3600))
+        self.assertEqual(self.get(headers).status_code, 401)
+
+    def test_replayed_request_is_rejected(self):
+        headers = signed_headers(self.api_key, 'GET', self.path)
+        self.assertEqual(self.get(headers).status_code, 200)
+        response = self.get(headers)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Request signature has already been used')
+
+    def test_signed_requests_are_refused_without_a_shared_cache(self):
+        with self.settings(API_KEY_AUTH_SETTINGS={'ALLOW_LOCAL_CACHE': False}):
+            response = self.get(signed_headers(self.api_key, 'GET', self.path))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('no shared cache', response.data['detail'])
+
+    def test_unknown_keys_are_not_kept_in_process(self):
+        headers = signed_headers(self.api_key, 'GET', self.path)
+        for n in range(3):
+            self.assertEqual(self.get({**headers, 'HTTP_X_MTT_KEY': f'made-up-{n}'}).status_code, 401)
+        self.assertEqual(authentication.get_cache().stats()['entries'], 0)
+
+    def test_identical_requests_with_distinct_nonces_are_accepted(self):
+        timestamp = str(int(time.time()))
+        for nonce in ('1', '2'):
+            headers = signed_headers(self.api_key, 'GET', self.path, timestamp=timestamp, nonce=nonce)
+            self.assertEqual(self.get(headers).status_code, 200)
+
+
+class ListQueryCountTests(PageQueryCountMixin, TestCase):
+    """Every page is one query, whatever its size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'merchant{n}') for n in range(50)])
+        category = MerchantCategory.objects.create(name='Retail')
+        merchants = Merchant.objects.bulk_create([
+            Merchant(user=user, business_name=f'Shop {n}', category=category, support_email='shop@example.com')
+            for n, user in enumerate(users)
+        ])
+        MerchantGateway.objects.bulk_create([
+            MerchantGateway(merchant=merchant, name='Main', gateway_type='CUSTODIAL', wallet_address=f'0x{n:040x}')
+            for n, merchant in enumerate(merchants)
+        ])
+        MerchantProduct.objects.bulk_create([
+            MerchantProduct(merchant=merchant, name='Item', price_usd=1) for merchant in merchants
+        ])
+        MerchantTransaction.objects.bulk_create([
+            MerchantTransaction(merchant=merchant, transaction_type='PAYMENT', amount_usd=1, amount_mtt=1, net_amount=1)
+            for merchant in merchants
+        ])
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_merchants(self):
+        self.assertPageQueries('/api/merchant/list/')
+
+    def test_gateways(self):
+        self.assertPageQueries('/api/merchant/gateways/')
+
+    def test_products(self):
+        self.assertPageQueries('/api/merchant/products/')
+
+    def test_transactions(self):
+        self.assertPageQueries('/api/merchant/transactions/')
+
+
+class SettlementSubmitTests(TestCase):
+    def setUp(self):
+        merchant = create_api_key().merchant
+        self.gateway = MerchantGateway.objects.create(
+            merchant=merchant, name='Main', gateway_type='CUSTODIAL', wallet_address='0x' + '5' * 40,
+            callback_url='https://shop.example.com/hooks',
+        )
+        self.payout = MerchantTransaction.objects.create(
+            merchant=merchant, gateway=self.gateway, transaction_type='SETTLEMENT', amount_usd=10, amount_mtt=10,
+            net_amount=10, reference_id='merchant-ref-1',
+        )
+
+    def test_submission_keeps_the_merchant_reference(self):
+        summary = settlement.submit()
+        self.assertEqual(summary['completed'], 1)
+        self.payout.refresh_from_db()
+        self.assertEqual(self.payout.status, 'COMPLETED')
+        self.assertEqual(self.payout.reference_id, 'merchant-ref-1')
+        self.assertEqual(len(self.payout.attempt_id), 32)
+        delivery = MerchantWebhookDelivery.objects.get(event_type='settlement.completed')
+        self.assertEqual(delivery.payload['reference_id'], 'merchant-ref-1')
+
+    def test_a_reclaimed_batch_is_not_recorded_by_its_stale_submitter(self):
+        def stale_backend(payouts):
+            # The batch went stale and another submitter claimed and completed it meanwhile
+            MerchantTransaction.objects.filter(pk=self.payout.pk).update(
+                attempt_id='other', status='COMPLETED', transaction_hash='0xother',
+            )
+            return {}
+
+        payment = MerchantTransaction.objects.create(
+            merchant=self.payout.merchant, gateway=self.gateway, transaction_type='PAYMENT', status='COMPLETED',
+            amount_usd=10, amount_mtt=10, net_amount=10, settlement=self.payout,
+        )
+        summary = settlement.submit(backend=stale_backend)
+        self.assertEqual((summary['completed'], summary['failed'], summary['reclaimed']), (0, 0, 1))
+        self.payout.refresh_from_db()
+        payment.refresh_from_db()
+        self.assertEqual((self.payout.status, payment.settlement_id), ('COMPLETED', self.payout.pk))
+        self.assertFalse(MerchantWebhookDelivery.objects.filter(event_type__startswith='settlement.').exists())
+
+
+
+class WebhookRecordTests(TestCase):
+    def setUp(self):
+        merchant = create_api_key().merchant
+        gateway = MerchantGateway.objects.create(
+            merchant=merchant, name='Main', gateway_type='CUSTODIAL', wallet_address='0x' + '5' * 40,
+        )
+        self.delivery = MerchantWebhookDelivery.objects.create(
+            merchant=merchant, gateway=gateway, event_type='payment.completed', payload={},
+            url='https://shop.example.com/hooks',
+        )
+        [self.claimed] = webhooks._claim(10, {}, 8, timezone.now())
+
+    def test_results_are_written_for_the_claiming_attempt(self):
+        self.assertEqual(webhooks._record([(self.claimed, 200, None)], timezone.now()), (1, 0, 0))
+        self.delivery.refresh_from_db()
+        self.assertEqual((self.delivery.status, self.delivery.attempts), ('DELIVERED', 1))
+
+    def test_stale_results_do_not_overwrite_a_reclaimed_delivery(self):
+        # The lease ran out; another dispatcher claimed the delivery and delivered it
+        MerchantWebhookDelivery.objects.filter(pk=self.delivery.pk).update(attempt_id='other')
+        webhooks._record([(dict(self.claimed, attempt_id='other'), 200, None)], timezone.now())
+        self.assertEqual(webhooks._record([(self.claimed, 500, None)], timezone.now()), (0, 0, 0))
+        self.delivery.refresh_from_db()
+        self.assertEqual((self.delivery.status, self.delivery.attempts), ('DELIVERED', 1))
+
+class StubServer:
+    """Local HTTP server answering each request with the next of ``responses``"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while self.responses:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.lower().split(b'\r\n')
+                await reader.readexactly(next(int(line[15:]) for line in lines if line.startswith(b'content-length:')))
+                response = self.responses.pop(0)
+                writer.write(response)
+                await writer.drain()
+                if b'Connection: close' in response:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    def post(self, count, **options):
+        """Statuses of ``count`` POSTs through one HttpPool, and the connections they used"""
+        async def run():
+            server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+            url = f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/hooks'
+            pool = HttpPool(**{'allow_private': True, 'timeout': 5, **options})
+            try:
+                return [await pool.post(url, {}, b'{}') for _ in range(count)], pool.connections
+            finally:
+                pool.close()
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+
+class HttpPoolTests(SimpleTestCase):
+    OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+
+    def test_keep_alive_responses_reuse_the_connection(self):
+        statuses, connections = StubServer([self.OK] * 3).post(3)
+        self.assertEqual((statuses, connections), ([200] * 3, 1))
+
+    def test_chunked_responses_are_read_to_the_end(self):
+        chunked = b'HTTP/1.1 202 Accepted\r\nTransfer-Encoding: chunked\r\n\r\n2\r\nok\r\n3;x=1\r\nyes\r\n0\r\n\r\n'
+        statuses, connections = StubServer([chunked, self.OK]).post(2)
+        self.assertEqual((statuses, connections), ([202, 200], 1))
+
+    def test_connection_close_opens_a_new_connection(self):
+        close = b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 0\r\n\r\n'
+        statuses, connections = StubServer([close, self.OK]).post(2)
+        self.assertEqual((statuses, connections), ([200, 200], 2))
+
+    def test_body_running_to_the_end_of_the_connection_is_not_reused(self):
+        unframed = b'HTTP/1.0 200 OK\r\n\r\n' + b'x' * 100000
+        statuses, connections = StubServer([unframed, self.OK]).post(2, max_body=1024)
+        self.assertEqual((statuses, connections), ([200, 200], 2))
+
+    def test_oversized_bodies_are_not_read_and_close_the_connection(self):
+        large = b'HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n' + b'x' * 100000
+        large_chunk = b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n186a0\r\n' + b'x' * 100000
+        for response in (large, large_chunk):
+            with self.subTest(response=response[:40]):
+                statuses, connections = StubServer([response, self.OK]).post(2, max_body=1024)
+                self.assertEqual((statuses, connections), ([200, 200], 2))
+
+    def test_private_and_loopback_addresses_are_refused(self):
+        pool = HttpPool(allow_private=False)
+        for url in ('http://127.0.0.1:8000/hooks', 'http://10.0.0.5/hooks', 'http://169.254.169.254/',
+                    'http://[::1]/hooks', 'http://localhost/hooks'):
+            with self.subTest(url=url), self.assertRaises(BlockedAddress):
+                asyncio.run(pool.post(url, {}, b'{}'))
+        self.assertEqual(pool.connections, 0)
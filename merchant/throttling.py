@@ -0,0 +1,251 @@
+"""
+Token-bucket rate limits for merchant API keys.
+
+Every API key has two buckets, ``rate_limit_per_minute`` and
+``rate_limit_per_hour``. Each holds up to its limit and refills
+continuously at limit / window, so a key can burst to its limit and then
+sustain the average rate. A limit of 0 leaves that window unlimited.
+Buckets live in Redis when ``RATE_LIMIT_SETTINGS['REDIS_URL']`` is set,
+otherwise in an in-process stand-in with the same semantics (single process
+and tests).
+
+Both buckets are checked and debited by one atomic Lua script using the
+Redis server clock, so the limits hold across every process. To keep the
+cost below one round trip per request, a process that is serving a key
+quickly takes a lease of several tokens in a single call and serves the
+following requests from it for up to ``LEASE_SECONDS``. Leases are sized
+from the rate this process has been serving the key at (doubling while a
+lease runs out early), capped at ``LEASE_FRACTION`` of the tighter limit,
+so a key used slowly from many processes still takes one token per
+request. Leased tokens have already been removed from the shared buckets,
+so leasing can only make a key stop early, never exceed its limits; tokens
+left when a lease expires are dropped. A refusal is remembered the same way, so a key hammering past
+its limit does not cost a round trip per rejected request either.
+
+``ApiKeyRateThrottle`` enforces the limits for requests authenticated by
+``ApiKeyAuthentication``, and ``RateLimitHeadersMiddleware`` adds
+``X-RateLimit-Limit``, ``X-RateLimit-Remaining`` and ``X-RateLimit-Reset``
+for the most constrained window. 429 responses also carry ``Retry-After``.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .authentication import ApiKeyRecord
+
+WINDOWS = (
+    ('rate_limit_per_minute', 60),
+    ('rate_limit_per_hour', 3600),
+)
+
+Decision = namedtuple('Decision', 'allowed limit remaining reset retry_after')
+
+# KEYS: one hash per bucket. ARGV: tokens wanted, then capacity and window per bucket.
+# Grants as many tokens (up to the wanted count) as every bucket can spare and
+# returns the grant followed by each bucket's tokens afterwards.
+TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local wanted = tonumber(ARGV[1])
+local levels = {}
+local grant = wanted
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local window = tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * capacity / window)
+    levels[i] = tokens
+    grant = math.min(grant, math.floor(tokens))
+end
+local result = {tostring(grant)}
+for i, key in ipairs(KEYS) do
+    local tokens = levels[i] - grant
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, tonumber(ARGV[2 * i + 1]) * 2)
+    result[i + 1] = tostring(tokens)
+end
+return result
+"""
+
+
+def _rate_setting(name, default):
+    return getattr(settings, 'RATE_LIMIT_SETTINGS', {}).get(name, default)
+
+
+class LocalBuckets:
+    """In-process stand-in for the Redis buckets"""
+
+    def __init__(self, clock=time.monotonic):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.clock = clock
+
+    def take(self, keys, specs, wanted):
+        now = self.clock()
+        with self._lock:
+            levels = []
+            for key, (capacity, window) in zip(keys, specs):
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                levels.append(min(capacity, tokens + max(0, now - updated) * capacity / window))
+            grant = min([wanted] + [math.floor(tokens) for tokens in levels])
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - grant, now)
+        return grant, [tokens - grant for tokens in levels]
+
+
+class RedisBuckets:
+    """Buckets in Redis, checked and debited by one EVALSHA round trip"""
+
+    def __init__(self, url):
+        import redis
+
+        self._script = redis.Redis.from_url(url).register_script(TAKE_SCRIPT)
+
+    def take(self, keys, specs, wanted):
+        args = [wanted]
+        for capacity, window in specs:
+            args += [capacity, window]
+        result = self._script(keys=keys, args=args)
+        return int(result[0]), [float(tokens) for tokens in result[1:]]
+
+
+class RateLimiter:
+    def __init__(self, buckets, lease_fraction=None, lease_seconds=None, clock=time.monotonic):
+        self.buckets = buckets
+        self.lease_fraction = _rate_setting('LEASE_FRACTION', 0.05) if lease_fraction is None else lease_fraction
+        self.lease_seconds = _rate_setting('LEASE_SECONDS', 1.0) if lease_seconds is None else lease_seconds
+        self.clock = clock
+        # key id -> {'tokens' left, 'expires', bucket 'levels' when leased, 'refused',
+        #            requests 'served' since the round trip 'at'}
+        self._leases = {}
+        self._lock = threading.Lock()
+        self.requests = self.round_trips = self.denied = 0
+
+    def acquire(self, key_id, limits):
+        """
+        Take one token for ``key_id`` given ``limits`` [(capacity, window seconds)];
+        returns a Decision for the most constrained window
+        """
+        limits = [(capacity, window) for capacity, window in limits if capacity]
+        if not limits:
+            return None
+        now = self.clock()
+        with self._lock:
+            self.requests += 1
+            lease = self._leases.get(key_id)
+            if lease:
+                lease['served'] += 1
+                if lease['expires'] > now:
+                    if lease['refused']:
+                        # Recently refused; the buckets cannot have refilled yet
+                        self.denied += 1
+                        return self._decide(False, limits, lease['levels'], 0)
+                    if lease['tokens'] > 0:
+                        lease['tokens'] -= 1
+                        return self._decide(True, limits, lease['levels'], lease['tokens'])
+            wanted = self._lease_size(lease, limits, now)
+
+        keys = [f'ratelimit:{{{key_id}}}:{window}' for _, window in limits]
+        granted, levels = self.buckets.take(keys, limits, wanted)
+        with self._lock:
+            self.round_trips += 1
+            lease = {'levels': levels, 'refused': not granted, 'served': 0, 'at': now}
+            if not granted:
+                self.denied += 1
+                decision = self._decide(False, limits, levels, 0)
+                if self.lease_fraction:
+                    expires = now + min(decision.retry_after, self.lease_seconds)
+                    self._leases[key_id] = dict(lease, tokens=0, expires=expires)
+                return decision
+            self._leases[key_id] = dict(lease, tokens=granted - 1, expires=now + self.lease_seconds)
+            return self._decide(True, limits, levels, granted - 1)
+
+    def _lease_size(self, lease, limits, now):
+        """Tokens to take for the next ``LEASE_SECONDS`` of this process's requests"""
+        cap = int(min(capacity for capacity, _ in limits) * self.lease_fraction)
+        if lease is None or cap <= 1:
+            return 1
+        elapsed = now - lease['at']
+        if elapsed < self.lease_seconds:
+            # The last lease ran out before expiring
+            return min(cap, lease['served'] * 2)
+        return max(1, min(cap, int(lease['served'] * self.lease_seconds / elapsed)))
+
+    def _decide(self, allowed, limits, levels, leased):
+        # Report the window that runs out first
+        decisions = []
+        for (capacity, window), tokens in zip(limits, levels):
+            rate = capacity / window
+            decisions.append(Decision(
+                allowed=allowed,
+                limit=capacity,
+                remaining=max(0, math.floor(tokens)) + leased,
+                reset=math.ceil((capacity - tokens) / rate),
+                retry_after=0 if tokens >= 1 else math.ceil((1 - tokens) / rate),
+            ))
+        if allowed:
+            return min(decisions, key=lambda decision: decision.remaining)
+        return max(decisions, key=lambda decision: decision.retry_after)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'round_trips': self.round_trips,
+                'round_trips_per_request': round(self.round_trips / self.requests, 4) if self.requests else None,
+                'denied': self.denied,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            url = _rate_setting('REDIS_URL', '')
+            _limiter = RateLimiter(RedisBuckets(url) if url else LocalBuckets())
+        return _limiter
+
+
+class ApiKeyRateThrottle(BaseThrottle):
+    """Enforces the authenticating MerchantApiKey's per-minute and per-hour limits"""
+
+    def allow_request(self, request, view):
+        record = request.auth
+        if not isinstance(record, ApiKeyRecord):
+            return True
+        self.decision = get_limiter().acquire(
+            record.id, [(getattr(record, field), window) for field, window in WINDOWS]
+        )
+        if self.decision is None:
+            return True
+        request._request.rate_limit = self.decision
+        return self.decision.allowed
+
+    def wait(self):
+        return self.decision.retry_after
+
+
+class RateLimitHeadersMiddleware:
+    """Adds X-RateLimit-* headers to responses of rate-limited requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        decision = getattr(request, 'rate_limit', None)
+        if decision is not None:
+            response['X-RateLimit-Limit'] = str(decision.limit)
+            response['X-RateLimit-Remaining'] = str(decision.remaining)
+            response['X-RateLimit-Reset'] = str(decision.reset)
+        return response
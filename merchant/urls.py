@@ -18,4 +18,5 @@ urlpatterns = [
     
     # Merchant Transactions
     path('transactions/', views.merchant_transactions_list, name='merchant_transactions_list'),
+    path('transactions/export/', views.merchant_transactions_export, name='merchant_transactions_export'),
 ] 
\ No newline at end of file
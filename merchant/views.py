@@ -1,7 +1,14 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from mtt_gateway.exports import export_response
+from mtt_gateway.filters import filter_params
+from mtt_gateway.pagination import KeysetPagination
 from .models import Merchant, MerchantGateway, MerchantProduct, MerchantTransaction
+from .serializers import (
+    MerchantGatewaySerializer, MerchantProductSerializer, MerchantSerializer,
+    MerchantTransactionSerializer,
+)
 
 @api_view(['GET'])
 def api_root(request):
@@ -16,6 +23,7 @@ def api_root(request):
             'gateways': '/api/merchant/gateways/',
             'products': '/api/merchant/products/',
             'transactions': '/api/merchant/transactions/',
+            'transactions_export': '/api/merchant/transactions/export/?fmt=csv',
         },
         'description': 'Business accounts, payment gateways, and product management'
     })
@@ -23,94 +31,72 @@ def api_root(request):
 @api_view(['GET'])
 def merchants_list(request):
     """
-    List all merchants
+    List all merchants (?status=<status>)
     """
-    merchants = Merchant.objects.all()[:10]
-    data = []
-    for merchant in merchants:
-        data.append({
-            'id': merchant.id,
-            'merchant_id': str(merchant.merchant_id),
-            'business_name': merchant.business_name,
-            'contact_email': merchant.contact_email,
-            'phone_number': merchant.phone_number,
-            'verification_status': merchant.verification_status,
-            'is_active': merchant.is_active,
-            'created_at': merchant.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    merchants = Merchant.objects.select_related('category').only(
+        'id', 'business_name', 'category__name', 'support_email', 'support_phone', 'country',
+        'status', 'verification_level', 'is_verified', 'created_at',
+    )
+    merchants = filter_params(merchants, request, ('status',))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(merchants, request)
+    return paginator.get_paginated_response(MerchantSerializer(page, many=True).data)
 
 @api_view(['GET'])
 def merchant_gateways_list(request):
     """
-    List merchant gateways
+    List merchant gateways (?merchant=<id>)
     """
-    gateways = MerchantGateway.objects.all()[:10]
-    data = []
-    for gateway in gateways:
-        data.append({
-            'id': gateway.id,
-            'gateway_id': str(gateway.gateway_id),
-            'merchant_id': str(gateway.merchant.merchant_id) if gateway.merchant else None,
-            'gateway_name': gateway.gateway_name,
-            'gateway_type': gateway.gateway_type,
-            'is_active': gateway.is_active,
-            'created_at': gateway.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    gateways = MerchantGateway.objects.select_related('merchant').only(
+        'id', 'merchant__business_name', 'name', 'gateway_type', 'wallet_address',
+        'status', 'is_primary', 'created_at',
+    )
+    gateways = filter_params(gateways, request, ('merchant',))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(gateways, request)
+    return paginator.get_paginated_response(MerchantGatewaySerializer(page, many=True).data)
 
 @api_view(['GET'])
 def merchant_products_list(request):
     """
-    List merchant products
+    List merchant products (?merchant=<id>)
     """
-    products = MerchantProduct.objects.all()[:10]
-    data = []
-    for product in products:
-        data.append({
-            'id': product.id,
-            'product_id': str(product.product_id),
-            'merchant_id': str(product.merchant.merchant_id) if product.merchant else None,
-            'name': product.name,
-            'description': product.description,
-            'price': str(product.price),
-            'currency': product.currency,
-            'is_active': product.is_active
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    products = MerchantProduct.objects.only(*MerchantProductSerializer.Meta.fields)
+    products = filter_params(products, request, ('merchant',))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(products, request)
+    return paginator.get_paginated_response(MerchantProductSerializer(page, many=True).data)
 
 @api_view(['GET'])
 def merchant_transactions_list(request):
     """
-    List merchant transactions
+    List merchant transactions, newest first, with cursor pagination
+    (?merchant=<id>|status=<status>&cursor=<next cursor>)
     """
-    transactions = MerchantTransaction.objects.all()[:10]
-    data = []
-    for tx in transactions:
-        data.append({
-            'id': tx.id,
-            'transaction_id': str(tx.transaction_id),
-            'merchant_id': str(tx.merchant.merchant_id) if tx.merchant else None,
-            'amount': str(tx.amount),
-            'currency': tx.currency,
-            'status': tx.status,
-            'transaction_type': tx.transaction_type,
-            'created_at': tx.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    transactions = MerchantTransaction.objects.only(*MerchantTransactionSerializer.Meta.fields)
+    transactions = filter_params(transactions, request, ('merchant', 'status'))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(transactions, request)
+    return paginator.get_paginated_response(MerchantTransactionSerializer(page, many=True).data)
+
+@api_view(['GET'])
+def merchant_transactions_export(request):
+    """
+    Stream merchant transactions as CSV or NDJSON for statements
+    (?merchant=<id>&status=<status>&start=<iso>&end=<iso>&fmt=csv|ndjson&gzip=1).
+    Staff export any merchant; merchants only their own.
+    """
+    transactions = MerchantTransaction.objects.all()
+    if not request.user.is_staff:
+        transactions = transactions.filter(merchant__user=request.user)
+    transactions = filter_params(transactions, request, ('merchant', 'status'))
+
+    return export_response(request, transactions, [
+        'id', 'created_at', 'merchant_id', 'gateway_id', 'product_id', 'transaction_type',
+        'status', 'amount_usd', 'amount_mtt', 'fee_amount', 'net_amount', 'transaction_hash',
+        'customer_email', 'customer_reference', 'reference_id', 'completed_at',
+    ], 'merchant-transactions')
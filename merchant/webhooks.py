@@ -0,0 +1,456 @@
+"""
+Merchant webhook delivery.
+
+Events are never posted from the request that causes them. ``enqueue_*``
+writes MerchantWebhookDelivery rows (the outbox) in the caller's
+transaction, so a callback exists exactly when the change it reports
+commits, and the ``dispatch_webhooks`` command delivers them.
+
+The dispatcher is a single asyncio loop. It claims due deliveries in
+batches with one conditional UPDATE that stamps an attempt id and leases
+the rows for ``LEASE_SECONDS``, so several dispatchers can share the
+outbox and a crashed one's deliveries are picked up again. It posts them
+over pooled keep-alive HTTP/1.1 connections (``CONNECTIONS_PER_HOST`` per
+callback origin), with at most ``MAX_IN_FLIGHT`` requests in flight and
+``MAX_PER_MERCHANT`` per merchant, so one slow endpoint cannot take the
+capacity of the others. Results are written back a batch at a time, and
+only to deliveries still leased under the attempt that sent them.
+
+Callback hosts are resolved by the dispatcher and connected to by
+address; hosts that resolve to anything but public addresses (loopback,
+private, link-local, reserved) are refused, unless
+``ALLOW_PRIVATE_ADDRESSES`` is set (for local testing). Response bodies are
+not needed and are read only up to ``MAX_RESPONSE_BYTES``; a connection
+whose response is larger is closed instead of drained.
+
+A 2xx response marks the delivery DELIVERED. Anything else is retried
+after ``RETRY_BASE_SECONDS`` doubling per attempt (with jitter, capped at
+``RETRY_MAX_SECONDS``) until ``MAX_ATTEMPTS``, then marked FAILED.
+
+Every request carries
+
+    X-MTT-Event:      event type, e.g. transaction.completed
+    X-MTT-Delivery:   delivery id; the same across retries
+    X-MTT-Timestamp:  unix seconds
+    X-MTT-Signature:  hex HMAC-SHA256(gateway webhook_secret, "{timestamp}.{body}")
+
+The signature is omitted when the gateway has no ``webhook_secret``.
+"""
+import asyncio
+import bisect
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import socket
+import ssl
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MerchantTransaction, MerchantWebhookDelivery
+from .serializers import MerchantTransactionSerializer
+
+logger = logging.getLogger('mtt_gateway')
+
+USER_AGENT = 'MTT-Webhooks/1.0'
+
+MAX_HEADERS = 100
+
+
+class BlockedAddress(ValueError):
+    """The callback host resolves to an address webhooks may not be sent to"""
+
+
+def _webhook_setting(name, default):
+    return getattr(settings, 'WEBHOOK_SETTINGS', {}).get(name, default)
+
+
+def signature(secret, timestamp, body):
+    """Hex HMAC-SHA256 of "{timestamp}.{body}"; ``body`` is bytes"""
+    return hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+
+
+def enqueue_transactions(transaction_ids, event_type):
+    """
+    Queue ``event_type`` for each of the transactions whose gateway has a
+    callback URL, in the current transaction; returns the number queued
+    """
+    rows = MerchantTransaction.objects.filter(pk__in=list(transaction_ids)).exclude(
+        Q(gateway__callback_url__isnull=True) | Q(gateway__callback_url=''),
+    ).values('gateway_id', 'gateway__callback_url', *MerchantTransactionSerializer.Meta.fields)
+    deliveries = []
+    for row in rows:
+        gateway_id, url = row.pop('gateway_id'), row.pop('gateway__callback_url')
+        deliveries.append(MerchantWebhookDelivery(
+            merchant_id=row['merchant_id'], gateway_id=gateway_id, event_type=event_type, payload=row, url=url,
+        ))
+    MerchantWebhookDelivery.objects.bulk_create(deliveries)
+    return len(deliveries)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are bucket upper bounds"""
+
+    BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.BOUNDS_MS[index] if index < len(self.BOUNDS_MS) else float('inf')
+
+    def snapshot(self):
+        labels = [f'<={bound}ms' for bound in self.BOUNDS_MS] + [f'>{self.BOUNDS_MS[-1]}ms']
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 2) if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+async def _read_response(reader, max_body):
+    """
+    (status, reusable) after reading one response. The body is consumed so
+    the connection can be reused, unless it is larger than ``max_body``
+    bytes, in which case reading stops and the connection is not reusable.
+    """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError('Connection closed before a response')
+    version, status = line.split(None, 2)[:2]
+    status = int(status)
+    headers = {}
+    for _ in range(MAX_HEADERS + 1):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    else:
+        raise ValueError(f'More than {MAX_HEADERS} response headers')
+
+    reusable = version == b'HTTP/1.1' and headers.get('connection') != 'close'
+    if headers.get('transfer-encoding') == 'chunked':
+        remaining = max_body
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                break
+            remaining -= size
+            if remaining < 0:
+                return status, False
+            await reader.readexactly(size + 2)
+        for _ in range(MAX_HEADERS + 1):
+            if (await reader.readline()) in (b'\r\n', b'\n', b''):
+                break  # end of the trailers
+        else:
+            return status, False
+    elif 'content-length' in headers:
+        length = int(headers['content-length'])
+        if length > max_body:
+            return status, False
+        await reader.readexactly(length)
+    elif status not in (204, 304) and status >= 200:
+        await reader.read(max_body)  # body runs to the end of the connection, which is not reused
+        reusable = False
+    return status, reusable
+
+
+class HttpPool:
+    """Minimal asyncio HTTP/1.1 client that keeps connections alive per origin"""
+
+    def __init__(self, per_host=None, timeout=None, max_body=None, allow_private=None):
+        self.per_host = per_host or _webhook_setting('CONNECTIONS_PER_HOST', 32)
+        self.timeout = timeout or _webhook_setting('TIMEOUT_SECONDS', 10)
+        self.max_body = max_body or _webhook_setting('MAX_RESPONSE_BYTES', 65536)
+        if allow_private is None:
+            allow_private = _webhook_setting('ALLOW_PRIVATE_ADDRESSES', False)
+        self.allow_private = allow_private
+        self._idle = defaultdict(list)
+        self._slots = {}
+        self._ssl = None
+        self.connections = self.requests = 0
+        self.latency = LatencyHistogram()  # time on the wire, not waiting for a connection slot
+
+    async def _resolve(self, host, port):
+        """A public address for ``host``; raises BlockedAddress if it has any other kind"""
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = [info[4][0] for info in infos]
+        if not self.allow_private:
+            for address in addresses:
+                # Scoped IPv6 addresses carry a %zone suffix
+                if not ipaddress.ip_address(address.split('%')[0]).is_global:
+                    raise BlockedAddress(f'{host} resolves to non-public address {address}')
+        return addresses[0]
+
+    async def _connect(self, scheme, host, port):
+        if scheme == 'https' and self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        # Connecting to the checked address keeps a second lookup from pointing elsewhere
+        address = await self._resolve(host, port)
+        self.connections += 1
+        if scheme == 'https':
+            return await asyncio.open_connection(address, port, ssl=self._ssl, server_hostname=host)
+        return await asyncio.open_connection(address, port)
+
+    async def post(self, url, headers, body):
+        """POST ``body`` (bytes) to ``url``; returns the response status"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'Unsupported callback URL {url!r}')
+        origin = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        head = [f'POST {path} HTTP/1.1', f'Host: {parts.netloc}', f'Content-Length: {len(body)}']
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        request = ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+        slots = self._slots.setdefault(origin, asyncio.Semaphore(self.per_host))
+        async with slots:
+            self.requests += 1
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(self._send(origin, request), self.timeout)
+            finally:
+                self.latency.observe(time.perf_counter() - started)
+
+    async def _send(self, origin, request):
+        idle = self._idle[origin]
+        while idle:
+            # An idle connection may have been closed by the server in the meantime
+            reader, writer = idle.pop()
+            try:
+                return await self._exchange(origin, reader, writer, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                continue
+        reader, writer = await self._connect(*origin)
+        return await self._exchange(origin, reader, writer, request)
+
+    async def _exchange(self, origin, reader, writer, request):
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, reusable = await _read_response(reader, self.max_body)
+        except BaseException:
+            writer.close()
+            raise
+        if reusable:
+            self._idle[origin].append((reader, writer))
+        else:
+            writer.close()
+        return status
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+def _claim(limit, busy, max_per_merchant, now):
+    """
+    Claim up to ``limit`` due deliveries, keeping every merchant within
+    ``max_per_merchant`` given ``busy`` (merchant id -> deliveries in flight)
+    """
+    due = MerchantWebhookDelivery.objects.filter(
+        status__in=['PENDING', 'DELIVERING'], next_attempt_at__lte=now,
+    )
+    picked, counts = [], defaultdict(int, busy)
+    for pk, merchant_id in due.order_by('next_attempt_at').values_list('pk', 'merchant_id')[:limit * 4]:
+        if counts[merchant_id] < max_per_merchant:
+            counts[merchant_id] += 1
+            picked.append(pk)
+            if len(picked) == limit:
+                break
+    if not picked:
+        return []
+    attempt = uuid.uuid4().hex
+    due.filter(pk__in=picked).update(
+        status='DELIVERING', attempt_id=attempt,
+        next_attempt_at=now + timedelta(seconds=_webhook_setting('LEASE_SECONDS', 120)),
+    )
+    return list(MerchantWebhookDelivery.objects.filter(attempt_id=attempt, status='DELIVERING').values(
+        'id', 'attempt_id', 'merchant_id', 'event_type', 'payload', 'url', 'attempts', 'created_at',
+        'gateway__webhook_secret',
+    ))
+
+
+def _retry_delay(attempts):
+    delay = min(_webhook_setting('RETRY_BASE_SECONDS', 10) * 2 ** (attempts - 1),
+                _webhook_setting('RETRY_MAX_SECONDS', 3600))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _record(results, now):
+    """
+    Write back [(delivery, response status or None, error)] for the deliveries
+    still leased under the attempt that sent them (a dispatcher that outlived
+    its lease must not overwrite a re-claimed delivery); returns (delivered,
+    retried, failed)
+    """
+    with transaction.atomic():
+        held = set(MerchantWebhookDelivery.objects.select_for_update().filter(
+            pk__in=[delivery['id'] for delivery, _, _ in results], status='DELIVERING',
+        ).values_list('pk', 'attempt_id'))
+        return _write_results([
+            (delivery, status, error) for delivery, status, error in results
+            if (delivery['id'], delivery['attempt_id']) in held
+        ], now)
+
+
+def _write_results(results, now):
+    delivered = defaultdict(list)
+    retries = []
+    max_attempts = _webhook_setting('MAX_ATTEMPTS', 12)
+    for delivery, status, error in results:
+        if status is not None and 200 <= status < 300:
+            delivered[status].append(delivery['id'])
+            continue
+        attempts = delivery['attempts'] + 1
+        retries.append(MerchantWebhookDelivery(
+            id=delivery['id'],
+            status='FAILED' if attempts >= max_attempts else 'PENDING',
+            attempts=attempts,
+            next_attempt_at=now + timedelta(seconds=_retry_delay(attempts)),
+            response_status=status,
+            error_message=error or f'HTTP {status}',
+        ))
+    for status, ids in delivered.items():
+        MerchantWebhookDelivery.objects.filter(pk__in=ids).update(
+            status='DELIVERED', attempts=F('attempts') + 1, response_status=status, error_message='', delivered_at=now,
+        )
+    MerchantWebhookDelivery.objects.bulk_update(
+        retries, ['status', 'attempts', 'next_attempt_at', 'response_status', 'error_message'],
+    )
+    failed = sum(1 for delivery in retries if delivery.status == 'FAILED')
+    return sum(len(ids) for ids in delivered.values()), len(retries) - failed, failed
+
+
+class Dispatcher:
+    def __init__(self, pool=None, max_in_flight=None, max_per_merchant=None, batch_size=None, poll_seconds=None):
+        self.pool = pool or HttpPool()
+        self.max_in_flight = max_in_flight or _webhook_setting('MAX_IN_FLIGHT', 1000)
+        self.max_per_merchant = max_per_merchant or _webhook_setting('MAX_PER_MERCHANT', 8)
+        self.batch_size = batch_size or _webhook_setting('CLAIM_BATCH_SIZE', 500)
+        self.poll_seconds = poll_seconds or _webhook_setting('POLL_SECONDS', 1.0)
+        self.delivery_latency = LatencyHistogram()  # queued -> delivered
+        self.delivered = self.retried = self.failed = 0
+        self._busy = defaultdict(int)
+        self._results = []
+
+    async def _deliver(self, delivery):
+        body = json.dumps({
+            'id': str(delivery['id']),
+            'event': delivery['event_type'],
+            'created_at': delivery['created_at'],
+            'data': delivery['payload'],
+        }, cls=DjangoJSONEncoder).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': USER_AGENT,
+            'X-MTT-Event': delivery['event_type'],
+            'X-MTT-Delivery': str(delivery['id']),
+            'X-MTT-Timestamp': timestamp,
+        }
+        if delivery['gateway__webhook_secret']:
+            headers['X-MTT-Signature'] = signature(delivery['gateway__webhook_secret'], timestamp, body)
+
+        status = error = None
+        try:
+            status = await self.pool.post(delivery['url'], headers, body)
+        except asyncio.TimeoutError:
+            error = 'Timed out'
+        except (OSError, ValueError, asyncio.IncompleteReadError) as exc:
+            error = f'{type(exc).__name__}: {exc}'
+        finally:
+            self._busy[delivery['merchant_id']] -= 1
+        if status is not None and 200 <= status < 300:
+            self.delivery_latency.observe((timezone.now() - delivery['created_at']).total_seconds())
+        self._results.append((delivery, status, error))
+
+    async def _flush(self):
+        results, self._results = self._results, []
+        if results:
+            delivered, retried, failed = await sync_to_async(_record)(results, timezone.now())
+            self.delivered += delivered
+            self.retried += retried
+            self.failed += failed
+            if failed:
+                logger.warning('%s merchant webhooks failed permanently after %s attempts',
+                               failed, _webhook_setting('MAX_ATTEMPTS', 12))
+
+    async def run(self, until_idle=False):
+        """Deliver until cancelled, or until nothing is due when ``until_idle``"""
+        claim = sync_to_async(_claim)
+        tasks = set()
+        flushed = time.monotonic()
+        try:
+            while True:
+                free = self.max_in_flight - len(tasks)
+                claimed = None
+                # Claim in batches rather than one free slot at a time
+                if free >= min(self.batch_size, self.max_in_flight) // 2:
+                    claimed = await claim(min(free, self.batch_size), dict(self._busy),
+                                          self.max_per_merchant, timezone.now())
+                for delivery in claimed or ():
+                    self._busy[delivery['merchant_id']] += 1
+                    tasks.add(asyncio.create_task(self._deliver(delivery)))
+                if not tasks:
+                    await self._flush()
+                    if until_idle:
+                        return
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                _, tasks = await asyncio.wait(tasks, timeout=self.poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+                if (len(self._results) >= self.batch_size or claimed == []
+                        or time.monotonic() - flushed >= self.poll_seconds):
+                    await self._flush()
+                    flushed = time.monotonic()
+        finally:
+            # Unfinished deliveries stay leased and are retried once the lease runs out
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush()
+            self.pool.close()
+
+    def stats(self):
+        return {
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'failed': self.failed,
+            'connections': self.pool.connections,
+            'requests': self.pool.requests,
+            'request_latency': self.pool.latency.snapshot(),
+            'delivery_latency': self.delivery_latency.snapshot(),
+        }
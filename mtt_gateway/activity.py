@@ -0,0 +1,138 @@
+"""
+Write-behind "last used" / "last activity" timestamps.
+
+Request paths call ``touch(kind, key)`` instead of saving a timestamp: it
+only records the key in an in-process buffer. A background thread flushes
+the buffer every ``FLUSH_SECONDS`` with one UPDATE per model (per
+``FLUSH_CHUNK_SIZE`` keys), setting every key touched since the previous
+flush to the latest touch time of the batch, so the timestamps are accurate
+to the flush interval and never move backwards. Touches that cannot be
+written are merged back into the buffer and retried on the next flush.
+Only the flush thread writes; touches made in the last interval before the
+process exits are not written, which is acceptable for these timestamps
+and keeps exiting processes (test runs included) away from the database.
+
+Each process flushes its own buffer, so a row touched by several processes
+gets one UPDATE per process per interval rather than one per request.
+"""
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger('mtt_gateway')
+
+# kind -> (model, timestamp field, field the touch key refers to)
+FIELDS = {
+    'api_key': ('merchant.MerchantApiKey', 'last_used', 'pk'),
+    'gateway': ('merchant.MerchantGateway', 'last_used', 'pk'),
+    'merchant': ('merchant.Merchant', 'last_activity', 'pk'),
+    'customer': ('customers.CustomerProfile', 'last_activity', 'user_id'),
+    'wallet': ('wallets.Wallet', 'last_activity', 'pk'),
+    'routing_path': ('maythetoken.RoutingPath', 'last_used', 'pk'),
+}
+
+
+class TouchBuffer:
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+        self._touched = {kind: set() for kind in FIELDS}
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.touches = self.flushes = self.rows = self.failures = 0
+
+    def touch(self, kind, key, at=None):
+        at = at or timezone.now()
+        with self._lock:
+            self._touched[kind].add(key)
+            latest = self._latest.get(kind)
+            if latest is None or at > latest:
+                self._latest[kind] = at
+            self.touches += 1
+
+    def _drain(self):
+        with self._lock:
+            batch = {kind: (keys, self._latest.pop(kind)) for kind, keys in self._touched.items() if keys}
+            for kind in batch:
+                self._touched[kind] = set()
+        return batch
+
+    def flush(self):
+        """Write every pending touch; returns the number of rows updated"""
+        updated = 0
+        for kind, (keys, at) in self._drain().items():
+            label, field, lookup = FIELDS[kind]
+            stale = apps.get_model(label).objects.filter(Q(**{f'{field}__isnull': True}) | Q(**{f'{field}__lt': at}))
+            keys = list(keys)
+            for start in range(0, len(keys), self.chunk_size):
+                chunk = keys[start:start + self.chunk_size]
+                try:
+                    updated += stale.filter(**{f'{lookup}__in': chunk}).update(**{field: at})
+                except Exception:
+                    logger.exception('Could not flush %s %s timestamps; retrying next flush', len(chunk), kind)
+                    self.failures += 1
+                    for key in chunk:
+                        self.touch(kind, key, at)
+        with self._lock:
+            self.flushes += 1
+            self.rows += updated
+        return updated
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': sum(len(keys) for keys in self._touched.values()),
+                'touches': self.touches,
+                'flushes': self.flushes,
+                'rows_updated': self.rows,
+                'failures': self.failures,
+            }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The process buffer; its flush thread starts on first use"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            options = getattr(settings, 'ACTIVITY_SETTINGS', {})
+            _buffer = TouchBuffer(options.get('FLUSH_CHUNK_SIZE', 500))
+            interval = options.get('FLUSH_SECONDS', 5)
+            threading.Thread(target=_flush_loop, args=(_buffer, interval), name='mtt-activity', daemon=True).start()
+        return _buffer
+
+
+def _flush_loop(buffer, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            buffer.flush()
+        finally:
+            connection.close()
+
+
+def touch(kind, key):
+    """Record that ``key`` (see FIELDS) was used just now"""
+    get_buffer().touch(kind, key)
+
+
+class ActivityMiddleware:
+    """Touches the requesting user's CustomerProfile.last_activity"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            touch('customer', user.pk)
+        return response
@@ -0,0 +1,136 @@
+"""
+Cross-process broadcast for cache invalidation.
+
+Publishes small JSON messages over Redis pub/sub when
+``BROADCAST_SETTINGS['REDIS_URL']`` is set; otherwise falls back to an
+in-process stand-in that delivers synchronously to local subscribers, which
+is enough for a single process and for tests.
+
+Subscribers are called with the decoded message, or with ``None`` once
+their channel is (re)subscribed on Redis, to tell them messages may have
+been missed.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger('mtt_gateway')
+
+
+class LocalBroker:
+    """In-process stand-in for Redis pub/sub"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].append(callback)
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers[channel])
+        for callback in callbacks:
+            callback(message)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Redis pub/sub with a background listener thread per process. Messages
+    are also delivered to this process's own subscribers directly, and the
+    listener skips its own echo.
+    """
+
+    POLL_SECONDS = 1.0  # how often the listener picks up newly subscribed channels
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._origin = uuid.uuid4().hex
+        self._pending = set()  # channels not yet subscribed on the live connection
+        self._listener = None
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            if channel not in self._subscribers:
+                self._pending.add(channel)
+            self._subscribers[channel].append(callback)
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name='mtt-broadcast', daemon=True
+                )
+                self._listener.start()
+
+    def publish(self, channel, message):
+        super().publish(channel, message)
+        self._redis.publish(channel, json.dumps({'origin': self._origin, 'message': message}))
+
+    def _listen(self):
+        delay = 1
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                with self._lock:
+                    # A new connection starts with no subscriptions
+                    self._pending = set(self._subscribers)
+                while True:
+                    # Subscriptions only ever change on this thread
+                    with self._lock:
+                        channels, self._pending = self._pending, set()
+                    if channels:
+                        pubsub.subscribe(*channels)
+                        # Anything published before the subscription took effect was missed
+                        self._notify(channels, None)
+                    delay = 1
+                    raw = pubsub.get_message(timeout=self.POLL_SECONDS)
+                    if raw is None:
+                        continue
+                    data = json.loads(raw['data'])
+                    if data['origin'] != self._origin:
+                        self._notify([raw['channel'].decode()], data['message'])
+            except Exception:
+                logger.exception('Broadcast listener lost its Redis connection')
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _notify(self, channels, message):
+        with self._lock:
+            callbacks = [callback for channel in channels for callback in self._subscribers[channel]]
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception('Broadcast subscriber failed')
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            url = getattr(settings, 'BROADCAST_SETTINGS', {}).get('REDIS_URL')
+            _broker = RedisBroker(url) if url else LocalBroker()
+        return _broker
+
+
+def publish(channel, message):
+    try:
+        get_broker().publish(channel, message)
+    except Exception:
+        # Subscribers still converge through their TTLs
+        logger.exception('Failed to broadcast on %s', channel)
+
+
+def subscribe(channel, callback):
+    get_broker().subscribe(channel, callback)
@@ -0,0 +1,40 @@
+"""
+Query-parameter filters for list and export views.
+
+``filter_params(queryset, request, params)`` applies ``?field=value``
+equality filters, first converting each value the way the field (or, for a
+foreign key, the related primary key) would, so ``?user=abc`` or a
+malformed UUID is a 400 instead of a database error.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+
+# Not every backend reports integer ranges to the field validators (SQLite doesn't)
+BIGINT_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def to_field_value(field, value):
+    """``value`` converted for a model field; raises Django's ValidationError if the column cannot hold it"""
+    cleaned = field.to_python(value)
+    field.run_validators(cleaned)
+    if isinstance(cleaned, int) and cleaned not in BIGINT_RANGE:
+        raise DjangoValidationError(f'{value!r} is out of range')
+    return cleaned
+
+
+def clean_value(model, name, value):
+    """``value`` converted for ``model.name``; raises DRF's ValidationError (400) if it cannot be"""
+    field = model._meta.get_field(name)
+    try:
+        return to_field_value(field.target_field if field.is_relation else field, value)
+    except DjangoValidationError:
+        raise ValidationError({name: f'Invalid value {value!r}'})
+
+
+def filter_params(queryset, request, params):
+    """Filter ``queryset`` on each of ``params`` present in the query string"""
+    for param in params:
+        value = request.query_params.get(param)
+        if value:
+            queryset = queryset.filter(**{param: clean_value(queryset.model, param, value)})
+    return queryset
@@ -0,0 +1,178 @@
+"""
+Gas price oracle.
+
+Fee suggestions come from one ``eth_feeHistory`` call over the last
+``SAMPLE_BLOCKS`` blocks: the next block's base fee plus the median, across
+those blocks, of the priority fee paid at each speed's percentile. The
+result is cached per process for ``WINDOW_SECONDS`` (about a block), so
+sends in between cost no RPC round trips for pricing.
+
+``estimate()`` prices a whole batch of pending sends at once. Plain value
+transfers need exactly 21000 gas and are not sent to the node; contract
+calls are de-duplicated by (to, data) and estimated in a single batched
+``eth_estimateGas`` round trip. When the node cannot be reached the
+static ``BLOCKCHAIN_SETTINGS`` GAS_PRICE / GAS_LIMIT are used instead; a
+call the node cannot estimate (it would revert) falls back to GAS_LIMIT on
+its own, without affecting the rest of the batch.
+"""
+import logging
+import statistics
+import threading
+import time
+
+from django.conf import settings
+
+from .rpc import GWEI, RpcError, get_node, to_int
+
+logger = logging.getLogger('mtt_gateway')
+
+TRANSFER_GAS = 21000
+
+SEND_FIELDS = ('from', 'to', 'value', 'data')
+
+# Speed -> priority fee percentile within each sampled block
+SPEEDS = {
+    'slow': 10,
+    'standard': 50,
+    'fast': 90,
+}
+
+
+def _oracle_setting(name, default):
+    return getattr(settings, 'GAS_ORACLE_SETTINGS', {}).get(name, default)
+
+
+def _chain_setting(name, default):
+    return getattr(settings, 'BLOCKCHAIN_SETTINGS', {}).get(name, default)
+
+
+class GasOracle:
+    def __init__(self, node=None, window=None, sample_blocks=None):
+        self._node = node
+        self.window = _oracle_setting('WINDOW_SECONDS', 12) if window is None else window
+        self.sample_blocks = sample_blocks or _oracle_setting('SAMPLE_BLOCKS', 20)
+        self.limit_margin = _oracle_setting('GAS_LIMIT_MARGIN', 1.2)
+        self._suggestions = None
+        self._expires = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.estimate_calls = self.fallbacks = 0
+
+    @property
+    def node(self):
+        # Resolved on first use, so building the oracle needs no RPC client
+        if self._node is None:
+            self._node = get_node()
+        return self._node
+
+    def suggestions(self):
+        """{'base_fee', 'block', speed: {'max_priority_fee', 'max_fee'}} in wei, cached for the window"""
+        now = time.monotonic()
+        with self._lock:
+            if self._suggestions is not None and self._expires > now:
+                self.hits += 1
+                return self._suggestions
+            self.misses += 1
+            # Sampled under the lock so a cold cache costs one round trip, not one per thread
+            try:
+                self._suggestions = self._sample()
+            except (RpcError, OSError):
+                logger.exception('Gas oracle could not sample fee history; using static gas price')
+                self.fallbacks += 1
+                self._suggestions = self._static()
+            self._expires = now + self.window
+            return self._suggestions
+
+    def _sample(self):
+        percentiles = list(SPEEDS.values())
+        history = self.node.call('eth_feeHistory', hex(self.sample_blocks), 'latest', percentiles)
+        base_fee = to_int(history['baseFeePerGas'][-1])  # the block being built next
+        rewards = [[to_int(reward) for reward in block] for block in history['reward']]
+        suggestions = {
+            'base_fee': base_fee,
+            'block': to_int(history['oldestBlock']) + len(rewards),
+        }
+        for index, speed in enumerate(SPEEDS):
+            tip = int(statistics.median(block[index] for block in rewards)) if rewards else GWEI
+            # Headroom for the base fee to rise for a couple of full blocks before inclusion
+            suggestions[speed] = {'max_priority_fee': tip, 'max_fee': 2 * base_fee + tip}
+        return suggestions
+
+    def _static(self):
+        price = _chain_setting('GAS_PRICE', 20) * GWEI
+        suggestions = {'base_fee': None, 'block': None}
+        for speed in SPEEDS:
+            suggestions[speed] = {'max_priority_fee': price, 'max_fee': price}
+        return suggestions
+
+    def estimate(self, sends, speed='standard'):
+        """
+        Gas limit and fees for each of ``sends`` (dicts with 'to' and
+        optional 'from', 'value', 'data'), in order
+        """
+        fees = self.suggestions()[speed]
+        calls = {}
+        for send in sends:
+            if send.get('data') not in (None, '', '0x'):
+                calls.setdefault((send.get('to'), send['data']), send)
+
+        limits = {}
+        if calls:
+            self.estimate_calls += 1
+            keys = list(calls)
+            try:
+                results = self.node.batch([
+                    ('eth_estimateGas', [{
+                        field: calls[key][field] for field in SEND_FIELDS if field in calls[key]
+                    }])
+                    for key in keys
+                ], raise_errors=False)
+            except (RpcError, OSError):
+                logger.exception('Batched gas estimation failed; using static gas limit')
+                self.fallbacks += 1
+            else:
+                # A call that would revert only loses its own estimate
+                for key, gas in zip(keys, results):
+                    if isinstance(gas, RpcError):
+                        logger.warning('Gas estimation failed for a call to %s: %s', key[0], gas)
+                        self.fallbacks += 1
+                    else:
+                        limits[key] = int(to_int(gas) * self.limit_margin)
+
+        estimates = []
+        for send in sends:
+            if send.get('data') in (None, '', '0x'):
+                gas_limit = TRANSFER_GAS
+            else:
+                gas_limit = limits.get((send.get('to'), send['data']), _chain_setting('GAS_LIMIT', 100000))
+            estimates.append({
+                'gas_limit': gas_limit,
+                'max_fee_per_gas': fees['max_fee'],
+                'max_priority_fee_per_gas': fees['max_priority_fee'],
+                'max_cost': gas_limit * fees['max_fee'],
+            })
+        return estimates
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'window_seconds': self.window,
+                'sample_blocks': self.sample_blocks,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'estimate_calls': self.estimate_calls,
+                'fallbacks': self.fallbacks,
+            }
+
+
+_oracle = None
+_oracle_lock = threading.Lock()
+
+
+def get_oracle():
+    global _oracle
+    with _oracle_lock:
+        if _oracle is None:
+            _oracle = GasOracle()
+        return _oracle
@@ -0,0 +1,252 @@
+"""
+Custodial key material.
+
+Private keys are stored Fernet-encrypted (``Wallet.private_key_encrypted``,
+``MerchantGateway.encrypted_private_key``). Signing paths borrow the
+plaintext through ``wallet_private_key`` / ``gateway_private_key``:
+
+    with wallet_private_key(wallet) as key:
+        sign(key)
+
+For the wallet categories listed in ``KEYSTORE_SETTINGS['CACHE_CATEGORIES']``
+the decrypted key is kept in a small per-process LRU cache bounded by entry
+count and TTL; every other category decrypts on each use. Plaintext lives in
+a ``bytearray`` that is overwritten with zeros when it leaves the cache (or,
+uncached, when the ``with`` block ends), and callers must not copy it out of
+the block. The immutable ``bytes`` returned by the cryptography library are
+dropped immediately but cannot be scrubbed.
+
+Entries are evicted in every process when a wallet or gateway leaves the
+ACTIVE status or is deleted, and are never served for a ciphertext other
+than the one they were decrypted from, so a rotated key is picked up at once.
+"""
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.db import transaction
+
+from . import activity, broadcast
+
+CHANNEL = 'mtt:keys'
+
+
+def _keystore_setting(name, default):
+    return getattr(settings, 'KEYSTORE_SETTINGS', {}).get(name, default)
+
+
+_fernet = None
+
+
+def encryption_key():
+    """The Fernet key, for worker processes that encrypt without Django settings"""
+    key = _keystore_setting('ENCRYPTION_KEY', '')
+    if not key:
+        # Development fallback; production sets KEYSTORE_ENCRYPTION_KEY
+        key = base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest())
+    return key
+
+
+def _get_fernet():
+    global _fernet
+    if _fernet is None:
+        _fernet = Fernet(encryption_key())
+    return _fernet
+
+
+def encrypt_secret(secret):
+    """Encrypt key material (str or bytes) for storage in a TextField"""
+    if isinstance(secret, str):
+        secret = secret.encode()
+    return _get_fernet().encrypt(bytes(secret)).decode()
+
+
+def _decrypt(ciphertext):
+    return bytearray(_get_fernet().decrypt(ciphertext.encode()))
+
+
+def _zero(buffer):
+    buffer[:] = bytes(len(buffer))
+
+
+class _Entry:
+    __slots__ = ('buffer', 'ciphertext', 'expires', 'leases', 'evicted')
+
+    def __init__(self, buffer, ciphertext, expires):
+        self.buffer = buffer
+        self.ciphertext = ciphertext
+        self.expires = expires
+        self.leases = 0
+        self.evicted = False
+
+
+class KeyCache:
+    """
+    Thread-safe LRU of decrypted keys bounded by size and TTL. An entry
+    evicted while a signer still holds it is zeroed when the last lease
+    is released.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @contextmanager
+    def lease(self, key, ciphertext):
+        entry = self._acquire(key, ciphertext)
+        try:
+            yield entry.buffer
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                if entry.evicted and not entry.leases:
+                    _zero(entry.buffer)
+
+    def _acquire(self, key, ciphertext):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            elif entry is not None and entry.ciphertext != ciphertext:
+                self._drop(key)  # key was rotated
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.leases += 1
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Decrypt outside the lock; a concurrent miss on the same key just
+        # replaces the other entry, which is zeroed once released
+        entry = _Entry(_decrypt(ciphertext), ciphertext, now + self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            entry.leases += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        if not entry.leases:
+            _zero(entry.buffer)
+
+    def evict(self, key=None):
+        with self._lock:
+            keys = list(self._entries) if key is None else [key] if key in self._entries else []
+            for cached in keys:
+                self._drop(cached)
+            self.evictions += len(keys)
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.expires <= now]
+            for key in expired:
+                self._drop(key)
+            self.expirations += len(expired)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process key cache, subscribed to eviction broadcasts on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KeyCache(
+                _keystore_setting('CACHE_MAX_ENTRIES', 256),
+                _keystore_setting('CACHE_TTL_SECONDS', 300),
+            )
+            broadcast.subscribe(CHANNEL, _on_message)
+            threading.Thread(target=_sweep, args=(_cache,), name='mtt-keystore', daemon=True).start()
+        return _cache
+
+
+def _sweep(cache):
+    """Zero expired keys even when nothing asks for them again"""
+    while True:
+        time.sleep(max(min(cache.ttl, 60), 1))
+        cache.purge_expired()
+
+
+@contextmanager
+def _borrow(key, ciphertext, category, status):
+    if not ciphertext:
+        raise ValueError(f'No encrypted key stored for {key[0]} {key[1]}')
+    if status == 'ACTIVE' and category in _keystore_setting('CACHE_CATEGORIES', ('CUSTODIAL',)):
+        with get_cache().lease(key, ciphertext) as buffer:
+            yield buffer
+        return
+    buffer = _decrypt(ciphertext)
+    try:
+        yield buffer
+    finally:
+        _zero(buffer)
+
+
+def wallet_private_key(wallet):
+    """
+    Context manager yielding a wallet's private key as a bytearray. Cached
+    per ``wallet.wallet_type.category``, so select_related('wallet_type').
+    """
+    activity.touch('wallet', wallet.pk)
+    return _borrow(
+        ('wallet', str(wallet.pk)), wallet.private_key_encrypted,
+        wallet.wallet_type.category, wallet.status,
+    )
+
+
+def gateway_private_key(gateway):
+    """Context manager yielding a merchant gateway's private key as a bytearray"""
+    activity.touch('gateway', gateway.pk)
+    return _borrow(
+        ('gateway', str(gateway.pk)), gateway.encrypted_private_key,
+        gateway.gateway_type, gateway.status,
+    )
+
+
+def evict(kind, pk):
+    """Drop a cached key in every process once the current transaction commits"""
+    message = {'kind': kind, 'id': str(pk)}
+    transaction.on_commit(lambda: broadcast.publish(CHANNEL, message))
+
+
+def _on_message(message):
+    if message is None:
+        # Reconnected after an outage; evictions may have been missed
+        _cache.evict()
+    else:
+        _cache.evict((message['kind'], message['id']))
@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination for history endpoints.
+
+Pages are ordered newest first on a timestamp column with the primary key as
+tie-breaker, and the cursor carries the (timestamp, pk) of the last row
+served. Each page is a range scan from that position on the model's
+(..., created_at) index, so deep pages cost the same as the first one,
+unlike PageNumberPagination's OFFSET.
+"""
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+from .filters import to_field_value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Usable from function views:
+
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response([... for row in rows])
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering_field='created_at', page_size=None):
+        self.ordering_field = ordering_field
+        if page_size is not None:
+            self.page_size = page_size
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, position, pk):
+        raw = f'{position.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            position, pk = raw.split('|', 1)
+            parsed = parse_datetime(position)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if parsed is None or not pk:
+            raise NotFound(self.invalid_cursor_message)
+        return parsed, pk
+
+    def clean_pk(self, model, pk):
+        """The cursor's pk converted for ``model``; a pk of the wrong type is an invalid cursor"""
+        try:
+            return to_field_value(model._meta.pk, pk)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        field = self.ordering_field
+        size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position, pk = self.decode_cursor(cursor)
+            pk = self.clean_pk(queryset.model, pk)
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': position}) | Q(**{field: position, 'pk__lt': pk})
+            )
+
+        # One extra row tells us whether another page exists
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:size + 1])
+        self.has_next = len(rows) > size
+        self.page = rows[:size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = self.encode_cursor(
+            getattr(last, self.ordering_field), last.pk
+        )
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': len(data),
+            'next': self.get_next_link(),
+            'results': data
+        })
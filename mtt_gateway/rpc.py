@@ -0,0 +1,392 @@
+"""
+Ethereum JSON-RPC access.
+
+``get_node()`` returns an ``HttpNode`` for ``BLOCKCHAIN_SETTINGS['ETHEREUM_RPC_URL']``,
+or, when the URL is ``local://``, a ``LocalNode``: an in-process stand-in
+chain that answers the same JSON-RPC payloads, for development, tests and
+benchmarks. Both expose ``call(method, *params)`` and ``batch(calls)``, which
+sends many calls in one round trip.
+
+Quantities are hex strings on the wire, as on a real node; use ``to_int``
+and ``to_hex`` at the boundary. The stand-in does not verify signatures:
+its "raw" transactions are the hex-encoded JSON made by ``encode_local_tx``.
+"""
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+LOCAL_URL = 'local://'
+
+GWEI = 10 ** 9
+
+
+class RpcError(Exception):
+    """JSON-RPC error response"""
+
+    def __init__(self, error):
+        self.code = error.get('code')
+        super().__init__(error.get('message', 'RPC error'))
+
+
+def to_int(value):
+    return None if value is None else int(value, 16)
+
+
+def to_hex(value):
+    return hex(value)
+
+
+def _unwrap(response):
+    if 'error' in response:
+        raise RpcError(response['error'])
+    return response['result']
+
+
+class BaseNode:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _send(self, payload):
+        raise NotImplementedError
+
+    def call(self, method, *params):
+        return _unwrap(self._send({
+            'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': list(params),
+        }))
+
+    def batch(self, calls, raise_errors=True):
+        """
+        Results of [(method, params), ...] in order; raises on the first error,
+        or with ``raise_errors=False`` returns each failed call's RpcError in its place
+        """
+        if not calls:
+            return []
+        payload = [
+            {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': list(params)}
+            for method, params in calls
+        ]
+        responses = {response['id']: response for response in self._send(payload)}
+        if raise_errors:
+            return [_unwrap(responses[request['id']]) for request in payload]
+        return [
+            RpcError(response['error']) if 'error' in response else response['result']
+            for response in (responses[request['id']] for request in payload)
+        ]
+
+
+class HttpNode(BaseNode):
+    """A real node over HTTP(S)"""
+
+    def __init__(self, url, timeout=10):
+        super().__init__()
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _send(self, payload):
+        response = self._session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def _hash(*parts):
+    return '0x' + hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def encode_local_tx(tx):
+    """Stand-in raw transaction for LocalChain: {'from', 'nonce', 'to', 'value', ...} as hex JSON"""
+    return '0x' + json.dumps(tx, sort_keys=True).encode().hex()
+
+
+class LocalChain:
+    """
+    Minimal in-memory chain behind LocalNode. Blocks are mined explicitly
+    with ``mine()``; ``reorg()`` replaces the tip to exercise fork handling.
+    Sent transactions wait in a mempool keyed by (sender, nonce) and are only
+    mined once every lower nonce of their sender has been.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.blocks = []
+        self.receipts = {}  # tx hash -> receipt
+        self.mempool = {}  # (sender, nonce) -> tx
+        self.nonces = defaultdict(int)  # sender -> next nonce on chain
+        self._forks = 0
+        self._append([])
+
+    GAS_LIMIT = 30_000_000
+    INITIAL_BASE_FEE = 10 * GWEI
+
+    def _next_base_fee(self):
+        """EIP-1559: the base fee moves up to 1/8 towards keeping blocks half full"""
+        if not self.blocks:
+            return self.INITIAL_BASE_FEE
+        parent = self.blocks[-1]
+        base_fee, gas_used = to_int(parent['baseFeePerGas']), to_int(parent['gasUsed'])
+        target = self.GAS_LIMIT // 2
+        return max(1, base_fee + base_fee * (gas_used - target) // target // 8)
+
+    def _append(self, transactions):
+        number = len(self.blocks)
+        parent = self.blocks[-1]['hash'] if self.blocks else '0x' + '0' * 64
+        block_hash = _hash('block', number, parent, self._forks)
+        base_fee = self._next_base_fee()
+        receipts = []
+        log_index = 0
+        for index, tx in enumerate(transactions):
+            logs = []
+            for log in tx.get('logs', []):
+                logs.append(dict(
+                    log, blockNumber=to_hex(number), blockHash=block_hash, transactionHash=tx['hash'],
+                    transactionIndex=to_hex(index), logIndex=to_hex(log_index),
+                ))
+                log_index += 1
+            receipts.append({
+                'transactionHash': tx['hash'],
+                'transactionIndex': to_hex(index),
+                'blockNumber': to_hex(number),
+                'blockHash': block_hash,
+                'from': tx.get('from'),
+                'to': tx.get('to'),
+                'gasUsed': to_hex(tx.get('gasUsed', 21000)),
+                'effectiveGasPrice': to_hex(base_fee + self._tip(tx, base_fee)),
+                'status': '0x1' if tx.get('success', True) else '0x0',
+                'logs': logs,
+            })
+        self.blocks.append({
+            'number': to_hex(number),
+            'hash': block_hash,
+            'parentHash': parent,
+            'timestamp': to_hex(number * 12),
+            'baseFeePerGas': to_hex(base_fee),
+            'gasLimit': to_hex(self.GAS_LIMIT),
+            'gasUsed': to_hex(sum(tx.get('gasUsed', 21000) for tx in transactions)),
+            'transactions': [
+                {key: value for key, value in tx.items() if key not in ('logs', 'gasUsed', 'success')}
+                for tx in transactions
+            ],
+            'receipts': receipts,
+        })
+        for receipt in receipts:
+            self.receipts[receipt['transactionHash']] = receipt
+        self._count_nonces(transactions)
+
+    @staticmethod
+    def _tip(tx, base_fee):
+        if tx.get('maxPriorityFeePerGas'):
+            tip = to_int(tx['maxPriorityFeePerGas'])
+            if tx.get('maxFeePerGas'):
+                tip = min(tip, to_int(tx['maxFeePerGas']) - base_fee)
+            return max(tip, 0)
+        if tx.get('gasPrice'):
+            return max(to_int(tx['gasPrice']) - base_fee, 0)
+        return 0
+
+    def _count_nonces(self, transactions):
+        for tx in transactions:
+            if tx.get('from') and tx.get('nonce') is not None:
+                sender = tx['from'].lower()
+                self.nonces[sender] = max(self.nonces[sender], to_int(tx['nonce']) + 1)
+
+    def _executable(self):
+        """Pop mempool transactions whose nonces continue their sender's sequence"""
+        ready = []
+        for sender in sorted({sender for sender, _ in self.mempool}):
+            nonce = self.nonces[sender]
+            while (sender, nonce) in self.mempool:
+                ready.append(self.mempool.pop((sender, nonce)))
+                nonce += 1
+        return ready
+
+    def mine(self, transactions=None, count=1):
+        """
+        Mine ``count`` blocks, the first holding ``transactions`` (dicts with
+        at least 'hash'), or the executable part of the mempool if omitted
+        """
+        with self._lock:
+            self._append(self._executable() if transactions is None else list(transactions))
+            for _ in range(count - 1):
+                self._append([])
+            return len(self.blocks) - 1
+
+    def reorg(self, depth):
+        """Drop the last ``depth`` blocks (their transactions return to the mempool) and re-mine empty ones"""
+        with self._lock:
+            self._forks += 1
+            orphaned = self.blocks[-depth:]
+            del self.blocks[-depth:]
+            for block in orphaned:
+                for receipt in block['receipts']:
+                    self.receipts.pop(receipt['transactionHash'], None)
+            self.nonces.clear()
+            for block in self.blocks:
+                self._count_nonces(block['transactions'])
+            for _ in range(depth):
+                self._append([])
+            return [tx for block in orphaned for tx in block['transactions']]
+
+    def _block(self, tag):
+        if tag in ('latest', 'pending', 'safe', 'finalized'):
+            return self.blocks[-1]
+        if tag == 'earliest':
+            return self.blocks[0]
+        number = to_int(tag)
+        return self.blocks[number] if number < len(self.blocks) else None
+
+    # JSON-RPC methods
+
+    def eth_blockNumber(self):
+        return to_hex(len(self.blocks) - 1)
+
+    def eth_getBlockByNumber(self, tag, full=False):
+        block = self._block(tag)
+        if block is None:
+            return None
+        result = {key: value for key, value in block.items() if key != 'receipts'}
+        if not full:
+            result['transactions'] = [tx['hash'] for tx in block['transactions']]
+        return result
+
+    def eth_getBlockReceipts(self, tag):
+        block = self._block(tag)
+        return None if block is None else block['receipts']
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+    def eth_feeHistory(self, block_count, newest, percentiles=()):
+        block_count = block_count if isinstance(block_count, int) else to_int(block_count)
+        last = to_int(self._block(newest)['number'])
+        first = max(0, last - block_count + 1)
+        blocks = self.blocks[first:last + 1]
+        rewards = []
+        for block in blocks:
+            base_fee = to_int(block['baseFeePerGas'])
+            tips = sorted(self._tip(tx, base_fee) for tx in block['transactions'])
+            rewards.append([
+                to_hex(tips[min(len(tips) - 1, int(len(tips) * p / 100))] if tips else 0)
+                for p in percentiles
+            ])
+        next_base_fee = self._next_base_fee() if last == len(self.blocks) - 1 else to_int(
+            self.blocks[last + 1]['baseFeePerGas']
+        )
+        return {
+            'oldestBlock': to_hex(first),
+            'baseFeePerGas': [block['baseFeePerGas'] for block in blocks] + [to_hex(next_base_fee)],
+            'gasUsedRatio': [to_int(block['gasUsed']) / self.GAS_LIMIT for block in blocks],
+            'reward': rewards,
+        }
+
+    def eth_gasPrice(self):
+        return to_hex(self._next_base_fee() + GWEI)
+
+    def eth_estimateGas(self, tx, tag='latest'):
+        data = bytes.fromhex((tx.get('data') or tx.get('input') or '0x')[2:])
+        if not data:
+            return to_hex(21000)
+        # Calldata cost plus a flat stand-in for contract execution
+        return to_hex(21000 + sum(16 if byte else 4 for byte in data) + 30000)
+
+    def eth_getTransactionByHash(self, tx_hash):
+        for tx in self.mempool.values():
+            if tx['hash'] == tx_hash:
+                return dict(tx, blockNumber=None, blockHash=None)
+        receipt = self.receipts.get(tx_hash)
+        if receipt is None:
+            return None
+        block = self.blocks[to_int(receipt['blockNumber'])]
+        tx = next(tx for tx in block['transactions'] if tx['hash'] == tx_hash)
+        return dict(tx, blockNumber=receipt['blockNumber'], blockHash=receipt['blockHash'])
+
+    def eth_getTransactionCount(self, address, tag='latest'):
+        sender = address.lower()
+        nonce = self.nonces[sender]
+        if tag == 'pending':
+            while (sender, nonce) in self.mempool:
+                nonce += 1
+        return to_hex(nonce)
+
+    def eth_sendRawTransaction(self, raw):
+        tx = json.loads(bytes.fromhex(raw[2:]))
+        sender, nonce = tx['from'].lower(), to_int(tx['nonce'])
+        if nonce < self.nonces[sender]:
+            raise ValueError('nonce too low')
+        if (sender, nonce) in self.mempool:
+            raise ValueError('replacement transaction underpriced')
+        tx['hash'] = _hash('tx', raw)
+        self.mempool[(sender, nonce)] = tx
+        return tx['hash']
+
+    def eth_getLogs(self, log_filter):
+        first = to_int(log_filter.get('fromBlock', self.eth_blockNumber()))
+        last = to_int(log_filter.get('toBlock', self.eth_blockNumber()))
+        addresses = log_filter.get('address')
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        topics = log_filter.get('topics', [])
+        logs = []
+        for block in self.blocks[first:last + 1]:
+            for receipt in block['receipts']:
+                for log in receipt['logs']:
+                    if addresses and log['address'] not in addresses:
+                        continue
+                    if any(topic is not None and (i >= len(log['topics']) or log['topics'][i] != topic)
+                           for i, topic in enumerate(topics)):
+                        continue
+                    logs.append(log)
+        return logs
+
+    def handle(self, payload):
+        if isinstance(payload, list):
+            return [self.handle(request) for request in payload]
+        method = getattr(self, payload['method'], None) if payload['method'].startswith('eth_') else None
+        if method is None:
+            return {'jsonrpc': '2.0', 'id': payload['id'],
+                    'error': {'code': -32601, 'message': f"Method {payload['method']} not found"}}
+        with self._lock:
+            try:
+                result = method(*payload.get('params', []))
+            except (IndexError, KeyError, TypeError, ValueError) as exc:
+                return {'jsonrpc': '2.0', 'id': payload['id'], 'error': {'code': -32602, 'message': str(exc)}}
+        return {'jsonrpc': '2.0', 'id': payload['id'], 'result': result}
+
+
+class LocalNode(BaseNode):
+    """
+    JSON-RPC client bound to an in-process LocalChain. ``latency`` (seconds)
+    is slept per request to model the round trip to a real node.
+    """
+
+    def __init__(self, chain=None, latency=0):
+        super().__init__()
+        self.chain = chain or LocalChain()
+        self.latency = latency
+        self.round_trips = 0
+
+    def _send(self, payload):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        # Round-trip through JSON so callers see exactly what a real node sends
+        return json.loads(json.dumps(self.chain.handle(json.loads(json.dumps(payload)))))
+
+
+_node = None
+_node_lock = threading.Lock()
+
+
+def get_node():
+    global _node
+    with _node_lock:
+        if _node is None:
+            url = getattr(settings, 'BLOCKCHAIN_SETTINGS', {}).get('ETHEREUM_RPC_URL', LOCAL_URL)
+            _node = LocalNode() if url == LOCAL_URL else HttpNode(url)
+        return _node
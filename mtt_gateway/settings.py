@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -69,6 +69,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mtt_gateway.activity.ActivityMiddleware',
+    'merchant.throttling.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'mtt_gateway.urls'
@@ -153,11 +155,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django Rest Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'merchant.authentication.ApiKeyAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+        'merchant.authentication.ApiKeyScope',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'merchant.throttling.ApiKeyRateThrottle',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -186,6 +193,17 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Django cache: shared through Redis when CACHE_REDIS_URL is set, otherwise per process
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # Channels Configuration
 CHANNEL_LAYERS = {
     'default': {
@@ -207,10 +225,145 @@ MTT_TOKEN_SETTINGS = {
 
 # Blockchain Configuration
 BLOCKCHAIN_SETTINGS = {
-    'ETHEREUM_RPC_URL': config('ETHEREUM_RPC_URL', default='https://mainnet.infura.io/v3/YOUR_PROJECT_ID'),
+    'ETHEREUM_RPC_URL': config('ETHEREUM_RPC_URL', default='https://mainnet.infura.io/v3/YOUR_PROJECT_ID'),  # local:// for the stand-in node
     'PRIVATE_KEY': config('BLOCKCHAIN_PRIVATE_KEY', default=''),
     'GAS_LIMIT': config('GAS_LIMIT', default=100000, cast=int),
     'GAS_PRICE': config('GAS_PRICE', default=20, cast=int),  # in gwei
+    'REQUIRED_CONFIRMATIONS': config('REQUIRED_CONFIRMATIONS', default=12, cast=int),
+    'CONFIRMATION_BLOCKS_PER_BATCH': 50,  # blocks fetched per batched RPC round trip
+    'CONFIRMATION_RECHECK_SECONDS': 600,  # receipts of every pending hash are looked up again this often
+    'NONCE_STALE_SECONDS': config('NONCE_STALE_SECONDS', default=120, cast=int),  # idle time before reclaiming lost nonces
+}
+
+# Ledger Configuration
+LEDGER_SETTINGS = {
+    'BATCH_SIZE': config('LEDGER_BATCH_SIZE', default=1000, cast=int),  # transfers per commit
+    'SNAPSHOT_INTERVAL': config('LEDGER_SNAPSHOT_INTERVAL', default=1000, cast=int),  # journal entries
+    'SNAPSHOT_SETTLE_SECONDS': config('LEDGER_SNAPSHOT_SETTLE_SECONDS', default=60, cast=int),
+    'DEFAULT_SHARDS': config('LEDGER_DEFAULT_SHARDS', default=16, cast=int),  # for hot gateway balances
+    'SHARD_CONFIG_CACHE_SECONDS': 60,
+    'SHARD_BALANCE_CACHE_SECONDS': 2,
+}
+
+# Price Rollup Configuration
+PRICE_ROLLUP_SETTINGS = {
+    'RAW_RETENTION_DAYS': config('PRICE_RAW_RETENTION_DAYS', default=7, cast=int),
+    'CANDLE_RETENTION_DAYS': {'1m': 30, '5m': 180},  # 1h and 1d candles are kept forever
+    'MAX_CANDLES': 1000,  # per chart request
+}
+
+# Deposit Address Pool Configuration
+ADDRESS_POOL_SETTINGS = {
+    'LOW_WATER_MARK': config('ADDRESS_POOL_LOW_WATER_MARK', default=50, cast=int),  # refill below this
+    'TARGET_SIZE': config('ADDRESS_POOL_TARGET_SIZE', default=200, cast=int),  # unallocated per wallet
+    'BASE_PATH': "m/44'/60'/0'/0",  # path of the xpub stored in Wallet.public_key
+}
+
+# Bulk Wallet Provisioning Configuration
+WALLET_PROVISIONING_SETTINGS = {
+    'CHUNK_SIZE': config('WALLET_PROVISIONING_CHUNK_SIZE', default=1000, cast=int),  # wallets per transaction
+    'WORKERS': config('WALLET_PROVISIONING_WORKERS', default=0, cast=int),  # key derivation processes; 0 = CPU count
+    'POOL_THRESHOLD': 64,  # fewer new keys than this are derived inline
+    'MAX_API_WALLETS': 5000,  # per API request; larger batches go through provision_wallets
+}
+
+# Wallet Backup Verification Configuration
+BACKUP_VERIFY_SETTINGS = {
+    'REVERIFY_DAYS': config('BACKUP_REVERIFY_DAYS', default=7, cast=int),  # incremental runs skip newer checks
+    'CHUNK_SIZE': 500,  # backups per query and per hashing task
+    'WORKERS': config('BACKUP_VERIFY_WORKERS', default=0, cast=int),  # hashing processes; 0 = CPU count
+}
+
+# Gas Oracle Configuration (GAS_PRICE / GAS_LIMIT above are the fallback)
+GAS_ORACLE_SETTINGS = {
+    'WINDOW_SECONDS': config('GAS_ORACLE_WINDOW_SECONDS', default=12, cast=int),  # about one block
+    'SAMPLE_BLOCKS': 20,  # blocks of fee history per sample
+    'GAS_LIMIT_MARGIN': 1.2,  # headroom over eth_estimateGas
+}
+
+# Deposit Scanner Configuration
+DEPOSIT_SCANNER_SETTINGS = {
+    'BLOOM_CAPACITY': config('DEPOSIT_BLOOM_CAPACITY', default=1000000, cast=int),  # addresses before a rebuild
+    'BLOOM_ERROR_RATE': 0.001,  # false positives only cost a database lookup
+    'BLOCKS_PER_BATCH': 20,  # blocks fetched per batched RPC round trip
+}
+
+# Merchant API Key (HMAC) Authentication Configuration
+API_KEY_AUTH_SETTINGS = {
+    'MAX_SKEW_SECONDS': 300,  # accepted clock difference for X-MTT-Timestamp
+    'CACHE_TTL_SECONDS': config('API_KEY_CACHE_TTL_SECONDS', default=60, cast=int),  # per process
+    'SHARED_CACHE_TTL_SECONDS': config('API_KEY_SHARED_CACHE_TTL_SECONDS', default=300, cast=int),  # Django cache
+    'NEGATIVE_TTL_SECONDS': 5,  # unknown keys, shared cache only
+    # Replay protection needs a cache every process shares; without one, signed
+    # requests are refused unless this allows a per-process cache (development)
+    'ALLOW_LOCAL_CACHE': config('API_KEY_ALLOW_LOCAL_CACHE', default=DEBUG, cast=bool),
+}
+
+# Merchant API Key Rate Limiting (in-process only when no Redis URL is set)
+RATE_LIMIT_SETTINGS = {
+    'REDIS_URL': config('RATE_LIMIT_REDIS_URL', default=''),
+    'LEASE_FRACTION': 0.05,  # share of the tighter limit a process takes per Redis round trip
+    'LEASE_SECONDS': 1.0,  # unused leased tokens are dropped after this
+}
+
+# Merchant Settlement Configuration
+SETTLEMENT_SETTINGS = {
+    'CHUNK_SIZE': config('SETTLEMENT_CHUNK_SIZE', default=1000, cast=int),  # gateways per settling transaction
+    'SUBMIT_BATCH_SIZE': config('SETTLEMENT_SUBMIT_BATCH_SIZE', default=500, cast=int),  # payouts per backend call
+    'PAYOUT_BACKEND': config('SETTLEMENT_PAYOUT_BACKEND', default='merchant.settlement.book_payouts'),
+    'RESUBMIT_AFTER_SECONDS': 900,  # payouts left PROCESSING by a crashed run are submitted again
+}
+
+# Merchant Webhook Delivery Configuration
+WEBHOOK_SETTINGS = {
+    'MAX_IN_FLIGHT': config('WEBHOOK_MAX_IN_FLIGHT', default=1000, cast=int),  # concurrent deliveries per dispatcher
+    'MAX_PER_MERCHANT': config('WEBHOOK_MAX_PER_MERCHANT', default=8, cast=int),  # concurrent deliveries per merchant
+    'CONNECTIONS_PER_HOST': 32,  # pooled keep-alive connections per callback origin
+    'TIMEOUT_SECONDS': 10,
+    'MAX_ATTEMPTS': 12,  # then FAILED
+    'RETRY_BASE_SECONDS': 10,  # doubles per attempt, with jitter
+    'RETRY_MAX_SECONDS': 3600,
+    'CLAIM_BATCH_SIZE': 500,  # deliveries claimed and recorded per query
+    'LEASE_SECONDS': 120,  # claimed deliveries of a crashed dispatcher are retried after this
+    'POLL_SECONDS': 1.0,
+    'MAX_RESPONSE_BYTES': 65536,  # larger response bodies are not read; the connection is closed
+    # Lets callbacks reach loopback/private addresses (local testing only)
+    'ALLOW_PRIVATE_ADDRESSES': config('WEBHOOK_ALLOW_PRIVATE_ADDRESSES', default=False, cast=bool),
+}
+
+# Custodial Key Store Configuration
+KEYSTORE_SETTINGS = {
+    'ENCRYPTION_KEY': config('KEYSTORE_ENCRYPTION_KEY', default=''),  # Fernet key; derived from SECRET_KEY if unset
+    'CACHE_CATEGORIES': config('KEYSTORE_CACHE_CATEGORIES', default='CUSTODIAL', cast=Csv()),  # WalletType categories
+    'CACHE_MAX_ENTRIES': config('KEYSTORE_CACHE_MAX_ENTRIES', default=256, cast=int),
+    'CACHE_TTL_SECONDS': config('KEYSTORE_CACHE_TTL_SECONDS', default=300, cast=int),
+}
+
+# Wallet Permission Cache Configuration
+WALLET_PERMISSION_SETTINGS = {
+    'CACHE_TTL_SECONDS': config('WALLET_PERMISSION_CACHE_TTL_SECONDS', default=300, cast=int),  # safety net behind push invalidation
+}
+
+# Price Cache Configuration
+PRICE_CACHE_SETTINGS = {
+    'TTL_SECONDS': config('PRICE_CACHE_TTL_SECONDS', default=30, cast=int),  # safety net behind push invalidation
+    'MAX_ENTRIES': 10000,  # least recently used quotes are dropped past this
+}
+
+# Token price analytics
+ANALYTICS_SETTINGS = {
+    'MAX_POINTS': 100000,  # latest rows per series when the range is open or very long
+}
+
+# Write-behind last_used / last_activity timestamps
+ACTIVITY_SETTINGS = {
+    'FLUSH_SECONDS': config('ACTIVITY_FLUSH_SECONDS', default=5, cast=int),  # one UPDATE per model per flush
+    'FLUSH_CHUNK_SIZE': 500,  # keys per UPDATE
+}
+
+# Cache invalidation broadcast (in-process only when no Redis URL is set)
+BROADCAST_SETTINGS = {
+    'REDIS_URL': config('BROADCAST_REDIS_URL', default=''),
 }
 
 # Payment Gateway Configuration
@@ -0,0 +1,22 @@
+"""Helpers shared by the apps' test suites"""
+from rest_framework.test import APIClient
+
+
+class PageQueryCountMixin:
+    """
+    List endpoint checks for TestCases whose ``setUpTestData`` creates
+    ``cls.staff``, the user requests are made as
+    """
+    page_sizes = (5, 50)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def assertPageQueries(self, path):
+        """Every page of ``path`` is one query, whatever its size"""
+        for size in self.page_sizes:
+            with self.subTest(page_size=size), self.assertNumQueries(1):
+                response = self.client.get(path, {'page_size': size})
+            self.assertEqual(len(response.data['results']), size)
@@ -0,0 +1,275 @@
+import csv
+import gzip
+import io
+import json
+import queue
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from merchant.models import Merchant, MerchantCategory
+from tokens.models import Token, TokenTransfer
+
+from . import exports, keystore
+from .activity import TouchBuffer
+from .broadcast import RedisBroker
+from .gas import TRANSFER_GAS, GasOracle
+from .rpc import LocalNode, RpcError
+
+
+class FakeRedis:
+    """Just enough of redis-py's publish / pubsub for RedisBroker, shared like one server"""
+
+    def __init__(self):
+        self.queues = defaultdict(list)
+
+    def publish(self, channel, data):
+        for messages in self.queues[channel]:
+            messages.put({'channel': channel.encode(), 'data': data})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        for channel in channels:
+            self.server.queues[channel].append(self.messages)
+
+    def get_message(self, timeout=0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class RedisBrokerTests(SimpleTestCase):
+    def setUp(self):
+        server = FakeRedis()
+        self.brokers = []
+        for _ in range(2):
+            broker = RedisBroker('redis://localhost:6379/0')
+            broker._redis = server
+            broker.POLL_SECONDS = 0.01
+            self.brokers.append(broker)
+
+    def test_channels_subscribed_after_the_listener_starts_receive_messages(self):
+        first, second = self.brokers
+        first.subscribe('early', lambda message: None)
+        self.assertTrue(wait_for(lambda: not first._pending))
+
+        received = []
+        first.subscribe('late', received.append)
+        self.assertTrue(wait_for(lambda: not first._pending))
+        second.publish('late', {'key_ids': ['1']})
+        self.assertTrue(wait_for(lambda: {'key_ids': ['1']} in received))
+
+    def test_publisher_delivers_to_its_own_subscribers_once(self):
+        first, _ = self.brokers
+        received = []
+        first.subscribe('own', received.append)
+        self.assertTrue(wait_for(lambda: not first._pending))
+        received.clear()  # the None sent when the channel was subscribed
+
+        first.publish('own', {'user_id': 1})
+        time.sleep(0.05)
+        self.assertEqual(received, [{'user_id': 1}])
+
+    def test_subscribing_tells_callbacks_that_messages_may_have_been_missed(self):
+        first, _ = self.brokers
+        received = []
+        first.subscribe('fresh', received.append)
+        self.assertTrue(wait_for(lambda: received == [None]))
+
+
+class GasOracleTests(SimpleTestCase):
+    def setUp(self):
+        self.node = LocalNode()
+        self.oracle = GasOracle(node=self.node)
+
+    def test_a_failing_estimate_only_falls_back_for_its_own_call(self):
+        sends = [
+            {'to': '0x' + '1' * 40},
+            {'to': '0x' + '2' * 40, 'data': '0x01'},
+            {'to': '0x' + '3' * 40, 'data': '0xnothex'},
+        ]
+        with self.settings(BLOCKCHAIN_SETTINGS={'GAS_LIMIT': 100000}):
+            limits = [estimate['gas_limit'] for estimate in self.oracle.estimate(sends)]
+        self.assertEqual(limits, [TRANSFER_GAS, int(51016 * self.oracle.limit_margin), 100000])
+        self.assertEqual(self.oracle.stats()['fallbacks'], 1)
+
+    def test_batch_returns_errors_in_place_when_asked(self):
+        calls = [('eth_blockNumber', []), ('eth_unknown', [])]
+        results = self.node.batch(calls, raise_errors=False)
+        self.assertEqual(results[0], '0x0')
+        self.assertIsInstance(results[1], RpcError)
+        with self.assertRaises(RpcError):
+            self.node.batch(calls)
+
+
+class TouchBufferTests(TestCase):
+    def setUp(self):
+        category = MerchantCategory.objects.create(name='Retail')
+        users = User.objects.bulk_create([User(username=f'merchant{n}') for n in range(5)])
+        self.merchants = Merchant.objects.bulk_create([
+            Merchant(user=user, business_name='Shop', category=category, support_email='shop@example.com')
+            for user in users
+        ])
+        self.buffer = TouchBuffer(chunk_size=2)
+        self.now = timezone.now()
+
+    def last_activity(self):
+        return list(Merchant.objects.order_by('pk').values_list('last_activity', flat=True))
+
+    def test_repeated_touches_coalesce_to_the_latest_time(self):
+        merchant = self.merchants[0]
+        for seconds in (3, 1, 2):
+            self.buffer.touch('merchant', merchant.pk, self.now + timedelta(seconds=seconds))
+        self.assertEqual(self.buffer.stats()['pending'], 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        merchant.refresh_from_db()
+        self.assertEqual(merchant.last_activity, self.now + timedelta(seconds=3))
+        self.assertEqual(self.buffer.stats()['pending'], 0)
+
+    def test_flush_updates_in_chunks(self):
+        for merchant in self.merchants:
+            self.buffer.touch('merchant', merchant.pk, self.now)
+        with self.assertNumQueries(3):  # 5 keys, 2 per UPDATE
+            self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(self.last_activity(), [self.now] * 5)
+
+    def test_timestamps_never_move_backwards(self):
+        merchant = self.merchants[0]
+        self.buffer.touch('merchant', merchant.pk, self.now)
+        self.buffer.flush()
+        self.buffer.touch('merchant', merchant.pk, self.now - timedelta(minutes=1))
+        self.assertEqual(self.buffer.flush(), 0)
+        merchant.refresh_from_db()
+        self.assertEqual(merchant.last_activity, self.now)
+
+    def test_failed_chunks_are_retried_on_the_next_flush(self):
+        self.buffer.touch('merchant', self.merchants[0].pk, self.now)
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=RuntimeError), \
+                self.assertLogs('mtt_gateway', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual((self.buffer.stats()['pending'], self.buffer.stats()['failures']), (1, 1))
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+class ExportTests(TestCase):
+    path = '/api/tokens/transfers/export/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter')
+        token = Token.objects.create(contract_address='0x' + '0' * 40)
+        cls.now = timezone.now()
+        for days in (3, 2, 1):
+            transfer = TokenTransfer.objects.create(token=token, to_user=cls.user, amount=days, transfer_type='REWARD')
+            TokenTransfer.objects.filter(pk=transfer.pk).update(created_at=cls.now - timedelta(days=days))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        response = self.client.get(self.path, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_streams_rows_oldest_first_within_the_range(self):
+        start = (self.now - timedelta(days=2, hours=1)).isoformat()
+        response, body = self.get(start=start)
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0][:3], ['id', 'created_at', 'token_symbol'])
+        self.assertEqual([Decimal(row[7]) for row in rows[1:]], [2, 1])
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+    def test_ndjson_has_one_object_per_row(self):
+        _, body = self.get(fmt='ndjson')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([(row['to_user_username'], Decimal(row['amount'])) for row in rows],
+                         [('exporter', 3), ('exporter', 2), ('exporter', 1)])
+
+    def test_gzip_output_decompresses_to_the_plain_export(self):
+        _, plain = self.get(fmt='ndjson')
+        with mock.patch.object(exports, 'FLUSH_BYTES', 100):
+            response, body = self.get(fmt='ndjson', gzip='1')
+            chunks = list(exports._chunks(iter([plain.decode()] * 5), compress=True))
+        self.assertEqual(gzip.decompress(body), plain)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="token-transfers.ndjson.gz"')
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(gzip.decompress(b''.join(chunks)), plain * 5)
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'fmt': 'xml'}, {'start': 'yesterday'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.path, params).status_code, 400)
+
+    def test_parse_time_reads_naive_times_as_utc(self):
+        self.assertEqual(exports.parse_time('2026-01-02T03:04:05').utcoffset(), timedelta(0))
+        self.assertIsNone(exports.parse_time(''))
+
+
+class KeyCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = keystore.KeyCache(max_entries=2, ttl=60)
+        self.secrets = {name: keystore.encrypt_secret(f'secret {name}') for name in 'abc'}
+
+    def borrow(self, name, ciphertext=None):
+        """Lease a key and return the buffer it was served from"""
+        with self.cache.lease(name, ciphertext or self.secrets[name]) as buffer:
+            self.assertEqual(bytes(buffer), f'secret {name}'.encode())
+            return buffer
+
+    def test_least_recently_used_entry_is_evicted_and_zeroed(self):
+        a, b = self.borrow('a'), self.borrow('b')
+        self.borrow('a')
+        self.borrow('c')
+        self.assertEqual(bytes(b), bytes(len(b)))
+        self.assertNotEqual(bytes(a), bytes(len(a)))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual((self.cache.stats()['hits'], self.cache.stats()['misses']), (1, 3))
+
+    def test_entry_evicted_while_leased_is_zeroed_on_release(self):
+        with self.cache.lease('a', self.secrets['a']) as buffer:
+            self.cache.evict('a')
+            self.assertEqual(bytes(buffer), b'secret a')
+        self.assertEqual(bytes(buffer), bytes(len(buffer)))
+
+    def test_expired_and_rotated_entries_are_zeroed(self):
+        self.cache.ttl = 0
+        expired = self.borrow('a')
+        self.cache.purge_expired()
+        self.assertEqual(bytes(expired), bytes(len(expired)))
+
+        self.cache.ttl = 60
+        old = self.borrow('b')
+        rotated = keystore.encrypt_secret('secret b')
+        self.assertIsNot(self.borrow('b', rotated), old)
+        self.assertEqual(bytes(old), bytes(len(old)))
+
+    def test_uncached_keys_are_zeroed_after_use(self):
+        with keystore._borrow(('wallet', '1'), self.secrets['a'], 'NON_CUSTODIAL', 'ACTIVE') as buffer:
+            self.assertEqual(bytes(buffer), b'secret a')
+        self.assertEqual(bytes(buffer), bytes(len(buffer)))
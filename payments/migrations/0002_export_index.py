@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['created_at', 'id'], name='payments_tr_created_60b600_idx'),
+        ),
+    ]
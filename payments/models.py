@@ -189,6 +189,7 @@ class PaymentTransaction(models.Model):
     class Meta:
         db_table = 'payments_transaction'
         indexes = [
+            models.Index(fields=['created_at', 'id']),  # ordered exports
             models.Index(fields=['customer', 'created_at']),
             models.Index(fields=['merchant', 'created_at']),
             models.Index(fields=['status', 'created_at']),
@@ -12,6 +12,7 @@ urlpatterns = [
     
     # Payment Transactions
     path('transactions/', views.payment_transactions_list, name='payment_transactions_list'),
+    path('transactions/export/', views.payment_transactions_export, name='payment_transactions_export'),
     
     # Exchange Rates
     path('rates/', views.exchange_rates_list, name='exchange_rates_list'),
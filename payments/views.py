@@ -1,6 +1,10 @@
 from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.db.models import Q
+from mtt_gateway.exports import export_response
+from mtt_gateway.filters import filter_params
+from .models import PaymentTransaction
 
 # Create your views here.
 
@@ -15,6 +19,7 @@ def api_root(request):
         'endpoints': {
             'methods': '/api/payments/methods/',
             'transactions': '/api/payments/transactions/',
+            'transactions_export': '/api/payments/transactions/export/?fmt=csv',
             'exchange_rates': '/api/payments/rates/',
         },
         'description': 'Fiat-to-MTT conversion and payment processing system',
@@ -56,3 +61,24 @@ def exchange_rates_list(request):
         'results': [],
         'note': 'No exchange rates found - database empty'
     })
+
+@api_view(['GET'])
+def payment_transactions_export(request):
+    """
+    Stream payment transactions as CSV or NDJSON for audits
+    (?customer=<id>&merchant=<id>&status=<status>&start=<iso>&end=<iso>&fmt=csv|ndjson&gzip=1).
+    Staff export everything; other users only payments they made or received.
+    """
+    transactions = PaymentTransaction.objects.all()
+    if not request.user.is_staff:
+        transactions = transactions.filter(
+            Q(customer__user=request.user) | Q(merchant__user=request.user)
+        )
+    transactions = filter_params(transactions, request, ('customer', 'merchant', 'status'))
+
+    return export_response(request, transactions, [
+        'id', 'created_at', 'reference_id', 'customer_id', 'merchant_id', 'transaction_type',
+        'status', 'fiat_amount', 'fiat_currency', 'mtt_amount', 'exchange_rate', 'platform_fee',
+        'processing_fee', 'total_fees', 'processor', 'processor_transaction_id', 'processor_fee',
+        'blockchain_transaction_hash', 'completed_at',
+    ], 'payment-transactions')
@@ -0,0 +1,166 @@
+"""
+Vectorized price analytics.
+
+Series are pulled from the database column-wise with ``values_list`` and
+converted to NumPy arrays once; TWAP, VWAP, rolling volatility and drawdown
+are then computed with array operations instead of per-row Python loops.
+A series covers at most the latest ``MAX_POINTS`` rows of its range, so an
+open-ended request cannot load a whole history.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from maythetoken.models import TradeExecution
+
+from .models import TokenPrice
+
+
+def _max_points():
+    return getattr(settings, 'ANALYTICS_SETTINGS', {}).get('MAX_POINTS', 100000)
+
+
+def _latest(queryset, field, limit):
+    """The latest ``limit`` rows of ``queryset`` by ``field``, oldest first"""
+    if limit is None:
+        return list(queryset.order_by(field))
+    return list(queryset.order_by(f'-{field}')[:limit])[::-1]
+
+
+def _columns(rows, width):
+    """Split (datetime, float, ...) rows into an epoch array and a value matrix"""
+    times = np.fromiter((row[0].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), width)
+    return times, values
+
+
+def price_series(token_id, start=None, end=None, limit=None):
+    """(epoch seconds, USD price) arrays for a token's latest ``limit`` ticks, oldest first"""
+    ticks = TokenPrice.objects.filter(token_id=token_id)
+    if start is not None:
+        ticks = ticks.filter(timestamp__gte=start)
+    if end is not None:
+        ticks = ticks.filter(timestamp__lt=end)
+    rows = _latest(ticks.values_list('timestamp', Cast('price_usd', FloatField())), 'timestamp', limit)
+    times, values = _columns(rows, 1)
+    return times, values[:, 0]
+
+
+def execution_series(trading_pair_id, start=None, end=None, limit=None):
+    """(epoch seconds, price, quantity) arrays for a trading pair's latest ``limit`` executions, oldest first"""
+    executions = TradeExecution.objects.filter(trading_pair_id=trading_pair_id)
+    if start is not None:
+        executions = executions.filter(executed_at__gte=start)
+    if end is not None:
+        executions = executions.filter(executed_at__lt=end)
+    rows = _latest(executions.values_list(
+        'executed_at', Cast('price', FloatField()), Cast('quantity', FloatField()),
+    ), 'executed_at', limit)
+    times, values = _columns(rows, 2)
+    return times, values[:, 0], values[:, 1]
+
+
+def twap(times, prices, end=None):
+    """
+    Time-weighted average price, treating each price as held until the next
+    tick (and the last one until ``end``, if given).
+    """
+    if len(prices) == 0:
+        return None
+    if end is None:
+        end = times[-1]
+    durations = np.diff(times, append=end)
+    total = durations.sum()
+    if total <= 0:
+        return float(prices[-1])
+    return float(np.dot(prices, durations) / total)
+
+
+def vwap(prices, volumes):
+    """Volume-weighted average price"""
+    total = volumes.sum() if len(volumes) else 0
+    if total <= 0:
+        return None
+    return float(np.dot(prices, volumes) / total)
+
+
+def rolling_vwap(prices, volumes, window):
+    """VWAP over each trailing window of ``window`` observations"""
+    if len(prices) < window:
+        return np.empty(0)
+    notional = np.cumsum(np.concatenate(([0.0], prices * volumes)))
+    volume = np.cumsum(np.concatenate(([0.0], volumes)))
+    window_volume = volume[window:] - volume[:-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (notional[window:] - notional[:-window]) / window_volume
+
+
+def rolling_volatility(prices, window):
+    """
+    Sample standard deviation of log returns over each trailing window of
+    ``window`` returns, using running sums so the cost is O(n) for any window.
+    """
+    if window < 2 or len(prices) <= window:
+        return np.empty(0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # A non-positive price has no log return; its windows come out NaN
+        returns = np.diff(np.log(prices))
+    s1 = np.cumsum(np.concatenate(([0.0], returns)))
+    s2 = np.cumsum(np.concatenate(([0.0], returns * returns)))
+    window_sum = s1[window:] - s1[:-window]
+    window_sq = s2[window:] - s2[:-window]
+    variance = (window_sq - window_sum * window_sum / window) / (window - 1)
+    return np.sqrt(np.clip(variance, 0.0, None))
+
+
+def drawdown(prices):
+    """Drawdown from the running peak at every point (0 or negative; 0 while the peak is not positive)"""
+    if len(prices) == 0:
+        return np.empty(0)
+    peaks = np.maximum.accumulate(prices)
+    drawdowns = np.zeros_like(prices)
+    np.divide(prices, peaks, out=drawdowns, where=peaks > 0)
+    return np.where(peaks > 0, drawdowns - 1.0, 0.0)
+
+
+def _last_finite(values):
+    """The last finite value as a float, or None"""
+    finite = values[np.isfinite(values)]
+    return float(finite[-1]) if len(finite) else None
+
+
+def price_analytics(token_id, start=None, end=None, window=60):
+    """Summary statistics for a token's price history"""
+    limit = _max_points()
+    times, prices = price_series(token_id, start, end, limit + 1)
+    truncated = len(prices) > limit
+    if truncated:
+        times, prices = times[1:], prices[1:]
+    volatility = rolling_volatility(prices, window)
+    drawdowns = drawdown(prices)
+    return {
+        'points': int(len(prices)),
+        'last_price': float(prices[-1]) if len(prices) else None,
+        'twap': twap(times, prices, end.timestamp() if end is not None else None),
+        'volatility': _last_finite(volatility),
+        'max_drawdown': float(drawdowns.min()) if len(drawdowns) else None,
+        'truncated': truncated,
+    }
+
+
+def execution_analytics(trading_pair_id, start=None, end=None, window=60):
+    """Summary statistics for a trading pair's executions"""
+    limit = _max_points()
+    times, prices, quantities = execution_series(trading_pair_id, start, end, limit + 1)
+    truncated = len(prices) > limit
+    if truncated:
+        times, prices, quantities = times[1:], prices[1:], quantities[1:]
+    rolling = rolling_vwap(prices, quantities, window)
+    return {
+        'executions': int(len(prices)),
+        'vwap': vwap(prices, quantities),
+        'rolling_vwap': _last_finite(rolling),
+        'twap': twap(times, prices, end.timestamp() if end is not None else None),
+        'truncated': truncated,
+    }
@@ -0,0 +1,147 @@
+"""
+OHLCV candle rollups for TokenPrice ticks.
+
+Candles for every interval are maintained incrementally as ticks are saved,
+with conditional UPDATEs so out-of-order ticks still produce the right open
+and close. Chart queries read one candle row per bucket from the
+(token, interval, bucket_start) index instead of scanning raw ticks.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateTimeField, DecimalField, F, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import TokenPrice, TokenPriceCandle
+
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '5m': 5 * 60,
+    '1h': 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+
+def _rollup_setting(name, default):
+    return getattr(settings, 'PRICE_ROLLUP_SETTINGS', {}).get(name, default)
+
+
+def bucket_start(timestamp, interval):
+    """Start of the ``interval`` bucket containing ``timestamp`` (UTC aligned)"""
+    seconds = INTERVAL_SECONDS[interval]
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+def record_tick(token_id, price, timestamp, volume=None):
+    """Fold one price tick into the candle of every interval"""
+    for interval in INTERVAL_SECONDS:
+        start = bucket_start(timestamp, interval)
+        if not _update_candle(token_id, interval, start, price, timestamp, volume):
+            try:
+                with transaction.atomic():
+                    TokenPriceCandle.objects.create(
+                        token_id=token_id, interval=interval, bucket_start=start,
+                        open=price, high=price, low=price, close=price, volume=volume,
+                        tick_count=1, opened_at=timestamp, closed_at=timestamp,
+                    )
+            except IntegrityError:
+                # Another writer opened the bucket first
+                _update_candle(token_id, interval, start, price, timestamp, volume)
+
+
+def _update_candle(token_id, interval, start, price, timestamp, volume):
+    price = Value(price, output_field=DecimalField(max_digits=20, decimal_places=8))
+    volume = Value(volume, output_field=DecimalField(max_digits=40, decimal_places=2))
+    timestamp = Value(timestamp, output_field=DateTimeField())
+    is_first = When(opened_at__gt=timestamp, then=price)
+    is_last = When(closed_at__lte=timestamp, then=price)
+    return TokenPriceCandle.objects.filter(
+        token_id=token_id, interval=interval, bucket_start=start
+    ).update(
+        open=Case(is_first, default=F('open')),
+        high=Greatest(F('high'), price),
+        low=Least(F('low'), price),
+        close=Case(is_last, default=F('close')),
+        volume=Case(When(closed_at__lte=timestamp, then=volume), default=F('volume')),
+        tick_count=F('tick_count') + 1,
+        opened_at=Least(F('opened_at'), timestamp),
+        closed_at=Greatest(F('closed_at'), timestamp),
+    )
+
+
+def rebuild_candles(token_id, start, end, intervals=None):
+    """
+    Recompute candles for [start, end) from raw ticks, replacing whatever is
+    stored. ``start`` and ``end`` should be aligned to the largest interval
+    rebuilt. Used for ticks written with bulk_create and before retention.
+    """
+    intervals = intervals or list(INTERVAL_SECONDS)
+    candles = {interval: {} for interval in intervals}
+    ticks = (
+        TokenPrice.objects.filter(token_id=token_id, timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp')
+        .values_list('price_usd', 'volume_24h', 'timestamp')
+        .iterator(chunk_size=5000)
+    )
+    for price, volume, timestamp in ticks:
+        for interval in intervals:
+            key = bucket_start(timestamp, interval)
+            candle = candles[interval].get(key)
+            if candle is None:
+                candles[interval][key] = TokenPriceCandle(
+                    token_id=token_id, interval=interval, bucket_start=key,
+                    open=price, high=price, low=price, close=price, volume=volume,
+                    tick_count=1, opened_at=timestamp, closed_at=timestamp,
+                )
+                continue
+            candle.high = max(candle.high, price)
+            candle.low = min(candle.low, price)
+            candle.close = price
+            candle.volume = volume
+            candle.closed_at = timestamp
+            candle.tick_count += 1
+
+    with transaction.atomic():
+        TokenPriceCandle.objects.filter(
+            token_id=token_id, interval__in=intervals, bucket_start__gte=start, bucket_start__lt=end
+        ).delete()
+        TokenPriceCandle.objects.bulk_create(
+            [candle for buckets in candles.values() for candle in buckets.values()],
+            batch_size=1000,
+        )
+    return sum(len(buckets) for buckets in candles.values())
+
+
+def apply_retention(now=None):
+    """
+    Downsample old raw ticks: make sure the candles covering them are
+    complete, then delete them. Fine-grained candles are also expired.
+    Deletion always happens in whole UTC days so a bucket is never left
+    half backed by raw ticks.
+    """
+    now = now or timezone.now()
+    raw_days = _rollup_setting('RAW_RETENTION_DAYS', 7)
+    cutoff = bucket_start(now - timedelta(days=raw_days), '1d')
+    summary = {'rebuilt': 0, 'ticks_deleted': 0, 'candles_deleted': 0}
+
+    old_ticks = TokenPrice.objects.filter(timestamp__lt=cutoff)
+    for token_id in list(old_ticks.order_by().values_list('token_id', flat=True).distinct()):
+        oldest = old_ticks.filter(token_id=token_id).order_by('timestamp').values_list(
+            'timestamp', flat=True
+        ).first()
+        summary['rebuilt'] += rebuild_candles(token_id, bucket_start(oldest, '1d'), cutoff)
+
+    while True:
+        ids = list(old_ticks.values_list('pk', flat=True)[:5000])
+        if not ids:
+            break
+        summary['ticks_deleted'] += TokenPrice.objects.filter(pk__in=ids).delete()[0]
+
+    for interval, days in _rollup_setting('CANDLE_RETENTION_DAYS', {}).items():
+        summary['candles_deleted'] += TokenPriceCandle.objects.filter(
+            interval=interval, bucket_start__lt=now - timedelta(days=days)
+        ).delete()[0]
+    return summary
@@ -0,0 +1,118 @@
+"""
+Integer fixed-point amounts.
+
+Amounts are held as Python ints in the token's smallest unit (wei for an
+18-decimal token, cents for a 2-decimal fiat amount) and rates as integer
+parts-per-million, so fee, balance and AMM arithmetic runs on native ints
+instead of ``Decimal``. Convert with ``to_units``/``from_units`` at API and
+model boundaries only.
+
+All divisions round down, in favour of the pool or the platform.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.functional import cached_property
+
+WEI_DECIMALS = 18
+RATE_SCALE = 10 ** 6  # rates are in parts per million; 100% == RATE_SCALE
+PERCENT_SCALE = RATE_SCALE // 100
+
+# Conversions work on the digit tuple rather than Decimal arithmetic, which
+# would round 40-digit amounts to the context's 28 significant digits.
+
+
+def to_units(amount, decimals=WEI_DECIMALS):
+    """Decimal (or str/int) amount -> int of smallest units, truncating extra precision"""
+    if isinstance(amount, int):
+        return amount * 10 ** decimals
+    value = amount if isinstance(amount, Decimal) else Decimal(amount)
+    if not value.is_finite():
+        raise ValueError(f'Cannot convert {value} to units')
+    sign, digits, exponent = value.as_tuple()
+    units = int(''.join(map(str, digits)) or 0)
+    shift = exponent + decimals
+    units = units * 10 ** shift if shift >= 0 else units // 10 ** -shift
+    return -units if sign else units
+
+
+def from_units(units, decimals=WEI_DECIMALS):
+    """int of smallest units -> Decimal with exactly ``decimals`` places"""
+    sign, digits, _ = Decimal(units).as_tuple()
+    return Decimal((sign, digits, -decimals))
+
+
+def token_amount(units, token):
+    """``from_units`` honoring ``Token.decimals``"""
+    return from_units(units, token.decimals)
+
+
+def percent_to_rate(percent):
+    """A percentage as stored on the models (e.g. Decimal('0.3000')) -> ppm"""
+    return int(Decimal(percent) * PERCENT_SCALE)
+
+
+def fee(units, rate, flat=0):
+    """Percentage fee plus a flat fee, both in the amount's units"""
+    return units * rate // RATE_SCALE + flat
+
+
+def swap_out(amount_in, reserve_in, reserve_out, fee_rate):
+    """
+    Constant-product (x * y = k) output for ``amount_in``, with the pool fee
+    (ppm) taken from the input
+    """
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    amount_in_with_fee = amount_in * (RATE_SCALE - fee_rate)
+    return amount_in_with_fee * reserve_out // (reserve_in * RATE_SCALE + amount_in_with_fee)
+
+
+class WeiAmountField(models.DecimalField):
+    """
+    Integer amount in smallest units, stored as NUMERIC(78, 0) so any
+    uint256 fits. Reads back as a Python int.
+    """
+    description = 'Integer token amount in smallest units'
+
+    def __init__(self, *args, **kwargs):
+        kwargs['max_digits'] = 78
+        kwargs['decimal_places'] = 0
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def validators(self):
+        # DecimalField's DecimalValidator expects Decimal values, not ints
+        return [*self.default_validators, *self._validators]
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['max_digits']
+        del kwargs['decimal_places']
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else int(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            value = Decimal(value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+        if value != value.to_integral_value():
+            raise ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+        return int(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        return connection.ops.adapt_decimalfield_value(Decimal(int(value)), self.max_digits, 0)
+
+    def get_db_prep_save(self, value, connection):
+        # DecimalField's version hands the raw value to the backend, which expects a Decimal
+        if hasattr(value, 'as_sql'):
+            return value
+        return self.get_db_prep_value(value, connection)
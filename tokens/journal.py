@@ -0,0 +1,121 @@
+"""
+Append-only balance journal.
+
+Every applied TokenTransfer writes a debit and a credit entry (the external
+side of mints and withdrawals has no user). An account balance is the latest
+BalanceSnapshot plus the sum of the journal tail after it, so historical
+balance queries only read the tail instead of scanning ``tokens_transfer``.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import BalanceJournalEntry, BalanceSnapshot
+
+
+def _journal_setting(name, default):
+    return getattr(settings, 'LEDGER_SETTINGS', {}).get(name, default)
+
+
+def entries_for_transfer(transfer_id, token_id, from_user_id, to_user_id, amount):
+    """Balanced (debit, credit) journal entries for one transfer"""
+    return [
+        BalanceJournalEntry(
+            user_id=from_user_id, token_id=token_id, transfer_id=transfer_id,
+            entry_type='DEBIT', amount=-amount,
+        ),
+        BalanceJournalEntry(
+            user_id=to_user_id, token_id=token_id, transfer_id=transfer_id,
+            entry_type='CREDIT', amount=amount,
+        ),
+    ]
+
+
+def record_transfers(rows):
+    """
+    Append journal entries for (transfer_id, token_id, from_user_id,
+    to_user_id, amount) rows. Must run in the transaction that applies them.
+    """
+    entries = []
+    for row in rows:
+        entries.extend(entries_for_transfer(*row))
+    BalanceJournalEntry.objects.bulk_create(entries, batch_size=_journal_setting('BATCH_SIZE', 1000))
+    return len(entries)
+
+
+def latest_snapshot(user_id, token_id, at=None):
+    snapshots = BalanceSnapshot.objects.filter(user_id=user_id, token_id=token_id)
+    if at is not None:
+        snapshots = snapshots.filter(created_at__lte=at)
+    return snapshots.order_by('-sequence').first()
+
+
+def journal_balance(user_id, token_id, at=None):
+    """
+    Balance of an account from the journal, optionally as of time ``at``.
+    Reads one snapshot and the journal tail after it.
+    """
+    snapshot = latest_snapshot(user_id, token_id, at)
+    tail = BalanceJournalEntry.objects.filter(user_id=user_id, token_id=token_id)
+    if snapshot is not None:
+        tail = tail.filter(sequence__gt=snapshot.sequence)
+    if at is not None:
+        tail = tail.filter(created_at__lte=at)
+    total = tail.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    return (snapshot.balance if snapshot else Decimal('0')) + total
+
+
+def take_snapshots(min_entries=None, settle_seconds=None):
+    """
+    Write a new snapshot for every account whose journal tail has grown by at
+    least ``min_entries``. Entries younger than ``settle_seconds`` are left in
+    the tail because their sequence may still belong to an uncommitted
+    transaction. Returns the number of snapshots written.
+    """
+    min_entries = min_entries or _journal_setting('SNAPSHOT_INTERVAL', 1000)
+    if settle_seconds is None:
+        settle_seconds = _journal_setting('SNAPSHOT_SETTLE_SECONDS', 60)
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+
+    # One grouped pass over the tails, joined to each account's latest snapshot
+    journal, snapshot = BalanceJournalEntry._meta.db_table, BalanceSnapshot._meta.db_table
+    created_at = BalanceJournalEntry._meta.get_field('created_at').get_db_prep_value(cutoff, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT e.user_id, e.token_id, SUM(e.amount), MAX(e.sequence), MAX(s.balance) '
+            f'FROM {journal} e '
+            f'LEFT JOIN (SELECT user_id, token_id, MAX(sequence) AS sequence FROM {snapshot} '
+            f'GROUP BY user_id, token_id) latest ON latest.user_id = e.user_id AND latest.token_id = e.token_id '
+            f'LEFT JOIN {snapshot} s ON s.user_id = latest.user_id AND s.token_id = latest.token_id '
+            f'AND s.sequence = latest.sequence '
+            f'WHERE e.user_id IS NOT NULL AND e.created_at < %s AND e.sequence > COALESCE(latest.sequence, 0) '
+            f'GROUP BY e.user_id, e.token_id HAVING COUNT(*) >= %s',
+            [created_at, min_entries],
+        )
+        rows = cursor.fetchall()
+
+    snapshots = [
+        BalanceSnapshot(
+            user_id=user_id,
+            token_id=token_id,
+            sequence=last,
+            balance=_decimal(BalanceSnapshot, 'balance', previous) + _decimal(BalanceJournalEntry, 'amount', tail),
+        )
+        for user_id, token_id, tail, last, previous in rows
+    ]
+    BalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def _decimal(model, field_name, value):
+    """A raw decimal column value as the ORM would return it"""
+    if value is None:
+        return Decimal('0')
+    column = model._meta.get_field(field_name).get_col(model._meta.db_table)
+    for converter in connection.ops.get_db_converters(column) + column.get_db_converters(connection):
+        value = converter(value, column, connection)
+    return value
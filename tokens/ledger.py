@@ -0,0 +1,227 @@
+"""
+Ledger engine for MTT token balances.
+
+Transfers are applied with conditional F() expression updates instead of
+reading a TokenBalance row into Python and saving it back, so a debit only
+succeeds when ``balance - locked_balance >= amount`` and concurrent transfers
+never overwrite each other's writes. Balance rows are always touched in
+(token, user) order so two transactions can never wait on each other's locks.
+Each applied transfer is also appended to the balance journal in the same
+transaction.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import sharding
+from .fixedpoint import from_units, to_units
+from .journal import record_transfers
+from .models import TokenBalance, TokenTransfer
+
+logger = logging.getLogger('mtt_gateway')
+
+OPEN_STATUSES = ('PENDING', 'PROCESSING')
+
+
+class InsufficientBalance(Exception):
+    """Raised when a debit would take an available balance below zero"""
+
+    def __init__(self, user_id, token_id, amount):
+        self.user_id = user_id
+        self.token_id = token_id
+        self.amount = amount
+        super().__init__(
+            f"Insufficient available balance for user {user_id} "
+            f"(token {token_id}) to debit {amount}"
+        )
+
+
+def get_batch_size():
+    return getattr(settings, 'LEDGER_SETTINGS', {}).get('BATCH_SIZE', 1000)
+
+
+def transfer_deltas(token_id, from_user_id, to_user_id, amount):
+    """
+    Balance changes implied by one transfer, keyed by (token_id, user_id).
+    Transfers without a sender are mints/purchases, transfers without a
+    recipient are burns/withdrawals.
+    """
+    deltas = {}
+    if from_user_id is not None:
+        deltas[(token_id, from_user_id)] = -amount
+    if to_user_id is not None:
+        key = (token_id, to_user_id)
+        deltas[key] = deltas.get(key, 0) + amount
+    return deltas
+
+
+def _ensure_balance_rows(keys):
+    """Create any missing TokenBalance rows for the given (token_id, user_id) keys"""
+    if keys:
+        TokenBalance.objects.bulk_create(
+            [TokenBalance(token_id=token_id, user_id=user_id) for token_id, user_id in keys],
+            ignore_conflicts=True,
+        )
+
+
+def _apply_delta(token_id, user_id, delta, now):
+    """Apply a signed balance change with a single conditional UPDATE"""
+    balances = TokenBalance.objects.filter(token_id=token_id, user_id=user_id)
+    if delta < 0:
+        balances = balances.filter(balance__gte=F('locked_balance') - delta)
+    amount = Value(delta, output_field=DecimalField(max_digits=40, decimal_places=18))
+    updated = balances.update(
+        balance=F('balance') + amount,
+        available_balance=Greatest(
+            F('balance') - F('locked_balance') + amount,
+            Value(Decimal('0'), output_field=DecimalField(max_digits=40, decimal_places=18)),
+        ),
+        last_updated=now,
+    )
+    if not updated:
+        raise InsufficientBalance(user_id, token_id, -delta)
+
+
+def apply_deltas(deltas, now=None):
+    """
+    Apply a {(token_id, user_id): delta} mapping inside the caller's
+    transaction, in deterministic lock order. Credits to sharded accounts
+    land on a random shard instead of the main row.
+    """
+    now = now or timezone.now()
+    shards = sharding.shard_counts(deltas)
+    _ensure_balance_rows([key for key, delta in deltas.items() if delta > 0 and not shards[key]])
+    for key in sorted(deltas):
+        token_id, user_id = key
+        delta = deltas[key]
+        if not delta:
+            continue
+        if delta > 0 and shards[key]:
+            sharding.credit_shard(token_id, user_id, delta, shards[key], now)
+            continue
+        try:
+            _apply_delta(token_id, user_id, delta, now)
+        except InsufficientBalance:
+            if not shards[key]:
+                raise
+            # The funds may still be sitting in unconsolidated shards
+            sharding.consolidate(token_id, user_id)
+            _apply_delta(token_id, user_id, delta, now)
+
+
+def _mark_failed(transfer_ids, reason):
+    return TokenTransfer.objects.filter(pk__in=transfer_ids, status__in=OPEN_STATUSES).update(
+        status='FAILED',
+        notes=reason,
+        updated_at=timezone.now(),
+    )
+
+
+def apply_transfer(transfer):
+    """
+    Apply a single TokenTransfer atomically.
+
+    Returns True if the transfer was applied, False if it had already been
+    applied (or cancelled) by someone else. Raises InsufficientBalance and
+    marks the transfer FAILED if the sender cannot cover the amount.
+    """
+    if transfer.amount <= 0:
+        raise ValueError('Transfer amount must be positive')
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            # Claiming the transfer row first makes the operation idempotent:
+            # a concurrent worker blocks here and then finds nothing to claim.
+            claimed = TokenTransfer.objects.filter(
+                pk=transfer.pk, status__in=OPEN_STATUSES
+            ).update(status='COMPLETED', updated_at=now)
+            if not claimed:
+                return False
+            apply_deltas(
+                transfer_deltas(
+                    transfer.token_id, transfer.from_user_id, transfer.to_user_id, transfer.amount
+                ),
+                now,
+            )
+            record_transfers([
+                (transfer.pk, transfer.token_id, transfer.from_user_id, transfer.to_user_id, transfer.amount)
+            ])
+    except InsufficientBalance as exc:
+        _mark_failed([transfer.pk], str(exc))
+        transfer.status = 'FAILED'
+        raise
+
+    transfer.status = 'COMPLETED'
+    return True
+
+
+def _apply_batch(transfer_ids):
+    """
+    Apply a batch of transfers in the caller's transaction. Balance changes
+    are netted per account so each balance row is updated once per batch.
+    Netting runs on integer wei, which is faster than Decimal and cannot
+    round 40-digit sums to the default 28-digit context. Raises ValueError
+    if any claimed transfer has a non-positive amount.
+    """
+    now = timezone.now()
+    claimed = list(
+        TokenTransfer.objects.select_for_update()
+        .filter(pk__in=transfer_ids, status__in=OPEN_STATUSES)
+        .order_by('pk')
+        .values_list('pk', 'token_id', 'from_user_id', 'to_user_id', 'amount')
+    )
+    if any(row[4] <= 0 for row in claimed):
+        raise ValueError('Transfer amount must be positive')
+    deltas = defaultdict(int)
+    for _, token_id, from_user_id, to_user_id, amount in claimed:
+        for key, delta in transfer_deltas(token_id, from_user_id, to_user_id, to_units(amount)).items():
+            deltas[key] += delta
+    apply_deltas({key: from_units(units) for key, units in deltas.items()}, now)
+    record_transfers(claimed)
+    TokenTransfer.objects.filter(pk__in=[row[0] for row in claimed]).update(
+        status='COMPLETED', updated_at=now
+    )
+    return len(claimed)
+
+
+def apply_transfers(transfers, batch_size=None):
+    """
+    Apply many transfers, committing once per batch of ``batch_size``.
+
+    ``transfers`` may be TokenTransfer instances or primary keys. A batch is
+    all-or-nothing; if any account in it cannot cover its net debit, or any
+    transfer in it has a non-positive amount, the batch is rolled back and
+    replayed transfer by transfer so that only the offending transfers are
+    marked FAILED.
+    """
+    batch_size = batch_size or get_batch_size()
+    transfer_ids = [getattr(transfer, 'pk', transfer) for transfer in transfers]
+    summary = {'applied': 0, 'failed': 0, 'skipped': 0}
+
+    for start in range(0, len(transfer_ids), batch_size):
+        batch = transfer_ids[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                applied = _apply_batch(batch)
+        except (InsufficientBalance, ValueError):
+            logger.info('Ledger batch of %d rejected, replaying individually', len(batch))
+            applied = 0
+            for transfer in TokenTransfer.objects.filter(pk__in=batch).order_by('created_at', 'pk'):
+                try:
+                    applied += apply_transfer(transfer)
+                except InsufficientBalance:
+                    summary['failed'] += 1
+                except ValueError as exc:
+                    summary['failed'] += _mark_failed([transfer.pk], str(exc))
+        summary['applied'] += applied
+        summary['skipped'] += len(batch) - applied
+
+    summary['skipped'] -= summary['failed']
+    return summary
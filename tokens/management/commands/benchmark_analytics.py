@@ -0,0 +1,86 @@
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from tokens.analytics import drawdown, rolling_volatility, twap, vwap
+
+
+def naive_twap(times, prices):
+    weighted = total = 0.0
+    for i in range(len(prices) - 1):
+        duration = times[i + 1] - times[i]
+        weighted += prices[i] * duration
+        total += duration
+    return weighted / total
+
+
+def naive_vwap(prices, volumes):
+    notional = volume = 0.0
+    for price, quantity in zip(prices, volumes):
+        notional += price * quantity
+        volume += quantity
+    return notional / volume
+
+
+def naive_volatility(prices, window):
+    returns = [math.log(prices[i + 1] / prices[i]) for i in range(len(prices) - 1)]
+    result = []
+    total = sq = 0.0
+    for i, value in enumerate(returns):
+        total += value
+        sq += value * value
+        if i >= window:
+            old = returns[i - window]
+            total -= old
+            sq -= old * old
+        if i >= window - 1:
+            result.append(math.sqrt(max((sq - total * total / window) / (window - 1), 0.0)))
+    return result
+
+
+def naive_drawdown(prices):
+    peak = prices[0]
+    result = []
+    for price in prices:
+        peak = max(peak, price)
+        result.append(price / peak - 1.0)
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark vectorized price analytics against naive Python loops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=1_000_000)
+        parser.add_argument('--window', type=int, default=60)
+
+    def handle(self, *args, **options):
+        points, window = options['points'], options['window']
+        rng = np.random.default_rng(42)
+        times = np.cumsum(rng.uniform(0.5, 1.5, points))
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, points)))
+        volumes = rng.uniform(1, 1000, points)
+        times_list, prices_list, volumes_list = times.tolist(), prices.tolist(), volumes.tolist()
+
+        cases = [
+            ('twap', lambda: twap(times, prices), lambda: naive_twap(times_list, prices_list)),
+            ('vwap', lambda: vwap(prices, volumes), lambda: naive_vwap(prices_list, volumes_list)),
+            ('volatility', lambda: rolling_volatility(prices, window),
+             lambda: naive_volatility(prices_list, window)),
+            ('drawdown', lambda: drawdown(prices), lambda: naive_drawdown(prices_list)),
+        ]
+        self.stdout.write(f"{points:,} points, window {window}")
+        for name, vectorized, naive in cases:
+            vectorized_time = self._time(vectorized)
+            naive_time = self._time(naive)
+            self.stdout.write(
+                f"{name:>10}: numpy {vectorized_time * 1000:8.1f} ms | "
+                f"loop {naive_time * 1000:8.1f} ms | {naive_time / vectorized_time:6.1f}x"
+            )
+
+    def _time(self, func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
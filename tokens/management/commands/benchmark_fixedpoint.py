@@ -0,0 +1,66 @@
+import random
+import time
+from decimal import ROUND_DOWN, Decimal
+
+from django.core.management.base import BaseCommand
+
+from tokens.fixedpoint import fee, percent_to_rate, swap_out, to_units
+
+CENT = Decimal('0.01')
+WEI = Decimal('0.000000000000000001')
+
+
+def decimal_fee(amount, percentage, flat):
+    return (amount * percentage / 100).quantize(CENT, rounding=ROUND_DOWN) + flat
+
+
+def decimal_swap_out(amount_in, reserve_in, reserve_out, fee_percentage):
+    amount_in_with_fee = amount_in * (100 - fee_percentage) / 100
+    out = amount_in_with_fee * reserve_out / (reserve_in + amount_in_with_fee)
+    return out.quantize(WEI, rounding=ROUND_DOWN)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark integer fixed-point fee and swap math against Decimal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200_000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        rng = random.Random(42)
+        amounts = [Decimal(rng.randint(1, 10_000_000)) / 100 for _ in range(iterations)]
+        swaps = [Decimal(rng.randint(1, 10 ** 24)) * WEI for _ in range(iterations)]
+
+        percentage, flat = Decimal('0.5000'), Decimal('0.30')
+        reserve_in, reserve_out = Decimal('1250000.5'), Decimal('2480000.25')
+        pool_fee = Decimal('0.3000')
+
+        # Fixed-point inputs are converted once, as they would be at the API boundary
+        amount_units = [to_units(amount, 2) for amount in amounts]
+        swap_units = [to_units(amount) for amount in swaps]
+        rate, flat_units = percent_to_rate(percentage), to_units(flat, 2)
+        reserve_in_units, reserve_out_units = to_units(reserve_in), to_units(reserve_out)
+        pool_rate = percent_to_rate(pool_fee)
+
+        cases = [
+            ('fee',
+             lambda: [fee(units, rate, flat_units) for units in amount_units],
+             lambda: [decimal_fee(amount, percentage, flat) for amount in amounts]),
+            ('swap quote',
+             lambda: [swap_out(units, reserve_in_units, reserve_out_units, pool_rate) for units in swap_units],
+             lambda: [decimal_swap_out(amount, reserve_in, reserve_out, pool_fee) for amount in swaps]),
+        ]
+        self.stdout.write(f"{iterations:,} iterations")
+        for name, fixed, decimal in cases:
+            fixed_time = self._time(fixed)
+            decimal_time = self._time(decimal)
+            self.stdout.write(
+                f"{name:>10}: int {fixed_time * 1000:8.1f} ms | "
+                f"Decimal {decimal_time * 1000:8.1f} ms | {decimal_time / fixed_time:6.1f}x"
+            )
+
+    def _time(self, func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
@@ -0,0 +1,97 @@
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tokens.ledger import InsufficientBalance, apply_transfer, apply_transfers
+from tokens.models import Token, TokenBalance, TokenTransfer
+
+
+class Command(BaseCommand):
+    help = 'Measure ledger throughput (transfers/sec) under N concurrent workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--transfers', type=int, default=2000)
+        parser.add_argument('--accounts', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--mode', choices=['single', 'batch', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        modes = ['single', 'batch'] if options['mode'] == 'both' else [options['mode']]
+        run_id = uuid.uuid4().hex[:8]
+        token = Token.objects.create(
+            name='Ledger Benchmark', symbol='BENCH', contract_address=f'bench-{run_id}'
+        )
+        User.objects.bulk_create([
+            User(username=f'ledger-bench-{run_id}-{i}') for i in range(options['accounts'])
+        ])
+        users = list(User.objects.filter(username__startswith=f'ledger-bench-{run_id}-'))
+        try:
+            for mode in modes:
+                self._reset_balances(token, users)
+                transfer_ids = self._create_transfers(token, users, options['transfers'])
+                rate, failures = self._run(mode, transfer_ids, options['workers'], options['batch_size'])
+                self.stdout.write(
+                    f"{mode:>6}: {rate:,.0f} transfers/sec "
+                    f"({options['transfers']} transfers, {options['workers']} workers, {failures} errors)"
+                )
+        finally:
+            token.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def _reset_balances(self, token, users):
+        TokenBalance.objects.filter(token=token).delete()
+        TokenBalance.objects.bulk_create([
+            TokenBalance(
+                token=token, user=user, balance=Decimal('1000000'), available_balance=Decimal('1000000')
+            )
+            for user in users
+        ])
+
+    def _create_transfers(self, token, users, count):
+        transfers = []
+        for _ in range(count):
+            sender, recipient = random.sample(users, 2)
+            transfers.append(TokenTransfer(
+                token=token,
+                from_user=sender,
+                to_user=recipient,
+                amount=Decimal(random.randint(1, 100)),
+                transfer_type='SEND',
+            ))
+        TokenTransfer.objects.bulk_create(transfers)
+        return [transfer.pk for transfer in transfers]
+
+    def _run(self, mode, transfer_ids, workers, batch_size):
+        slices = [transfer_ids[i::workers] for i in range(workers)]
+        errors = []
+
+        def work(ids):
+            try:
+                if mode == 'batch':
+                    apply_transfers(ids, batch_size=batch_size)
+                else:
+                    for transfer in TokenTransfer.objects.filter(pk__in=ids):
+                        try:
+                            apply_transfer(transfer)
+                        except InsufficientBalance:
+                            errors.append(transfer.pk)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(ids,)) for ids in slices]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return len(transfer_ids) / elapsed, len(errors)
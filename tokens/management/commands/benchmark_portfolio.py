@@ -0,0 +1,72 @@
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from customers.models import CustomerProfile
+from payments.models import ExchangeRate
+from tokens.models import Token, TokenBalance, TokenPrice
+from tokens.portfolio import portfolio
+from wallets.models import Wallet, WalletType
+
+
+class Command(BaseCommand):
+    help = 'Latency of the portfolio aggregate for a user with many wallets and holdings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=500)
+        parser.add_argument('--tokens', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--currency', default='EUR')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'portfolio-bench-{run_id}')
+        CustomerProfile.objects.create(user=user, preferred_currency=options['currency'])
+        wallet_types = list(WalletType.objects.all()) or [
+            WalletType.objects.create(name=f'Portfolio Bench {run_id}', category='CUSTODIAL')
+        ]
+        Wallet.objects.bulk_create([
+            Wallet(
+                user=user, wallet_type=wallet_types[i % len(wallet_types)], name=f'bench {i}',
+                address=f'0x{run_id}{i:032x}', status='ACTIVE' if i % 10 else 'INACTIVE',
+            )
+            for i in range(options['wallets'])
+        ])
+        Token.objects.bulk_create([
+            Token(name=f'Portfolio Bench {i}', symbol=f'PB{i}', contract_address=f'bench-{run_id}-{i}')
+            for i in range(options['tokens'])
+        ])
+        tokens = list(Token.objects.filter(contract_address__startswith=f'bench-{run_id}-'))
+        TokenBalance.objects.bulk_create([
+            TokenBalance(user=user, token=token, balance=Decimal(1000 + i), available_balance=Decimal(1000 + i))
+            for i, token in enumerate(tokens)
+        ])
+        TokenPrice.objects.bulk_create([TokenPrice(token=token, price_usd=Decimal('1.25')) for token in tokens])
+        rate = ExchangeRate.objects.create(base_currency='USD', target_currency=options['currency'], rate=Decimal('0.92'))
+        try:
+            portfolio(user.pk)  # warm the price cache
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    result = portfolio(user.pk)
+                    timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(
+                f"{options['wallets']} wallets, {len(result['assets'])} holdings, valued in {result['currency']}: "
+                f"{len(queries) / options['requests']:.1f} queries/request"
+            )
+            self.stdout.write(
+                f"median {statistics.median(timings):.2f} ms | p95 {p95:.2f} ms | max {timings[-1]:.2f} ms"
+            )
+        finally:
+            rate.delete()
+            Token.objects.filter(pk__in=[token.pk for token in tokens]).delete()
+            user.delete()
@@ -0,0 +1,68 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tokens.ledger import apply_transfer
+from tokens.models import Token, TokenBalance, TokenTransfer
+from tokens.sharding import consolidate, enable_sharding, sharded_balance
+
+
+class Command(BaseCommand):
+    help = 'Compare sustained credit throughput on one hot account: single row vs sharded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--credits', type=int, default=4000)
+        parser.add_argument('--shards', type=int, default=16)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        token = Token.objects.create(
+            name='Shard Benchmark', symbol='BENCH', contract_address=f'bench-{run_id}'
+        )
+        hot = User.objects.create(username=f'shard-bench-{run_id}')
+        try:
+            TokenBalance.objects.create(token=token, user=hot)
+            single = self._run(token, hot, options['credits'], options['workers'])
+            self.stdout.write(f"single row: {single:,.0f} credits/sec")
+
+            enable_sharding(token.pk, hot.pk, options['shards'])
+            sharded = self._run(token, hot, options['credits'], options['workers'])
+            consolidate(token.pk, hot.pk)
+            self.stdout.write(f"   sharded: {sharded:,.0f} credits/sec ({options['shards']} shards)")
+            self.stdout.write(f"   speedup: {sharded / single:.2f}x")
+
+            expected = Decimal(options['credits'] * 2)
+            actual = sharded_balance(token.pk, hot.pk)['balance']
+            if actual != expected:
+                self.stdout.write(self.style.ERROR(f"Balance {actual} != expected {expected}"))
+        finally:
+            token.delete()
+            hot.delete()
+
+    def _run(self, token, hot, count, workers):
+        transfers = TokenTransfer.objects.bulk_create([
+            TokenTransfer(token=token, to_user=hot, amount=Decimal('1'), transfer_type='RECEIVE')
+            for _ in range(count)
+        ])
+        slices = [transfers[i::workers] for i in range(workers)]
+
+        def work(batch):
+            try:
+                for transfer in batch:
+                    apply_transfer(transfer)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(batch,)) for batch in slices]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tokens.sharding import consolidate_all
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded balance credits back into their main TokenBalance rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, consolidating every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            consolidated = consolidate_all()
+            self.stdout.write(f"Consolidated {consolidated} sharded balances")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
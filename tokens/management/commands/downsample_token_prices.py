@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from tokens.candles import apply_retention, bucket_start, rebuild_candles
+
+
+class Command(BaseCommand):
+    help = 'Roll old TokenPrice ticks into candles and apply the raw/candle retention policy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-token', type=int, default=None, help='Only rebuild candles for this token')
+        parser.add_argument('--start', default=None, help='ISO start of the rebuild range')
+        parser.add_argument('--end', default=None, help='ISO end of the rebuild range')
+
+    def handle(self, *args, **options):
+        if options['rebuild_token']:
+            start = bucket_start(parse_datetime(options['start']), '1d')
+            end = bucket_start(parse_datetime(options['end']), '1d')
+            rebuilt = rebuild_candles(options['rebuild_token'], start, end)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} candles"))
+            return
+
+        summary = apply_retention()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {summary['rebuilt']} candles, deleted {summary['ticks_deleted']} raw ticks "
+            f"and {summary['candles_deleted']} expired candles"
+        ))
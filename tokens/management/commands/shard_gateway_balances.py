@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from merchant.models import MerchantGateway
+from tokens.models import Token
+from tokens.sharding import enable_sharding
+from wallets.models import Wallet
+
+
+class Command(BaseCommand):
+    help = 'Enable sharded credits on the balances of merchant gateway wallet owners'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=None)
+        parser.add_argument('--token', type=int, default=None, help='Token id (default: all active tokens)')
+
+    def handle(self, *args, **options):
+        user_ids = set(Wallet.objects.filter(is_gateway=True).values_list('user_id', flat=True))
+        user_ids.update(MerchantGateway.objects.values_list('merchant__user_id', flat=True))
+        tokens = Token.objects.filter(is_active=True)
+        if options['token']:
+            tokens = tokens.filter(pk=options['token'])
+
+        enabled = 0
+        for token_id in tokens.values_list('pk', flat=True):
+            for user_id in user_ids:
+                enable_sharding(token_id, user_id, options['shards'])
+                enabled += 1
+        self.stdout.write(self.style.SUCCESS(f"Enabled sharding on {enabled} balances"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tokens.journal import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot journal balances for accounts whose journal tail has grown past the interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-entries', type=int, default=None)
+        parser.add_argument('--settle-seconds', type=int, default=None)
+
+    def handle(self, *args, **options):
+        written = take_snapshots(options['min_entries'], options['settle_seconds'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} balance snapshots"))
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tokens', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('balance', models.DecimalField(decimal_places=18, max_digits=40)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tokens.token')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'tokens_balance_snapshot',
+                'indexes': [models.Index(fields=['user', 'token', 'created_at'], name='tokens_bala_user_id_1c0d57_idx')],
+                'unique_together': {('user', 'token', 'sequence')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceJournalEntry',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entry_type', models.CharField(choices=[('DEBIT', 'Debit'), ('CREDIT', 'Credit'), ('OPENING', 'Opening Balance')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=18, max_digits=40)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tokens.token')),
+                ('transfer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='journal_entries', to='tokens.tokentransfer')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='balance_journal', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'tokens_journal',
+                'indexes': [models.Index(fields=['user', 'token', 'sequence'], name='tokens_jour_user_id_f7e3dd_idx'), models.Index(fields=['user', 'token', 'created_at'], name='tokens_jour_user_id_035cf4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tokens', '0002_balance_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tokenbalance',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TokenBalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=18, default=0, max_digits=40)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tokens.token')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_balance_shards', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'tokens_balance_shard',
+                'unique_together': {('user', 'token', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tokens', '0003_balance_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenPriceCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 Minute'), ('5m', '5 Minutes'), ('1h', '1 Hour'), ('1d', '1 Day')], max_length=3)),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('volume', models.DecimalField(blank=True, decimal_places=2, max_digits=40, null=True)),
+                ('tick_count', models.PositiveIntegerField(default=0)),
+                ('opened_at', models.DateTimeField()),
+                ('closed_at', models.DateTimeField()),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='tokens.token')),
+            ],
+            options={
+                'db_table': 'tokens_price_candle',
+                'unique_together': {('token', 'interval', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tokens', '0004_price_candles'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tokentransfer',
+            index=models.Index(fields=['created_at', 'id'], name='tokens_tran_created_2c92f9_idx'),
+        ),
+    ]
@@ -47,6 +47,7 @@ class TokenBalance(models.Model):
         default=0,
         validators=[MinValueValidator(Decimal('0'))]
     )
+    shard_count = models.PositiveSmallIntegerField(default=0)  # 0 = credits land on this row
     last_updated = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -66,6 +67,21 @@ class TokenBalance(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.balance} {self.token.symbol}"
 
+class TokenBalanceShard(models.Model):
+    """Credit sub-row of a sharded TokenBalance for hot accounts"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='token_balance_shards')
+    token = models.ForeignKey(Token, on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=40, decimal_places=18, default=0)
+    last_updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'tokens_balance_shard'
+        unique_together = ['user', 'token', 'shard']
+    
+    def __str__(self):
+        return f"{self.user_id} - shard {self.shard}: {self.balance}"
+
 class TokenTransfer(models.Model):
     """MTT token transfer records"""
     TRANSFER_TYPES = [
@@ -123,6 +139,7 @@ class TokenTransfer(models.Model):
     class Meta:
         db_table = 'tokens_transfer'
         indexes = [
+            models.Index(fields=['created_at', 'id']),  # keyset pagination
             models.Index(fields=['from_user', 'created_at']),
             models.Index(fields=['to_user', 'created_at']),
             models.Index(fields=['transaction_hash']),
@@ -155,6 +172,34 @@ class TokenPrice(models.Model):
     def __str__(self):
         return f"{self.token.symbol} - ${self.price_usd}"
 
+class TokenPriceCandle(models.Model):
+    """OHLCV rollup of TokenPrice ticks for one interval bucket"""
+    INTERVALS = [
+        ('1m', '1 Minute'),
+        ('5m', '5 Minutes'),
+        ('1h', '1 Hour'),
+        ('1d', '1 Day'),
+    ]
+    
+    token = models.ForeignKey(Token, on_delete=models.CASCADE, related_name='candles')
+    interval = models.CharField(max_length=3, choices=INTERVALS)
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.DecimalField(max_digits=40, decimal_places=2, null=True, blank=True)  # Last reported 24h volume
+    tick_count = models.PositiveIntegerField(default=0)
+    opened_at = models.DateTimeField()  # Timestamp of the first tick
+    closed_at = models.DateTimeField()  # Timestamp of the last tick
+    
+    class Meta:
+        db_table = 'tokens_price_candle'
+        unique_together = ['token', 'interval', 'bucket_start']
+    
+    def __str__(self):
+        return f"{self.token_id} {self.interval} @ {self.bucket_start}: {self.close}"
+
 class TokenAllowance(models.Model):
     """Token allowances for smart contract interactions"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -181,3 +226,62 @@ class TokenAllowance(models.Model):
     
     def __str__(self):
         return f"{self.owner.username} -> {self.spender_address}: {self.allowance}"
+
+class BalanceJournalEntry(models.Model):
+    """Append-only double-entry journal of token balance changes"""
+    ENTRY_TYPES = [
+        ('DEBIT', 'Debit'),
+        ('CREDIT', 'Credit'),
+        ('OPENING', 'Opening Balance'),
+    ]
+    
+    # Globally increasing, so it also orders entries within an account
+    # without a per-account counter row that every writer would contend on.
+    sequence = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        User, 
+        on_delete=models.CASCADE, 
+        related_name='balance_journal',
+        null=True, 
+        blank=True  # null = the external side of a mint, purchase or withdrawal
+    )
+    token = models.ForeignKey(Token, on_delete=models.CASCADE)
+    transfer = models.ForeignKey(
+        TokenTransfer, 
+        on_delete=models.SET_NULL, 
+        related_name='journal_entries',
+        null=True, 
+        blank=True
+    )
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPES)
+    amount = models.DecimalField(max_digits=40, decimal_places=18)  # Signed
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'tokens_journal'
+        indexes = [
+            models.Index(fields=['user', 'token', 'sequence']),
+            models.Index(fields=['user', 'token', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.sequence} {self.entry_type} {self.amount}"
+
+class BalanceSnapshot(models.Model):
+    """Materialized account balance as of a journal sequence"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots')
+    token = models.ForeignKey(Token, on_delete=models.CASCADE)
+    sequence = models.PositiveBigIntegerField()  # Last journal sequence included
+    balance = models.DecimalField(max_digits=40, decimal_places=18)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'tokens_balance_snapshot'
+        unique_together = ['user', 'token', 'sequence']
+        indexes = [
+            models.Index(fields=['user', 'token', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.balance} @ #{self.sequence}"
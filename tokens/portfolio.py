@@ -0,0 +1,115 @@
+"""
+Portfolio summary for one user, valued in their preferred currency.
+
+Two queries regardless of how many wallets the user has: the profile's
+preferred currency plus wallet counts aggregated in the database, then every
+token holding with unconsolidated shard credits summed in a subquery. Prices
+come from the in-process price cache, so valuation itself normally costs no
+queries at all.
+
+Tokens are valued with the TokenPrice column for the currency when there is
+one (USD, ETH); any other currency goes through USD and the active
+USD -> currency ExchangeRate. Holdings without a price are listed with a
+null value and left out of the total.
+
+Sums and valuations run in a 60-digit decimal context: 40-digit balances,
+and their products with 20-digit prices, do not fit the default 28 digits.
+"""
+from decimal import Decimal, localcontext
+
+from django.contrib.auth.models import User
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from wallets.models import WalletType
+
+from . import price_cache
+from .models import TokenBalance, TokenBalanceShard
+
+DEFAULT_CURRENCY = 'USD'
+
+# Exact products of DecimalField(40, 18) balances and DecimalField(20, 8) prices or rates
+PRECISION = 60
+
+_ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=40, decimal_places=18))
+
+
+def _wallet_summary(user_id):
+    counts = {
+        category.lower(): Count('wallets', filter=Q(wallets__wallet_type__category=category))
+        for category, _ in WalletType.WALLET_CATEGORIES
+    }
+    rows = User.objects.filter(pk=user_id).values(
+        currency=F('customer_profile__preferred_currency'),
+    ).annotate(
+        total=Count('wallets'),
+        active=Count('wallets', filter=Q(wallets__status='ACTIVE')),
+        **counts,
+    )
+    return next(iter(rows), None)
+
+
+def _holdings(user_id):
+    pending = TokenBalanceShard.objects.filter(
+        user_id=OuterRef('user_id'), token_id=OuterRef('token_id')
+    ).order_by().values('token_id').annotate(total=Sum('balance')).values('total')
+    return TokenBalance.objects.filter(user_id=user_id).annotate(
+        pending=Coalesce(Subquery(pending), _ZERO),
+    ).values(
+        'token_id', 'token__symbol', 'token__name', 'balance', 'available_balance', 'locked_balance', 'pending',
+    ).order_by('token__symbol')
+
+
+def token_value(token_id, currency):
+    """Price of one token in ``currency`` from the price cache, or None"""
+    if currency in price_cache.PRICE_FIELDS:
+        return price_cache.latest_token_price(token_id, currency)
+    price = price_cache.latest_token_price(token_id, 'USD')
+    rate = price_cache.latest_exchange_rate('USD', currency)
+    if price is None or rate is None:
+        return None
+    with localcontext(prec=PRECISION):
+        return (price * rate).quantize(price_cache.QUANTUM)
+
+
+def portfolio(user_id, currency=None):
+    """Wallet counts, per-token holdings and their total value for a user"""
+    summary = _wallet_summary(user_id)
+    if summary is None:
+        return None
+    preferred = summary.pop('currency')
+    currency = currency or preferred or DEFAULT_CURRENCY
+
+    assets, total = [], Decimal('0')
+    for row in _holdings(user_id):
+        with localcontext(prec=PRECISION):
+            balance = row['balance'] + row['pending']
+            available = row['available_balance'] + row['pending']
+            if not balance:
+                continue
+            price = token_value(row['token_id'], currency)
+            value = (balance * price).quantize(price_cache.QUANTUM) if price is not None else None
+            if value is not None:
+                total += value
+        assets.append({
+            'token_id': row['token_id'],
+            'symbol': row['token__symbol'],
+            'name': row['token__name'],
+            'balance': str(balance),
+            'available_balance': str(available),
+            'locked_balance': str(row['locked_balance']),
+            'price': str(price) if price is not None else None,
+            'value': str(value) if value is not None else None,
+        })
+
+    return {
+        'user_id': user_id,
+        'currency': currency,
+        'total_value': str(total),
+        'wallets': {
+            'total': summary.pop('total'),
+            'active': summary.pop('active'),
+            'by_category': {category.upper(): count for category, count in summary.items()},
+        },
+        'assets': assets,
+    }
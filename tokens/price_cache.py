@@ -0,0 +1,201 @@
+"""
+Per-process cache of the latest quotes.
+
+Holds the current TokenPrice per (token, currency) and the current active
+payments.ExchangeRate per (base, target). New price rows are pushed to every
+process over the broadcast channel after commit, so in steady state quotes
+are served without touching the database; the TTL only bounds staleness if
+a message is lost. Keys come from client input (token ids, symbols,
+currency pairs), so the map is an LRU capped at ``MAX_ENTRIES``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from mtt_gateway import broadcast
+from payments.models import ExchangeRate
+
+from .models import Token, TokenPrice
+
+CHANNEL = 'mtt:prices'
+
+# Quote currency -> TokenPrice column
+PRICE_FIELDS = {
+    'USD': 'price_usd',
+    'ETH': 'price_eth',
+}
+
+# Both price columns and ExchangeRate.rate store 8 decimal places
+QUANTUM = Decimal('0.00000001')
+
+_MISSING = object()
+
+
+class PriceCache:
+    """Thread-safe, size-bounded TTL map with hit/miss counters"""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+        # Per-key versions, bumped by pushes so a slow load cannot overwrite
+        # them; the generation is bumped when everything is dropped
+        self._versions = {}
+        self._generation = 0
+        self.hits = self.misses = self.pushes = self.invalidations = self.evictions = 0
+
+    def _store(self, key, value, expires):
+        # Caller holds the lock
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            value, expires = self._entries.get(key, (_MISSING, 0))
+            if expires > now:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            self.misses += 1
+            version = (self._generation, self._versions.get(key, 0))
+        value = loader()
+        with self._lock:
+            if (self._generation, self._versions.get(key, 0)) == version:
+                self._store(key, value, now + self.ttl)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic() + self.ttl)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self.pushes += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._versions.clear()
+                self._generation += 1
+            else:
+                self._entries.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'pushes': self.pushes,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process cache, subscribed to price broadcasts on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            options = getattr(settings, 'PRICE_CACHE_SETTINGS', {})
+            _cache = PriceCache(options.get('TTL_SECONDS', 30), options.get('MAX_ENTRIES', 10000))
+            broadcast.subscribe(CHANNEL, _on_message)
+        return _cache
+
+
+def _token_key(token_id, currency):
+    return ('token', int(token_id), currency)
+
+
+def _rate_key(base_currency, target_currency):
+    return ('rate', base_currency, target_currency)
+
+
+def latest_token_price(token_id, currency='USD'):
+    """Latest price of a token in ``currency`` (USD or ETH), or None"""
+    field = PRICE_FIELDS[currency]
+    return get_cache().get(
+        _token_key(token_id, currency),
+        lambda: TokenPrice.objects.filter(token_id=token_id)
+        .order_by('-timestamp').values_list(field, flat=True).first(),
+    )
+
+
+def latest_exchange_rate(base_currency, target_currency):
+    """Current active rate for a currency pair, or None"""
+    return get_cache().get(
+        _rate_key(base_currency, target_currency),
+        lambda: ExchangeRate.objects.filter(
+            base_currency=base_currency, target_currency=target_currency, is_active=True
+        ).order_by('-created_at').values_list('rate', flat=True).first(),
+    )
+
+
+def token_id_for_symbol(symbol):
+    """Token id for a symbol; symbols are immutable in practice so this is cached too"""
+    return get_cache().get(
+        ('symbol', symbol),
+        lambda: Token.objects.filter(symbol=symbol).values_list('id', flat=True).first(),
+    )
+
+
+def publish_token_price(price):
+    """Push a newly saved TokenPrice to every process once it commits"""
+    message = {
+        'kind': 'token',
+        'token_id': price.token_id,
+        'quotes': {
+            currency: str(getattr(price, field)) if getattr(price, field) is not None else None
+            for currency, field in PRICE_FIELDS.items()
+        },
+    }
+    transaction.on_commit(lambda: broadcast.publish(CHANNEL, message))
+
+
+def publish_exchange_rate(rate, created):
+    """
+    Push a new active rate, or invalidate the pair when an existing row is
+    edited or deactivated (it may no longer be the latest one)
+    """
+    message = {
+        'kind': 'rate',
+        'base': rate.base_currency,
+        'target': rate.target_currency,
+        'rate': str(rate.rate) if created and rate.is_active else None,
+    }
+    transaction.on_commit(lambda: broadcast.publish(CHANNEL, message))
+
+
+def _on_message(message):
+    cache = _cache
+    if message is None:
+        # Reconnected after an outage; pushes may have been missed
+        cache.invalidate()
+    elif message['kind'] == 'token':
+        for currency, value in message['quotes'].items():
+            value = Decimal(value).quantize(QUANTUM) if value is not None else None
+            cache.put(_token_key(message['token_id'], currency), value)
+    elif message['kind'] == 'rate':
+        key = _rate_key(message['base'], message['target'])
+        if message['rate'] is None:
+            cache.invalidate(key)
+        else:
+            cache.put(key, Decimal(message['rate']).quantize(QUANTUM))
@@ -0,0 +1,46 @@
+from rest_framework import serializers
+
+from .models import Token, TokenBalance, TokenPrice, TokenTransfer
+
+
+class TokenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Token
+        fields = [
+            'id', 'name', 'symbol', 'total_supply', 'decimals', 'contract_address',
+            'chain_id', 'is_active', 'created_at',
+        ]
+
+
+class TokenBalanceSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    token_symbol = serializers.CharField(source='token.symbol', read_only=True)
+
+    class Meta:
+        model = TokenBalance
+        fields = [
+            'id', 'user_id', 'username', 'token_symbol', 'balance', 'locked_balance',
+            'available_balance', 'last_updated',
+        ]
+
+
+class TokenTransferSerializer(serializers.ModelSerializer):
+    token_symbol = serializers.CharField(source='token.symbol', read_only=True)
+    from_user = serializers.CharField(source='from_user.username', read_only=True, default=None)
+    to_user = serializers.CharField(source='to_user.username', read_only=True, default=None)
+
+    class Meta:
+        model = TokenTransfer
+        fields = [
+            'id', 'token_symbol', 'from_user', 'to_user', 'amount', 'transfer_type',
+            'status', 'transaction_hash', 'created_at',
+        ]
+
+
+class TokenPriceSerializer(serializers.ModelSerializer):
+    token_symbol = serializers.CharField(source='token.symbol', read_only=True)
+
+    class Meta:
+        model = TokenPrice
+        fields = ['id', 'token_symbol', 'price_usd', 'price_eth', 'source', 'timestamp']
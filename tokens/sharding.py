@@ -0,0 +1,154 @@
+"""
+Sharded balances for hot accounts.
+
+When a TokenBalance has ``shard_count > 0`` the ledger lands credits on one of
+that many TokenBalanceShard rows picked at random, so concurrent credits to a
+merchant gateway no longer queue on a single row lock. Debits still come from
+the main row; consolidation folds the shards back into it.
+"""
+import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import TokenBalance, TokenBalanceShard
+
+
+def _shard_setting(name, default):
+    return getattr(settings, 'LEDGER_SETTINGS', {}).get(name, default)
+
+
+def _config_key(token_id, user_id):
+    return f'tokens:shards:{token_id}:{user_id}'
+
+
+def _balance_key(token_id, user_id):
+    return f'tokens:sharded-balance:{token_id}:{user_id}'
+
+
+def shard_counts(keys):
+    """
+    Shard count for each (token_id, user_id) key, served from the cache so
+    the credit path does not read TokenBalance on every transfer.
+    """
+    keys = list(keys)
+    cached = cache.get_many([_config_key(*key) for key in keys])
+    counts = {key: cached[_config_key(*key)] for key in keys if _config_key(*key) in cached}
+    missing = [key for key in keys if key not in counts]
+    if missing:
+        rows = TokenBalance.objects.filter(
+            token_id__in={token_id for token_id, _ in missing},
+            user_id__in={user_id for _, user_id in missing},
+        ).values_list('token_id', 'user_id', 'shard_count')
+        found = {(token_id, user_id): shards for token_id, user_id, shards in rows}
+        fetched = {key: found.get(key, 0) for key in missing}
+        cache.set_many(
+            {_config_key(*key): shards for key, shards in fetched.items()},
+            _shard_setting('SHARD_CONFIG_CACHE_SECONDS', 60),
+        )
+        counts.update(fetched)
+    return counts
+
+
+def enable_sharding(token_id, user_id, shards=None):
+    """Opt an account into sharded credits"""
+    shards = shards or _shard_setting('DEFAULT_SHARDS', 16)
+    with transaction.atomic():
+        TokenBalance.objects.get_or_create(token_id=token_id, user_id=user_id)
+        TokenBalanceShard.objects.bulk_create(
+            [TokenBalanceShard(token_id=token_id, user_id=user_id, shard=i) for i in range(shards)],
+            ignore_conflicts=True,
+        )
+        TokenBalance.objects.filter(token_id=token_id, user_id=user_id).update(shard_count=shards)
+    cache.delete(_config_key(token_id, user_id))
+    return shards
+
+
+def disable_sharding(token_id, user_id):
+    """Send credits back to the main row and fold in what the shards hold"""
+    TokenBalance.objects.filter(token_id=token_id, user_id=user_id).update(shard_count=0)
+    cache.delete(_config_key(token_id, user_id))
+    return consolidate(token_id, user_id)
+
+
+def credit_shard(token_id, user_id, amount, shards, now=None):
+    """Credit a randomly chosen shard of a sharded account"""
+    shard = random.randrange(shards)
+    updated = TokenBalanceShard.objects.filter(
+        token_id=token_id, user_id=user_id, shard=shard
+    ).update(balance=F('balance') + amount, last_updated=now or timezone.now())
+    if not updated:
+        # Shard count was raised elsewhere before the rows were created here
+        TokenBalanceShard.objects.get_or_create(token_id=token_id, user_id=user_id, shard=shard)
+        TokenBalanceShard.objects.filter(
+            token_id=token_id, user_id=user_id, shard=shard
+        ).update(balance=F('balance') + amount)
+
+
+def consolidate(token_id, user_id):
+    """
+    Fold shard balances into the main TokenBalance row. Locks the main row
+    before the shards, the same order the ledger's debit path uses.
+    """
+    with transaction.atomic():
+        main = TokenBalance.objects.select_for_update().filter(token_id=token_id, user_id=user_id)
+        if not main.exists():
+            return Decimal('0')
+        shards = TokenBalanceShard.objects.select_for_update().filter(token_id=token_id, user_id=user_id)
+        total = shards.aggregate(total=Sum('balance'))['total'] or Decimal('0')
+        if total:
+            now = timezone.now()
+            amount = Value(total, output_field=DecimalField(max_digits=40, decimal_places=18))
+            shards.exclude(balance=0).update(balance=Decimal('0'), last_updated=now)
+            main.update(
+                balance=F('balance') + amount,
+                available_balance=Greatest(
+                    F('balance') - F('locked_balance') + amount,
+                    Value(Decimal('0'), output_field=DecimalField(max_digits=40, decimal_places=18)),
+                ),
+                last_updated=now,
+            )
+    cache.delete(_balance_key(token_id, user_id))
+    return total
+
+
+def consolidate_all():
+    """Consolidate every account that has credits sitting in shards"""
+    accounts = (
+        TokenBalanceShard.objects.exclude(balance=0)
+        .values_list('token_id', 'user_id')
+        .distinct()
+    )
+    consolidated = 0
+    for token_id, user_id in list(accounts):
+        consolidate(token_id, user_id)
+        consolidated += 1
+    return consolidated
+
+
+def sharded_balance(token_id, user_id):
+    """
+    Total and available balance of an account including unconsolidated
+    shards, cached for a few seconds since hot accounts change constantly.
+    """
+    key = _balance_key(token_id, user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    main = TokenBalance.objects.filter(token_id=token_id, user_id=user_id).values(
+        'balance', 'available_balance'
+    ).first() or {'balance': Decimal('0'), 'available_balance': Decimal('0')}
+    pending = TokenBalanceShard.objects.filter(token_id=token_id, user_id=user_id).aggregate(
+        total=Sum('balance')
+    )['total'] or Decimal('0')
+    result = {
+        'balance': main['balance'] + pending,
+        'available_balance': main['available_balance'] + pending,
+    }
+    cache.set(key, result, _shard_setting('SHARD_BALANCE_CACHE_SECONDS', 2))
+    return result
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from payments.models import ExchangeRate
+
+from . import price_cache
+from .candles import record_tick
+from .models import TokenPrice
+
+
+@receiver(post_save, sender=TokenPrice)
+def roll_up_price_tick(sender, instance, created, **kwargs):
+    """Keep OHLCV candles current as price ticks are inserted"""
+    if created:
+        record_tick(instance.token_id, instance.price_usd, instance.timestamp, instance.volume_24h)
+
+
+@receiver(post_save, sender=TokenPrice)
+def push_latest_price(sender, instance, created, **kwargs):
+    """Refresh every process's quote cache with the new tick"""
+    if created:
+        price_cache.publish_token_price(instance)
+
+
+@receiver(post_save, sender=ExchangeRate)
+def push_exchange_rate(sender, instance, created, **kwargs):
+    price_cache.publish_exchange_rate(instance, created)
@@ -1,3 +1,420 @@
-from django.test import TestCase
+import base64
+import uuid
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from mtt_gateway.testing import PageQueryCountMixin
+from payments.models import ExchangeRate
+from wallets.models import Wallet, WalletType
+
+from . import fixedpoint, price_cache, sharding
+from .analytics import drawdown
+from .candles import INTERVAL_SECONDS, bucket_start, record_tick
+from .journal import journal_balance, take_snapshots
+from .ledger import apply_transfers
+from .models import (
+    BalanceJournalEntry, BalanceSnapshot, Token, TokenBalance, TokenBalanceShard, TokenPrice, TokenPriceCandle,
+    TokenTransfer,
+)
+from .portfolio import portfolio
+from .price_cache import PriceCache
+
+
+class PriceCacheVersionTests(SimpleTestCase):
+    def test_push_to_one_key_does_not_discard_loads_of_others(self):
+        cache = PriceCache(ttl=60)
+
+        def slow_load():
+            cache.put(('token', 2, 'USD'), 5)  # a push for another key lands mid-load
+            return 1
+
+        self.assertEqual(cache.get(('token', 1, 'USD'), slow_load), 1)
+        self.assertEqual(cache.get(('token', 1, 'USD'), lambda: self.fail('should be cached')), 1)
+
+    def test_push_to_the_same_key_wins_over_a_slow_load(self):
+        cache = PriceCache(ttl=60)
+        key = ('token', 1, 'USD')
+
+        def slow_load():
+            cache.put(key, 2)
+            return 1
+
+        cache.get(key, slow_load)
+        self.assertEqual(cache.get(key, lambda: 3), 2)
+
+    def test_full_invalidation_discards_in_flight_loads(self):
+        cache = PriceCache(ttl=60)
+        key = ('token', 1, 'USD')
+
+        def slow_load():
+            cache.invalidate()
+            return 1
+
+        cache.get(key, slow_load)
+        self.assertEqual(cache.get(key, lambda: 3), 3)
+
+
+class PriceCacheSizeTests(SimpleTestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = PriceCache(ttl=60, max_entries=2)
+        cache.get('a', lambda: 1)
+        cache.put('b', 2)
+        cache.get('a', lambda: self.fail('should be cached'))
+        cache.get('c', lambda: 3)
+        self.assertEqual(cache.get('b', lambda: 'reloaded'), 'reloaded')
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+
+class FixedPointTests(SimpleTestCase):
+    def test_to_units_truncates_extra_precision(self):
+        self.assertEqual(fixedpoint.to_units(Decimal('1.239'), 2), 123)
+        self.assertEqual(fixedpoint.to_units(Decimal('-1.239'), 2), -123)
+        self.assertEqual(fixedpoint.to_units(3, 2), 300)
+        with self.assertRaises(ValueError):
+            fixedpoint.to_units(Decimal('NaN'))
+
+    def test_forty_digit_amounts_round_trip_exactly(self):
+        amount = Decimal('1234567890123456789012.123456789012345678')
+        units = fixedpoint.to_units(amount)
+        self.assertEqual(units, 1234567890123456789012123456789012345678)
+        self.assertEqual(fixedpoint.from_units(units), amount)
+        self.assertEqual(fixedpoint.token_amount(units, Token(decimals=6)).as_tuple().exponent, -6)
+
+    def test_fees_and_swaps_round_down(self):
+        rate = fixedpoint.percent_to_rate(Decimal('0.3000'))
+        self.assertEqual(rate, 3000)
+        self.assertEqual(fixedpoint.fee(999, rate), 2)  # 2.997
+        self.assertEqual(fixedpoint.fee(999, rate, flat=30), 32)
+        # 100 in, 1000/1000 pool, 0.3% fee: 99.7 * 1000 / 1099.7 = 90.66...
+        self.assertEqual(fixedpoint.swap_out(100, 1000, 1000, rate), 90)
+        self.assertEqual(fixedpoint.swap_out(0, 1000, 1000, rate), 0)
+
+    def test_wei_amount_field_stores_integers(self):
+        field = fixedpoint.WeiAmountField()
+        self.assertEqual(field.to_python('1000000000000000000'), 10 ** 18)
+        with self.assertRaises(ValidationError):
+            field.to_python('1.5')
+        self.assertEqual(Decimal(field.get_db_prep_save(2 ** 255, connection)), 2 ** 255)
+        self.assertEqual(field.from_db_value(Decimal('7'), None, connection), 7)
+
+
+class TokenQuoteTests(TestCase):
+    path = '/api/tokens/quote/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('trader'))
+
+    def test_invalid_token_ids_are_rejected(self):
+        for token in ('\u00b2', str(2 ** 70), 'X' * 11):
+            with self.subTest(token=token):
+                self.assertEqual(self.client.get(self.path, {'token': token}).status_code, 400)
+
+    def test_unknown_symbol_is_not_found(self):
+        self.assertEqual(self.client.get(self.path, {'token': 'NOPE'}).status_code, 404)
+
+
+class ListQueryCountTests(PageQueryCountMixin, TestCase):
+    """Every page is one query, whatever its size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'user{n}') for n in range(50)])
+        tokens = Token.objects.bulk_create([Token(symbol=f'T{n}', contract_address=f'0x{n:040x}') for n in range(50)])
+        TokenBalance.objects.bulk_create([TokenBalance(user=user, token=tokens[0]) for user in users])
+        TokenTransfer.objects.bulk_create([
+            TokenTransfer(token=tokens[n], from_user=users[n], to_user=users[-n], amount=1, transfer_type='SEND')
+            for n in range(50)
+        ])
+        TokenPrice.objects.bulk_create([TokenPrice(token=token, price_usd=1) for token in tokens])
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_tokens(self):
+        self.assertPageQueries('/api/tokens/list/')
+
+    def test_balances(self):
+        self.assertPageQueries('/api/tokens/balances/')
+
+    def test_transfers(self):
+        self.assertPageQueries('/api/tokens/transfers/')
+
+    def test_prices(self):
+        self.assertPageQueries('/api/tokens/prices/')
+
+
+class TakeSnapshotsTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'holder{n}') for n in range(3)]
+        self.token = Token.objects.create(contract_address='0x' + '0' * 40)
+
+    def journal(self, amounts, age=timedelta(minutes=5)):
+        entries = BalanceJournalEntry.objects.bulk_create([
+            BalanceJournalEntry(user=user, token=self.token, entry_type='CREDIT', amount=Decimal(amount))
+            for user in self.users for amount in amounts
+        ])
+        BalanceJournalEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            created_at=timezone.now() - age,
+        )
+
+    def test_snapshots_add_the_tail_to_the_previous_snapshot_in_one_query(self):
+        self.journal(['1.5', '2.25'])
+        self.assertEqual(take_snapshots(min_entries=1, settle_seconds=60), 3)
+        self.journal(['0.25'])
+        with self.assertNumQueries(2):  # the grouped tails and the insert
+            self.assertEqual(take_snapshots(min_entries=1, settle_seconds=60), 3)
+        for user in self.users:
+            latest = BalanceSnapshot.objects.filter(user=user).order_by('-sequence').first()
+            self.assertEqual(latest.balance, Decimal('4'))
+            self.assertEqual(journal_balance(user.pk, self.token.pk), Decimal('4'))
+
+    def test_entries_inside_the_settle_window_are_left_in_the_tail(self):
+        self.journal(['1'])
+        self.journal(['2'], age=timedelta(0))
+        take_snapshots(min_entries=1, settle_seconds=60)
+        self.assertEqual(set(BalanceSnapshot.objects.values_list('balance', flat=True)), {Decimal('1')})
+
+    def test_accounts_below_the_interval_are_skipped(self):
+        self.journal(['1', '1'])
+        self.assertEqual(take_snapshots(min_entries=3, settle_seconds=60), 0)
+
+
+class ApplyTransfersTests(TestCase):
+    def setUp(self):
+        self.sender, self.recipient = (User.objects.create_user(name) for name in ('sender', 'recipient'))
+        self.token = Token.objects.create(contract_address='0x' + '0' * 40)
+        TokenBalance.objects.create(user=self.sender, token=self.token, balance=10, available_balance=10)
+
+    def transfer(self, amount):
+        return TokenTransfer.objects.create(
+            token=self.token, from_user=self.sender, to_user=self.recipient, amount=Decimal(amount),
+            transfer_type='SEND',
+        )
+
+    def test_non_positive_amounts_fail_without_aborting_the_batch(self):
+        transfers = [self.transfer('3'), self.transfer('-5'), self.transfer('0'), self.transfer('2')]
+        self.assertEqual(apply_transfers(transfers), {'applied': 2, 'failed': 2, 'skipped': 0})
+        statuses = TokenTransfer.objects.in_bulk([transfer.pk for transfer in transfers])
+        self.assertEqual(
+            [statuses[transfer.pk].status for transfer in transfers], ['COMPLETED', 'FAILED', 'FAILED', 'COMPLETED'],
+        )
+        self.assertEqual(TokenBalance.objects.get(user=self.sender).balance, Decimal('5'))
+        self.assertEqual(TokenBalance.objects.get(user=self.recipient).balance, Decimal('5'))
+
+    def test_uncovered_transfers_fail_alone(self):
+        transfers = [self.transfer('8'), self.transfer('8')]
+        self.assertEqual(apply_transfers(transfers), {'applied': 1, 'failed': 1, 'skipped': 0})
+        self.assertEqual(TokenBalance.objects.get(user=self.sender).balance, Decimal('2'))
+
+
+class ShardedBalanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.payer, self.merchant = (User.objects.create_user(name) for name in ('payer', 'merchant'))
+        self.token = Token.objects.create(contract_address='0x' + '0' * 40)
+        TokenBalance.objects.create(user=self.payer, token=self.token, balance=100, available_balance=100)
+        sharding.enable_sharding(self.token.pk, self.merchant.pk, shards=4)
+
+    def pay(self, amount, sender=None, recipient=None):
+        transfer = TokenTransfer.objects.create(
+            token=self.token, from_user=sender or self.payer, to_user=recipient or self.merchant,
+            amount=Decimal(amount), transfer_type='SEND',
+        )
+        apply_transfers([transfer])
+        transfer.refresh_from_db()
+        return transfer
+
+    def balances(self):
+        main = TokenBalance.objects.get(user=self.merchant, token=self.token)
+        shards = TokenBalanceShard.objects.filter(user=self.merchant, token=self.token)
+        return main.balance, sum(shard.balance for shard in shards)
+
+    def test_credits_land_on_shards_until_consolidated(self):
+        for _ in range(5):
+            self.pay('2')
+        self.assertEqual(self.balances(), (0, 10))
+        self.assertEqual(sharding.sharded_balance(self.token.pk, self.merchant.pk)['balance'], 10)
+
+        self.assertEqual(sharding.consolidate_all(), 1)
+        self.assertEqual(self.balances(), (10, 0))
+        self.assertEqual(TokenBalance.objects.get(user=self.merchant, token=self.token).available_balance, 10)
+
+    def test_debit_consolidates_the_shards_it_needs(self):
+        self.pay('10')
+        self.assertEqual(self.pay('7', sender=self.merchant, recipient=self.payer).status, 'COMPLETED')
+        self.assertEqual(self.balances(), (3, 0))
+
+    def test_uncovered_debit_fails_and_leaves_the_shards_alone(self):
+        self.pay('10')
+        self.assertEqual(self.pay('11', sender=self.merchant, recipient=self.payer).status, 'FAILED')
+        self.assertEqual(self.balances(), (0, 10))
+
+    def test_disabling_folds_the_shards_back(self):
+        self.pay('4')
+        self.assertEqual(sharding.disable_sharding(self.token.pk, self.merchant.pk), 4)
+        self.pay('1')
+        self.assertEqual(self.balances(), (5, 0))
+
+
+class CandleTests(TestCase):
+    path = '/api/tokens/prices/'
+
+    def setUp(self):
+        self.token = Token.objects.create(contract_address='0x' + '0' * 40)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('charter'))
+
+    def test_saved_ticks_roll_up_into_every_interval(self):
+        tick = TokenPrice.objects.create(token=self.token, price_usd='1.5', volume_24h='10')
+        candles = TokenPriceCandle.objects.filter(token=self.token)
+        self.assertEqual(sorted(candles.values_list('interval', flat=True)), sorted(INTERVAL_SECONDS))
+        for candle in candles:
+            self.assertEqual(candle.bucket_start, bucket_start(tick.timestamp, candle.interval))
+            self.assertEqual((candle.open, candle.close, candle.tick_count), (Decimal('1.5'), Decimal('1.5'), 1))
+
+    def test_out_of_order_ticks_keep_open_and_close_in_time_order(self):
+        start = bucket_start(timezone.now(), '1h')
+        for minute, price in ((30, '3'), (10, '1'), (50, '5'), (20, '0.5')):
+            record_tick(self.token.pk, Decimal(price), start + timedelta(minutes=minute))
+        candle = TokenPriceCandle.objects.get(token=self.token, interval='1h', bucket_start=start)
+        self.assertEqual(
+            (candle.open, candle.high, candle.low, candle.close, candle.tick_count),
+            (Decimal('1'), Decimal('5'), Decimal('0.5'), Decimal('5'), 4),
+        )
+
+    def test_candles_endpoint_reads_the_requested_range(self):
+        start = bucket_start(timezone.now(), '1h') - timedelta(hours=1)
+        record_tick(self.token.pk, Decimal('2'), start + timedelta(minutes=1))
+        record_tick(self.token.pk, Decimal('4'), start + timedelta(minutes=2))
+        response = self.client.get(self.path, {'token': self.token.pk, 'interval': '1m'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([candle['close'] for candle in response.data['results']], ['2.00000000', '4.00000000'])
+
+    def test_bad_candle_parameters_are_rejected(self):
+        for params, expected in (
+            ({'interval': '2m'}, 400),
+            ({'interval': '1m', 'token': '\u00b2'}, 400),
+            ({'interval': '1m', 'token': str(2 ** 70)}, 400),
+            ({'interval': '1m', 'token': 'NOPE'}, 404),
+            ({'interval': '1m', 'start': 'yesterday'}, 400),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.path, params).status_code, expected)
+
+
+class PortfolioTests(TestCase):
+    path = '/api/tokens/portfolio/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('holder')
+        self.token = Token.objects.create(contract_address='0x' + '0' * 40, symbol='MTT')
+        wallet_type = WalletType.objects.create(name='Hot', category='CUSTODIAL')
+        Wallet.objects.create(user=self.user, wallet_type=wallet_type, name='Main', address='0x' + '1' * 40)
+        TokenPrice.objects.create(token=self.token, price_usd='0.5', price_eth='0.00025')
+        price_cache.get_cache().invalidate()  # ids are reused between tests
+
+    def test_balances_beyond_28_digits_are_valued_exactly(self):
+        # 1e21 (+ 2 pending) x 0.5 at 18 places needs more than 28 digits
+        TokenBalance.objects.create(user=self.user, token=self.token, balance=Decimal('1000000000000000000000'))
+        TokenBalanceShard.objects.create(user=self.user, token=self.token, shard=0, balance=Decimal('2'))
+        result = portfolio(self.user.pk)
+        self.assertEqual(result['currency'], 'USD')
+        self.assertEqual(result['assets'][0]['balance'], '1000000000000000000002.000000000000000000')
+        self.assertEqual(result['total_value'], '500000000000000000001.00000000')
+        self.assertEqual(result['wallets'], {'total': 1, 'active': 1, 'by_category': {
+            category: int(category == 'CUSTODIAL') for category, _ in WalletType.WALLET_CATEGORIES
+        }})
+
+    def test_other_currencies_go_through_the_usd_rate(self):
+        TokenBalance.objects.create(user=self.user, token=self.token, balance=Decimal('4'))
+        ExchangeRate.objects.create(base_currency='USD', target_currency='EUR', rate=Decimal('0.9'))
+        result = portfolio(self.user.pk, 'EUR')
+        self.assertEqual((result['assets'][0]['price'], result['total_value']), ('0.45000000', '1.80000000'))
+        self.assertEqual(portfolio(self.user.pk, 'GBP')['assets'][0]['value'], None)
+
+    def test_staff_user_parameter_is_validated(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        for user, expected in (('\u00b2', 400), (str(2 ** 70), 400), (str(self.user.pk), 200), ('999999', 404)):
+            with self.subTest(user=user):
+                self.assertEqual(self.client.get(self.path, {'user': user}).status_code, expected)
+
+
+class TokenAnalyticsTests(TestCase):
+    path = '/api/tokens/analytics/'
+
+    def setUp(self):
+        self.token = Token.objects.create(contract_address='0x' + '0' * 40)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('analyst'))
+
+    def test_bad_parameters_are_rejected(self):
+        for params in (
+            {'token': self.token.pk, 'window': 0},
+            {'token': self.token.pk, 'window': -5},
+            {'token': 'abc'},
+            {'token': '\u00b2'},
+            {'pair': 'notanid'},
+            {'token': str(2 ** 70)},
+            {'pair': str(2 ** 70)},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.path, params).status_code, 400)
+
+    def test_zero_prices_do_not_break_the_statistics(self):
+        TokenPrice.objects.bulk_create([
+            TokenPrice(token=self.token, price_usd=price) for price in ('0', '0', '2', '1', '0', '3')
+        ])
+        response = self.client.get(self.path, {'token': self.token.pk, 'window': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['prices']['points'], 6)
+
+    def test_series_are_capped_to_the_latest_points(self):
+        now = timezone.now()
+        for n, price in enumerate(('100', '1', '2', '3')):
+            tick = TokenPrice.objects.create(token=self.token, price_usd=price)
+            TokenPrice.objects.filter(pk=tick.pk).update(timestamp=now - timedelta(minutes=10 - n))  # auto_now_add
+        with self.settings(ANALYTICS_SETTINGS={'MAX_POINTS': 3}):
+            data = self.client.get(self.path, {'token': self.token.pk, 'window': 2}).data['prices']
+        self.assertEqual((data['points'], data['truncated'], data['last_price']), (3, True, 3.0))
+        self.assertEqual(data['max_drawdown'], 0.0)  # the old 100 is outside the cap
+
+    def test_drawdown_is_zero_until_the_peak_is_positive(self):
+        self.assertEqual(list(drawdown(np.array([0.0, 0.0, 2.0, 1.0]))), [0.0, 0.0, 0.0, -0.5])
+
+
+class ListParameterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def cursor(self, pk):
+        return base64.urlsafe_b64encode(f'2026-01-01T00:00:00+00:00|{pk}'.encode()).decode().rstrip('=')
+
+    def test_cursor_with_a_pk_of_the_wrong_type_is_not_found(self):
+        for path in ('/api/tokens/transfers/', '/api/wallets/transactions/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path, {'cursor': self.cursor('notauuid')}).status_code, 404)
+
+    def test_cursor_with_a_valid_pk_pages(self):
+        response = self.client.get('/api/tokens/transfers/', {'cursor': self.cursor(uuid.uuid4())})
+        self.assertEqual(response.status_code, 200)
+
+    def test_filter_values_the_field_cannot_hold_are_rejected(self):
+        for path, params in (
+            ('/api/tokens/transfers/', {'from_user': 'abc'}),
+            ('/api/tokens/prices/', {'token': 'x'}),
+            ('/api/tokens/balances/', {'token': str(2 ** 70)}),
+            ('/api/wallets/transactions/', {'wallet': 'notauuid'}),
+            ('/api/merchant/transactions/', {'merchant': '1'}),
+        ):
+            with self.subTest(path=path, params=params):
+                self.assertEqual(self.client.get(path, params).status_code, 400)
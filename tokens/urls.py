@@ -15,7 +15,17 @@ urlpatterns = [
     
     # Token Transfers
     path('transfers/', views.token_transfers_list, name='token_transfers_list'),
+    path('transfers/export/', views.token_transfers_export, name='token_transfers_export'),
     
     # Token Prices
     path('prices/', views.token_prices_list, name='token_prices_list'),
+    
+    # Price Analytics
+    path('analytics/', views.token_analytics, name='token_analytics'),
+    
+    # Cached Latest Quotes
+    path('quote/', views.token_quote, name='token_quote'),
+    
+    # Portfolio
+    path('portfolio/', views.token_portfolio, name='token_portfolio'),
 ] 
\ No newline at end of file
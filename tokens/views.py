@@ -1,8 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.shortcuts import render
+from django.utils import timezone
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Token, TokenBalance, TokenTransfer, TokenPrice
+from django.db.models import Q
+from maythetoken.models import TradeExecution
+from mtt_gateway.exports import export_response, parse_time
+from mtt_gateway.filters import clean_value, filter_params
+from mtt_gateway.pagination import KeysetPagination
+from . import price_cache
+from .analytics import execution_analytics, price_analytics
+from .candles import INTERVAL_SECONDS
+from .models import Token, TokenBalance, TokenTransfer, TokenPrice, TokenPriceCandle
+from .portfolio import portfolio
+from .serializers import (
+    TokenBalanceSerializer, TokenPriceSerializer, TokenSerializer, TokenTransferSerializer,
+)
 
 # Create your views here.
 
@@ -18,7 +34,12 @@ def api_root(request):
             'tokens': '/api/tokens/list/',
             'balances': '/api/tokens/balances/',
             'transfers': '/api/tokens/transfers/',
+            'transfers_export': '/api/tokens/transfers/export/?fmt=csv',
             'prices': '/api/tokens/prices/',
+            'candles': '/api/tokens/prices/?interval=1d',
+            'analytics': '/api/tokens/analytics/',
+            'quote': '/api/tokens/quote/?token=MTT&currency=USD',
+            'portfolio': '/api/tokens/portfolio/',
         },
         'description': 'MTT token management, balances, transfers, and pricing system'
     })
@@ -28,91 +49,228 @@ def tokens_list(request):
     """
     List all tokens
     """
-    tokens = Token.objects.all()[:10]
-    data = []
-    for token in tokens:
-        data.append({
-            'id': token.id,
-            'token_id': str(token.token_id),
-            'name': token.name,
-            'symbol': token.symbol,
-            'total_supply': str(token.total_supply),
-            'decimals': token.decimals,
-            'contract_address': token.contract_address,
-            'blockchain': token.blockchain,
-            'is_active': token.is_active,
-            'created_at': token.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    tokens = Token.objects.only(*TokenSerializer.Meta.fields)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(tokens, request)
+    return paginator.get_paginated_response(TokenSerializer(page, many=True).data)
 
 @api_view(['GET'])
 def token_balances_list(request):
     """
-    List token balances
-    """
-    balances = TokenBalance.objects.all()[:10]
-    data = []
-    for balance in balances:
-        data.append({
-            'id': balance.id,
-            'user_id': balance.user.id if balance.user else None,
-            'username': balance.user.username if balance.user else None,
-            'token_symbol': balance.token.symbol if balance.token else None,
-            'balance': str(balance.balance),
-            'locked_balance': str(balance.locked_balance),
-            'updated_at': balance.updated_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    List token balances (?user=<id>&token=<id>)
+    """
+    balances = TokenBalance.objects.select_related('user', 'token').only(
+        'id', 'user__username', 'token__symbol', 'balance', 'locked_balance',
+        'available_balance', 'last_updated', 'created_at',
+    )
+    balances = filter_params(balances, request, ('user', 'token'))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(balances, request)
+    return paginator.get_paginated_response(TokenBalanceSerializer(page, many=True).data)
 
 @api_view(['GET'])
 def token_transfers_list(request):
     """
-    List token transfers
-    """
-    transfers = TokenTransfer.objects.all()[:10]
-    data = []
-    for transfer in transfers:
-        data.append({
-            'id': transfer.id,
-            'transfer_id': str(transfer.transfer_id),
-            'token_symbol': transfer.token.symbol if transfer.token else None,
-            'from_user': transfer.from_user.username if transfer.from_user else None,
-            'to_user': transfer.to_user.username if transfer.to_user else None,
-            'amount': str(transfer.amount),
-            'status': transfer.status,
-            'created_at': transfer.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    List token transfers, newest first, with cursor pagination
+    (?from_user=<id>|to_user=<id>|status=<status>&cursor=<next cursor>)
+    """
+    transfers = TokenTransfer.objects.select_related('token', 'from_user', 'to_user').only(
+        'id', 'token__symbol', 'from_user__username', 'to_user__username', 'amount',
+        'transfer_type', 'status', 'transaction_hash', 'created_at',
+    )
+    transfers = filter_params(transfers, request, ('from_user', 'to_user', 'status'))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(transfers, request)
+    return paginator.get_paginated_response(TokenTransferSerializer(page, many=True).data)
+
+@api_view(['GET'])
+def token_transfers_export(request):
+    """
+    Stream token transfers as CSV or NDJSON
+    (?from_user=<id>&to_user=<id>&status=<status>&start=<iso>&end=<iso>&fmt=csv|ndjson&gzip=1).
+    Staff export everything; other users only their own transfers.
+    """
+    transfers = TokenTransfer.objects.all()
+    if not request.user.is_staff:
+        transfers = transfers.filter(Q(from_user=request.user) | Q(to_user=request.user))
+    transfers = filter_params(transfers, request, ('from_user', 'to_user', 'status'))
+
+    return export_response(request, transfers, [
+        'id', 'created_at', 'token__symbol', 'from_user__username', 'to_user__username',
+        'from_address', 'to_address', 'amount', 'transfer_type', 'status', 'transaction_hash',
+        'block_number', 'confirmed_at',
+    ], 'token-transfers')
 
 @api_view(['GET'])
 def token_prices_list(request):
     """
-    List token prices
-    """
-    prices = TokenPrice.objects.all()[:10]
-    data = []
-    for price in prices:
-        data.append({
-            'id': price.id,
-            'token_symbol': price.token.symbol if price.token else None,
-            'price_usd': str(price.price_usd),
-            'source': price.source,
-            'updated_at': price.updated_at.isoformat()
-        })
-    
+    List token price ticks, newest first, with cursor pagination
+    (?token=<id>&cursor=<next cursor>), or OHLCV candles when an interval is
+    requested (?token=<id|symbol>&interval=1m|5m|1h|1d&start=<iso>&end=<iso>)
+    """
+    if 'interval' in request.query_params:
+        return token_price_candles(request)
+
+    prices = TokenPrice.objects.select_related('token').only(
+        'id', 'token__symbol', 'price_usd', 'price_eth', 'source', 'timestamp',
+    )
+    prices = filter_params(prices, request, ('token',))
+
+    paginator = KeysetPagination(ordering_field='timestamp')
+    page = paginator.paginate_queryset(prices, request)
+    return paginator.get_paginated_response(TokenPriceSerializer(page, many=True).data)
+
+@api_view(['GET'])
+def token_analytics(request):
+    """
+    TWAP, rolling volatility and drawdown for a token's price history, plus
+    VWAP for a trading pair's executions
+    (?token=<id>&pair=<trading pair id>&start=<iso>&end=<iso>&window=<points>).
+    Each series covers at most the latest ANALYTICS_SETTINGS['MAX_POINTS'] rows.
+    """
+    try:
+        start = parse_time(request.query_params.get('start'))
+        end = parse_time(request.query_params.get('end'))
+        window = int(request.query_params.get('window', 60))
+        if window < 1:
+            raise ValueError(window)
+    except ValueError:
+        return Response(
+            {'error': 'start/end must be ISO 8601 datetimes and window a positive integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    token_id = request.query_params.get('token')
+    pair_id = request.query_params.get('pair')
+    if not (token_id or pair_id):
+        return Response({'error': 'token or pair is required'}, status=status.HTTP_400_BAD_REQUEST)
+    token_id = clean_value(TokenPrice, 'token', token_id) if token_id else None
+    pair_id = clean_value(TradeExecution, 'trading_pair', pair_id) if pair_id else None
+
+    data = {'window': window}
+    if token_id:
+        data['token_id'] = token_id
+        data['prices'] = price_analytics(token_id, start, end, window)
+    if pair_id:
+        data['trading_pair_id'] = pair_id
+        data['executions'] = execution_analytics(pair_id, start, end, window)
+    return Response(data)
+
+@api_view(['GET'])
+def token_quote(request):
+    """
+    Latest quote from the in-process price cache, for a token
+    (?token=<id|symbol>&currency=USD|ETH) or an exchange rate pair
+    (?base=USD&target=MTT). ?stats=1 returns the cache counters instead.
+    """
+    if request.query_params.get('stats'):
+        return Response(price_cache.get_cache().stats())
+
+    base = request.query_params.get('base')
+    target = request.query_params.get('target')
+    if base or target:
+        rate = price_cache.latest_exchange_rate(base or 'USD', target or 'MTT')
+        if rate is None:
+            return Response({'error': 'No active exchange rate'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'base': base or 'USD', 'target': target or 'MTT', 'rate': str(rate)})
+
+    currency = request.query_params.get('currency', 'USD').upper()
+    if currency not in price_cache.PRICE_FIELDS:
+        return Response(
+            {'error': f"currency must be one of {', '.join(price_cache.PRICE_FIELDS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    token = request.query_params.get('token', '') or 'MTT'
+    if token.isdigit():
+        token_id = clean_value(Token, 'id', token)
+    elif len(token) > Token._meta.get_field('symbol').max_length:
+        return Response({'error': 'token must be an id or a token symbol'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        token_id = price_cache.token_id_for_symbol(token)
+    price = price_cache.latest_token_price(token_id, currency) if token_id is not None else None
+    if price is None:
+        return Response({'error': 'No price for token'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'token_id': token_id, 'currency': currency, 'price': str(price)})
+
+@api_view(['GET'])
+def token_portfolio(request):
+    """
+    Wallet counts and token holdings valued in the user's preferred currency
+    (?currency=<code> to override; staff may pass ?user=<id>)
+    """
+    user_id = request.user.pk
+    if request.user.is_staff and request.query_params.get('user'):
+        user_id = clean_value(TokenBalance, 'user', request.query_params['user'])
+    currency = request.query_params.get('currency', '').upper() or None
+    if currency is not None and not (len(currency) == 3 and currency.isalpha()):
+        return Response({'error': 'currency must be a 3-letter code'}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = portfolio(user_id, currency)
+    if result is None:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(result)
+
+# Default chart span per interval when no start is given
+CANDLE_SPANS = {
+    '1m': timedelta(hours=24),
+    '5m': timedelta(days=7),
+    '1h': timedelta(days=30),
+    '1d': timedelta(days=365),
+}
+
+def token_price_candles(request):
+    """
+    OHLCV candles for one token, read from the rollup table in a single
+    range scan of the (token, interval, bucket_start) index
+    """
+    interval = request.query_params.get('interval')
+    if interval not in INTERVAL_SECONDS:
+        return Response(
+            {'error': f"interval must be one of {', '.join(INTERVAL_SECONDS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    token = request.query_params.get('token', '')
+    if token.isdigit():
+        token_id = clean_value(TokenPriceCandle, 'token', token)
+    else:
+        token_id = Token.objects.filter(symbol=token or 'MTT').values_list('id', flat=True).first()
+        if token_id is None:
+            return Response({'error': 'Unknown token'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        end = parse_time(request.query_params.get('end')) or timezone.now()
+        start = parse_time(request.query_params.get('start')) or end - CANDLE_SPANS[interval]
+    except ValueError:
+        return Response({'error': 'start and end must be ISO 8601 datetimes'}, status=status.HTTP_400_BAD_REQUEST)
+
+    limit = getattr(settings, 'PRICE_ROLLUP_SETTINGS', {}).get('MAX_CANDLES', 1000)
+    candles = TokenPriceCandle.objects.filter(
+        token_id=token_id,
+        interval=interval,
+        bucket_start__gte=start,
+        bucket_start__lt=end,
+    ).order_by('bucket_start').values_list(
+        'bucket_start', 'open', 'high', 'low', 'close', 'volume', 'tick_count'
+    )[:limit]
+
+    data = [
+        {
+            'time': bucket.isoformat(),
+            'open': str(open_),
+            'high': str(high),
+            'low': str(low),
+            'close': str(close),
+            'volume': str(volume) if volume is not None else None,
+            'ticks': ticks,
+        }
+        for bucket, open_, high, low, close, volume, ticks in candles
+    ]
     return Response({
+        'token_id': token_id,
+        'interval': interval,
         'count': len(data),
         'results': data
     })
@@ -0,0 +1,118 @@
+"""
+Pre-derived deposit address pool.
+
+A background job keeps each xpub-backed wallet stocked with derived but
+unallocated WalletAddress rows (``is_allocated=False``). Checkout then
+allocates an address with one ``UPDATE ... RETURNING`` statement against the
+partial pool index; on PostgreSQL the inner select uses ``FOR UPDATE SKIP
+LOCKED`` so concurrent claims never queue behind each other.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .hd import derive_addresses
+from .models import Wallet, WalletAddress
+
+logger = logging.getLogger('mtt_gateway')
+
+
+def _pool_setting(name, default):
+    return getattr(settings, 'ADDRESS_POOL_SETTINGS', {}).get(name, default)
+
+
+def pool_wallets():
+    """Active wallets whose public_key holds an xpub to derive from"""
+    return Wallet.objects.filter(status='ACTIVE', public_key__startswith='xpub')
+
+
+def refill(wallet, low_water=None, target=None):
+    """
+    Top the wallet's pool back up to ``target`` unallocated addresses once it
+    drops below ``low_water``. Returns the number of addresses inserted.
+    """
+    low_water = _pool_setting('LOW_WATER_MARK', 50) if low_water is None else low_water
+    target = _pool_setting('TARGET_SIZE', 200) if target is None else target
+    available = WalletAddress.objects.filter(wallet=wallet, is_allocated=False, is_active=True).count()
+    if available >= low_water:
+        return 0
+
+    last_index = WalletAddress.objects.filter(wallet=wallet).aggregate(
+        last=Max('address_index')
+    )['last']
+    start = 0 if last_index is None else last_index + 1
+    base_path = _pool_setting('BASE_PATH', "m/44'/60'/0'/0")
+    addresses = [
+        WalletAddress(
+            wallet=wallet,
+            address=address,
+            derivation_path=f'{base_path}/{index}',
+            address_index=index,
+            is_allocated=False,
+        )
+        for index, address in derive_addresses(wallet.public_key, start, target - available)
+    ]
+    # A concurrent refill may have derived the same indexes; those rows are
+    # skipped, so only rows carrying our client-side primary keys were inserted
+    WalletAddress.objects.bulk_create(addresses, ignore_conflicts=True)
+    return WalletAddress.objects.filter(pk__in=[address.pk for address in addresses]).count()
+
+
+def refill_all(low_water=None, target=None):
+    """Refill every pool below its low-water mark; returns {wallet_id: added}"""
+    added = {}
+    for wallet in pool_wallets().only('id', 'public_key'):
+        try:
+            count = refill(wallet, low_water, target)
+        except ValueError:
+            logger.exception('Cannot derive deposit addresses for wallet %s', wallet.pk)
+            continue
+        if count:
+            added[wallet.pk] = count
+    return added
+
+
+def claim(wallet_id, label=''):
+    """
+    Allocate the lowest-index pooled address of a wallet in a single
+    statement. Returns (id, address, derivation_path, address_index), or None
+    when the pool is empty.
+    """
+    opts = WalletAddress._meta
+    field = opts.get_field
+    skip_locked = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    sql = (
+        f'UPDATE {opts.db_table} SET is_allocated = TRUE, allocated_at = %s, label = %s '
+        f'WHERE id = (SELECT id FROM {opts.db_table} '
+        f'WHERE wallet_id = %s AND NOT is_allocated AND is_active '
+        f'ORDER BY address_index LIMIT 1{skip_locked}) '
+        f'RETURNING id, address, derivation_path, address_index'
+    )
+    # Predicate spelled like the partial index condition so the planner uses it
+    params = [
+        field('allocated_at').get_db_prep_value(timezone.now(), connection),
+        label,
+        field('wallet').get_db_prep_value(wallet_id, connection),
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return (opts.pk.to_python(row[0]),) + tuple(row[1:])
+
+
+def allocate(wallet, label=''):
+    """
+    Claim a pooled address, deriving one inline only if the pool has run
+    dry (the slow path the background refill exists to avoid).
+    """
+    claimed = claim(wallet.pk, label)
+    if claimed is None and wallet.public_key and wallet.public_key.startswith('xpub'):
+        logger.warning('Address pool for wallet %s is empty; deriving inline', wallet.pk)
+        refill(wallet, low_water=1, target=1)
+        claimed = claim(wallet.pk, label)
+    return claimed
@@ -0,0 +1,167 @@
+"""
+WalletBackup integrity verification.
+
+``WalletBackup.checksum`` is the SHA-256 hex digest of ``encrypted_data``
+as stored, so a backup can be checked without decrypting it. The verifier
+walks the table in primary-key order, one chunk per query, and hashes the
+chunks in a process pool with a bounded number in flight. Memory stays flat
+however large the table is, and the database is read while earlier chunks
+are still being hashed.
+
+Each chunk's results are written with two UPDATEs. Matches get
+``is_verified=True`` and a fresh ``last_verified``. Mismatches get
+``is_verified=False`` and keep the time of their last good verification,
+so they are checked again on every run. A mismatch raises one CRITICAL
+SECURITY ``canasale.SystemAlert`` per backup; the alert is not repeated
+while an earlier one is still open.
+
+Runs are incremental by default: only backups never verified, failing, or
+last verified more than ``REVERIFY_DAYS`` ago are read.
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from canasale.models import SystemAlert
+
+from .models import WalletBackup
+
+logger = logging.getLogger('mtt_gateway')
+
+ALERT_SOURCE = 'wallets.backups'
+ALERT_OBJECT_TYPE = 'wallets.WalletBackup'
+
+
+def _verify_setting(name, default):
+    return getattr(settings, 'BACKUP_VERIFY_SETTINGS', {}).get(name, default)
+
+
+def _hash_chunk(rows):
+    """([matching ids], [mismatching ids], bytes hashed) for (id, data, checksum) rows"""
+    matched, mismatched, size = [], [], 0
+    for pk, data, checksum in rows:
+        raw = data.encode()
+        size += len(raw)
+        if hashlib.sha256(raw).hexdigest() == (checksum or '').strip().lower():
+            matched.append(pk)
+        else:
+            mismatched.append(pk)
+    return matched, mismatched, size
+
+
+class _InlineExecutor:
+    def submit(self, function, *args):
+        return _Done(function(*args))
+
+    def shutdown(self):
+        pass
+
+
+class _Done:
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+
+def due_backups(days=None):
+    """Backups due for verification: never verified, failing, or older than ``days``"""
+    backups = WalletBackup.objects.all()
+    if days is not None:
+        backups = backups.filter(
+            Q(is_verified=False) | Q(last_verified__isnull=True)
+            | Q(last_verified__lt=timezone.now() - timedelta(days=days))
+        )
+    return backups
+
+
+def _chunks(backups, chunk_size):
+    last = None
+    while True:
+        page = backups.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        rows = list(page.values_list('pk', 'encrypted_data', 'checksum')[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+
+def _alert_mismatches(backup_ids):
+    already_open = set(SystemAlert.objects.filter(
+        related_object_type=ALERT_OBJECT_TYPE, related_object_id__in=backup_ids,
+        status__in=['ACTIVE', 'ACKNOWLEDGED'],
+    ).values_list('related_object_id', flat=True))
+    details = WalletBackup.objects.filter(pk__in=backup_ids).values_list('pk', 'wallet_id', 'backup_type')
+    SystemAlert.objects.bulk_create([
+        SystemAlert(
+            alert_type='CRITICAL',
+            category='SECURITY',
+            title='Wallet backup checksum mismatch',
+            message=f'{backup_type} backup {pk} of wallet {wallet_id} no longer matches its SHA-256 checksum',
+            source_component=ALERT_SOURCE,
+            related_object_id=pk,
+            related_object_type=ALERT_OBJECT_TYPE,
+        )
+        for pk, wallet_id, backup_type in details if pk not in already_open
+    ])
+
+
+def _record(matched, mismatched):
+    with transaction.atomic():
+        if matched:
+            WalletBackup.objects.filter(pk__in=matched).update(is_verified=True, last_verified=timezone.now())
+        if mismatched:
+            WalletBackup.objects.filter(pk__in=mismatched).update(is_verified=False)
+            _alert_mismatches(mismatched)
+
+
+def verify(days=None, chunk_size=None, workers=None, progress=None):
+    """
+    Verify every due backup (all of them when ``days`` is None). Returns
+    {'backups', 'verified', 'mismatched', 'bytes', 'seconds', 'mb_per_second'};
+    ``progress(summary)`` is called after every chunk.
+    """
+    chunk_size = chunk_size or _verify_setting('CHUNK_SIZE', 500)
+    workers = workers or _verify_setting('WORKERS', 0) or os.cpu_count()
+    executor = ProcessPoolExecutor(workers) if workers > 1 else _InlineExecutor()
+    summary = {'backups': 0, 'verified': 0, 'mismatched': 0, 'bytes': 0}
+    started = time.perf_counter()
+
+    def collect(future):
+        matched, mismatched, size = future.result()
+        _record(matched, mismatched)
+        summary['backups'] += len(matched) + len(mismatched)
+        summary['verified'] += len(matched)
+        summary['mismatched'] += len(mismatched)
+        summary['bytes'] += size
+        if progress:
+            progress(summary)
+
+    in_flight = deque()
+    try:
+        for rows in _chunks(due_backups(days), chunk_size):
+            in_flight.append(executor.submit(_hash_chunk, rows))
+            if len(in_flight) >= workers * 2:
+                collect(in_flight.popleft())
+        while in_flight:
+            collect(in_flight.popleft())
+    finally:
+        executor.shutdown()
+
+    summary['seconds'] = time.perf_counter() - started
+    summary['mb_per_second'] = summary['bytes'] / 2 ** 20 / summary['seconds'] if summary['seconds'] else 0
+    if summary['mismatched']:
+        logger.error('%s wallet backups failed checksum verification', summary['mismatched'])
+    return summary
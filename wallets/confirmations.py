@@ -0,0 +1,259 @@
+"""
+Block-confirmation tracker.
+
+Instead of polling one receipt per pending transaction hash, the tracker
+follows the chain: each new block's receipts are fetched once
+(``eth_getBlockReceipts``, many blocks per batched RPC round trip) and
+matched against an in-memory set of every pending WalletTransaction and
+on-chain TokenTransfer hash. Matches are written with one UPDATE per block
+and model; confirmation counts and the PENDING -> CONFIRMED transition are
+set-based UPDATEs over ``block_number``.
+
+The pending set is refreshed every poll from rows *updated* since the last
+load (so a hash set on an existing row is picked up; writers that use
+queryset ``update()`` must set ``updated_at``). A hash first seen after the
+blocks of that poll were scanned may already have been mined in a block
+scanned earlier, so it gets one receipt lookup; every
+``CONFIRMATION_RECHECK_SECONDS`` all pending hashes are looked up again as a
+safety net.
+
+Confirmed TokenTransfers are handed to the ledger, which applies their
+balance changes and marks them COMPLETED. A reverted transaction is only
+flagged (``error_message`` / ``notes``) when it is mined and becomes FAILED
+once it reaches the required depth, like a successful one becomes final.
+Reorgs are detected through ``parentHash``; rows mined in orphaned blocks,
+reverted or not, go back to pending and are matched again.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, TextField, Value, When
+from django.utils import timezone
+
+from mtt_gateway.rpc import get_node, to_int
+from tokens.ledger import OPEN_STATUSES, apply_transfers
+from tokens.models import TokenTransfer
+
+from .models import WalletTransaction
+
+logger = logging.getLogger('mtt_gateway')
+
+REVERTED = 'Transaction reverted'
+
+
+def _chain_setting(name, default):
+    return getattr(settings, 'BLOCKCHAIN_SETTINGS', {}).get(name, default)
+
+
+class ConfirmationTracker:
+    def __init__(self, node=None, required=None, blocks_per_batch=None, receipts_per_batch=500,
+                 recheck_seconds=None):
+        self.node = node or get_node()
+        self.required = required or _chain_setting('REQUIRED_CONFIRMATIONS', 12)
+        self.blocks_per_batch = blocks_per_batch or _chain_setting('CONFIRMATION_BLOCKS_PER_BATCH', 50)
+        self.receipts_per_batch = receipts_per_batch
+        self.recheck_seconds = recheck_seconds or _chain_setting('CONFIRMATION_RECHECK_SECONDS', 600)
+        self._rechecked = None  # monotonic time of the last full receipt lookup
+        self.cursor = None  # last block processed
+        self.block_hashes = {}  # recent block number -> hash, for reorg detection
+        self.wallet_pending = set()
+        self.token_pending = set()
+        self._loaded_since = None
+        self.confirmed = self.failed = self.reorgs = 0
+
+    def _wallet_candidates(self):
+        return WalletTransaction.objects.filter(status='PENDING', block_number__isnull=True)
+
+    def _token_candidates(self):
+        return TokenTransfer.objects.filter(
+            status__in=OPEN_STATUSES, transaction_hash__isnull=False, block_number__isnull=True
+        )
+
+    def load_pending(self):
+        """Add hashes of unmined rows updated since the last load; returns the hashes not pending before"""
+        # Look back a little so rows committed late are not skipped
+        started = timezone.now() - timedelta(seconds=30)
+        wallet_rows, token_rows = self._wallet_candidates(), self._token_candidates()
+        if self._loaded_since is not None:
+            wallet_rows = wallet_rows.filter(updated_at__gte=self._loaded_since)
+            token_rows = token_rows.filter(updated_at__gte=self._loaded_since)
+        wallet_hashes = set(wallet_rows.values_list('transaction_hash', flat=True).iterator())
+        token_hashes = set(token_rows.values_list('transaction_hash', flat=True).iterator())
+        added = (wallet_hashes - self.wallet_pending) | (token_hashes - self.token_pending)
+        self.wallet_pending.update(wallet_hashes)
+        self.token_pending.update(token_hashes)
+        self._loaded_since = started
+        return added
+
+    def catch_up(self):
+        """
+        Fetch receipts for every pending hash (batched) to find transactions
+        mined in blocks the tracker did not match them in: before it was
+        following the chain, or before their rows were loaded
+        """
+        self._rechecked = time.monotonic()
+        self._lookup(self.wallet_pending | self.token_pending)
+
+    def _lookup(self, hashes):
+        """Record the receipts of ``hashes`` that have been mined"""
+        hashes = list(hashes)
+        for start in range(0, len(hashes), self.receipts_per_batch):
+            chunk = hashes[start:start + self.receipts_per_batch]
+            receipts = self.node.batch([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in chunk])
+            by_block = {}
+            for receipt in receipts:
+                if receipt is not None:
+                    by_block.setdefault(to_int(receipt['blockNumber']), []).append(receipt)
+            for receipts_in_block in by_block.values():
+                self._record(receipts_in_block)
+
+    def poll(self):
+        """Process every block since the last poll; returns the head block number"""
+        added = self.load_pending()
+        head = to_int(self.node.call('eth_blockNumber'))
+        if self.cursor is None:
+            self.catch_up()
+            self.cursor = head
+            self.block_hashes[head] = self.node.call('eth_getBlockByNumber', hex(head), False)['hash']
+        else:
+            # A detected reorg moves the cursor back, so this re-scans from the fork
+            while self.cursor < head:
+                self._process_range(self.cursor + 1, min(self.cursor + self.blocks_per_batch, head))
+            if time.monotonic() - self._rechecked >= self.recheck_seconds:
+                self.catch_up()
+            else:
+                # New hashes the scan did not match may be in blocks scanned before they were loaded
+                self._lookup(added & (self.wallet_pending | self.token_pending))
+        self._confirm(head)
+        return head
+
+    def _process_range(self, first, last):
+        calls = []
+        for number in range(first, last + 1):
+            calls.append(('eth_getBlockByNumber', [hex(number), False]))
+            calls.append(('eth_getBlockReceipts', [hex(number)]))
+        results = self.node.batch(calls)
+        for offset, number in enumerate(range(first, last + 1)):
+            block, receipts = results[2 * offset], results[2 * offset + 1]
+            parent = self.block_hashes.get(number - 1)
+            if parent is not None and block['parentHash'] != parent:
+                self._rewind(number - 1)
+                return
+            self.block_hashes[number] = block['hash']
+            self._record(receipts)
+            self.cursor = number
+        for number in [n for n in self.block_hashes if n <= self.cursor - self.required]:
+            del self.block_hashes[number]
+
+    def _record(self, receipts):
+        """Write block fields (and revert flags) for the pending hashes among one block's receipts"""
+        wallet_matches = [r for r in receipts if r['transactionHash'] in self.wallet_pending]
+        token_matches = [r for r in receipts if r['transactionHash'] in self.token_pending]
+        if not wallet_matches and not token_matches:
+            return
+        block_number, block_hash = to_int(receipts[0]['blockNumber']), receipts[0]['blockHash']
+        now = timezone.now()
+        with transaction.atomic():
+            if wallet_matches:
+                hashes = [r['transactionHash'] for r in wallet_matches]
+                failed = [r['transactionHash'] for r in wallet_matches if r['status'] == '0x0']
+                fields = {'block_number': block_number, 'block_hash': block_hash, 'updated_at': now}
+                if failed:
+                    fields['error_message'] = Case(
+                        When(transaction_hash__in=failed, then=Value(REVERTED)),
+                        default=F('error_message'), output_field=TextField(),
+                    )
+                WalletTransaction.objects.filter(transaction_hash__in=hashes, status='PENDING').update(
+                    gas_used=self._gas_used(wallet_matches), **fields
+                )
+                self.wallet_pending.difference_update(hashes)
+            if token_matches:
+                hashes = [r['transactionHash'] for r in token_matches]
+                failed = [r['transactionHash'] for r in token_matches if r['status'] == '0x0']
+                fields = {'block_number': block_number, 'updated_at': now}
+                if failed:
+                    fields['notes'] = Case(
+                        When(transaction_hash__in=failed, then=Value(REVERTED)),
+                        default=F('notes'), output_field=TextField(),
+                    )
+                TokenTransfer.objects.filter(transaction_hash__in=hashes, status__in=OPEN_STATUSES).update(
+                    gas_used=self._gas_used(token_matches), **fields
+                )
+                self.token_pending.difference_update(hashes)
+
+    def _gas_used(self, receipts):
+        # Plain transfers mostly use identical gas, so group hashes per value
+        by_gas = {}
+        for receipt in receipts:
+            by_gas.setdefault(to_int(receipt['gasUsed']), []).append(receipt['transactionHash'])
+        if len(by_gas) == 1:
+            return next(iter(by_gas))
+        return Case(*[When(transaction_hash__in=hashes, then=Value(gas)) for gas, hashes in by_gas.items()])
+
+    def _confirm(self, head):
+        """Refresh confirmation counts and finalize rows that reached the required depth"""
+        now = timezone.now()
+        depth = head - self.required + 1
+        mined = WalletTransaction.objects.filter(status='PENDING', block_number__isnull=False)
+        mined.filter(block_number__gt=depth).update(confirmations=head - F('block_number') + 1)
+        final = mined.filter(block_number__lte=depth)
+        with transaction.atomic():
+            self.failed += final.filter(error_message=REVERTED).update(
+                status='FAILED', confirmations=head - F('block_number') + 1, updated_at=now,
+            )
+            self.confirmed += final.update(
+                status='CONFIRMED', confirmations=head - F('block_number') + 1,
+                confirmed_at=now, updated_at=now,
+            )
+
+        transfers = TokenTransfer.objects.filter(
+            status__in=OPEN_STATUSES, transaction_hash__isnull=False,
+            block_number__lte=depth, confirmed_at__isnull=True,
+        )
+        # Stamped and applied together, so transfers whose apply fails stay unconfirmed and are retried
+        with transaction.atomic():
+            self.failed += transfers.filter(notes=REVERTED).update(status='FAILED', confirmed_at=now, updated_at=now)
+            transfer_ids = list(transfers.values_list('pk', flat=True))
+            if transfer_ids:
+                TokenTransfer.objects.filter(pk__in=transfer_ids).update(confirmed_at=now)
+                summary = apply_transfers(transfer_ids)
+                self.confirmed += summary['applied']
+
+    def _rewind(self, number):
+        """Walk back to the last block we share with the node and un-mine everything after it"""
+        while number in self.block_hashes:
+            block = self.node.call('eth_getBlockByNumber', hex(number), False)
+            if block is not None and block['hash'] == self.block_hashes[number]:
+                break
+            number -= 1
+        fork = number + 1
+        logger.warning('Chain reorg detected; re-scanning from block %d', fork)
+        self.reorgs += 1
+        for stale in [n for n in self.block_hashes if n >= fork]:
+            del self.block_hashes[stale]
+
+        wallet_rows = WalletTransaction.objects.filter(status='PENDING', block_number__gte=fork)
+        token_rows = TokenTransfer.objects.filter(
+            status__in=OPEN_STATUSES, block_number__gte=fork, confirmed_at__isnull=True
+        )
+        with transaction.atomic():
+            self.wallet_pending.update(wallet_rows.values_list('transaction_hash', flat=True))
+            self.token_pending.update(token_rows.values_list('transaction_hash', flat=True))
+            # A reverted receipt from an orphaned block says nothing about the re-included transaction
+            wallet_rows.filter(error_message=REVERTED).update(error_message=None)
+            token_rows.filter(notes=REVERTED).update(notes='')
+            wallet_rows.update(block_number=None, block_hash=None, gas_used=None, confirmations=0)
+            token_rows.update(block_number=None, gas_used=None)
+        self.cursor = fork - 1
+
+    def stats(self):
+        return {
+            'cursor': self.cursor,
+            'pending': len(self.wallet_pending) + len(self.token_pending),
+            'confirmed': self.confirmed,
+            'failed': self.failed,
+            'reorgs': self.reorgs,
+        }
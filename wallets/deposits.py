@@ -0,0 +1,357 @@
+"""
+Incoming-payment detector.
+
+Every native transfer and ERC-20 ``Transfer`` log in a block is checked
+against the addresses we receive on (active ``WalletAddress.address`` and
+``MerchantGateway.wallet_address``). Membership is answered by an
+in-memory Bloom filter, a few bytes per address even at millions of
+addresses, so the database is only asked about the handful of candidates
+that pass it: one query per model per scanned block range, which also
+weeds out the filter's false positives.
+
+The filter is topped up incrementally with addresses created since the
+last refresh and rebuilt from scratch when it outgrows its capacity.
+Deactivated addresses stay in it until the next rebuild; they cost at most
+a database lookup because matches are always confirmed there.
+
+``poll()`` records each match as a ChainDeposit, unique on (transaction
+hash, log index) so a rescan never records a transfer twice, and moves the
+durable ScanCursor in the same transaction, so a restart resumes after the
+last recorded batch. Tokens we issue received on a wallet address also get
+a PENDING ``RECEIVE`` TokenTransfer, handed to the ledger once its block is
+``REQUIRED_CONFIRMATIONS`` deep and still on the canonical chain. Deposits
+whose block was reorged away are dropped (their transfer CANCELLED) and the
+cursor is rewound so the blocks are scanned again.
+"""
+import hashlib
+import logging
+import math
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from merchant.models import MerchantGateway
+from mtt_gateway.rpc import get_node, to_hex, to_int
+from tokens.fixedpoint import token_amount
+from tokens.ledger import OPEN_STATUSES, apply_transfers
+from tokens.models import Token, TokenTransfer
+
+from .hd import to_checksum
+from .models import ChainDeposit, ScanCursor, Wallet, WalletAddress
+
+logger = logging.getLogger('mtt_gateway')
+
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+Transfer = namedtuple(
+    'Transfer', 'block_number block_hash tx_hash log_index token_contract from_address to_address value'
+)
+Deposit = namedtuple('Deposit', Transfer._fields + ('owner_kind', 'owner_id', 'wallet_id'))
+
+
+def _scanner_setting(name, default):
+    return getattr(settings, 'DEPOSIT_SCANNER_SETTINGS', {}).get(name, default)
+
+
+def _addresses(addresses):
+    """Stored addresses may be checksummed or lowercase"""
+    lookup = set()
+    for address in addresses:
+        lookup.update((address.lower(), to_checksum(address)))
+    return lookup
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over lowercase hex addresses. Bit positions come
+    from a salted BLAKE2b digest, so chosen (e.g. vanity) addresses cannot be
+    aimed at the same bits to inflate the false-positive rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._salt = os.urandom(16)
+
+    def _hashes(self, item):
+        # Double hashing: position i is h1 + i * h2
+        digest = hashlib.blake2b(item.encode(), digest_size=16, key=self._salt).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, item):
+        h1, h2 = self._hashes(item)
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        # Probe lazily: almost every non-member is rejected by its first bit or two
+        h1, h2 = self._hashes(item)
+        bits, size = self.bits, self.size
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class AddressFilter:
+    """Bloom filter over every receiving address, refreshed incrementally"""
+
+    def __init__(self, capacity=None, error_rate=None):
+        self.capacity = capacity or _scanner_setting('BLOOM_CAPACITY', 1_000_000)
+        self.error_rate = error_rate or _scanner_setting('BLOOM_ERROR_RATE', 0.001)
+        self.bloom = None
+        self._loaded_since = None
+
+    def _sources(self):
+        return [
+            WalletAddress.objects.filter(is_active=True).values_list('address', flat=True),
+            MerchantGateway.objects.values_list('wallet_address', flat=True),
+        ]
+
+    def refresh(self):
+        """Add addresses created since the last refresh; rebuild when full"""
+        started = timezone.now() - timedelta(seconds=30)  # tolerate late commits
+        if self.bloom is None or self.bloom.count > self.bloom.capacity:
+            capacity = self.capacity
+            if self.bloom is not None:
+                capacity = max(capacity, self.bloom.count * 2)
+            self.bloom, self._loaded_since = BloomFilter(capacity, self.error_rate), None
+        for addresses in self._sources():
+            if self._loaded_since is not None:
+                addresses = addresses.filter(created_at__gte=self._loaded_since)
+            for address in addresses.iterator(chunk_size=10_000):
+                self.bloom.add(address.lower())
+        self._loaded_since = started
+
+    def add(self, address):
+        """Watch an address immediately, without waiting for the next refresh"""
+        self.bloom.add(address.lower())
+
+    def __contains__(self, address):
+        return address is not None and address.lower() in self.bloom
+
+
+class DepositScanner:
+    def __init__(self, node=None, address_filter=None, blocks_per_batch=None, required=None, name='deposits'):
+        self.node = node or get_node()
+        self.filter = address_filter or AddressFilter()
+        self.blocks_per_batch = blocks_per_batch or _scanner_setting('BLOCKS_PER_BATCH', 20)
+        self.required = required or getattr(settings, 'BLOCKCHAIN_SETTINGS', {}).get('REQUIRED_CONFIRMATIONS', 12)
+        self.name = name  # ScanCursor row
+        self.cursor = None  # last block recorded
+        self.scanned = self.candidates = self.false_positives = self.deposits = 0
+        self.recorded = self.confirmed = self.orphaned = 0
+
+    def fetch_transfers(self, first, last):
+        """Native transfers and ERC-20 Transfer logs in blocks first..last, in one round trip"""
+        calls = [('eth_getBlockByNumber', [to_hex(number), True]) for number in range(first, last + 1)]
+        calls.append(('eth_getLogs', [{
+            'fromBlock': to_hex(first), 'toBlock': to_hex(last), 'topics': [TRANSFER_TOPIC],
+        }]))
+        results = self.node.batch(calls)
+        transfers = []
+        for block in results[:-1]:
+            number, block_hash = to_int(block['number']), block['hash']
+            for tx in block['transactions']:
+                value = to_int(tx.get('value') or '0x0')
+                if value and tx.get('to'):
+                    transfers.append(Transfer(
+                        number, block_hash, tx['hash'], None, None, tx.get('from'), tx['to'], value,
+                    ))
+        for log in results[-1]:
+            topics = log['topics']
+            if len(topics) != 3:
+                continue  # ERC-721 transfers index the token id as well
+            transfers.append(Transfer(
+                to_int(log['blockNumber']), log['blockHash'], log['transactionHash'], to_int(log['logIndex']),
+                log['address'], '0x' + topics[1][-40:], '0x' + topics[2][-40:], to_int(log['data'] or '0x0'),
+            ))
+        return transfers
+
+    def match(self, transfers):
+        """Deposits among ``transfers``; the database only sees Bloom positives"""
+        self.scanned += len(transfers)
+        candidates = [transfer for transfer in transfers if transfer.to_address in self.filter]
+        self.candidates += len(candidates)
+        if not candidates:
+            return []
+
+        lookup = _addresses(transfer.to_address for transfer in candidates)
+        owners = {}
+        for pk, wallet_id, address in WalletAddress.objects.filter(
+            address__in=lookup, is_active=True
+        ).values_list('pk', 'wallet_id', 'address'):
+            owners[address.lower()] = ('address', pk, wallet_id)
+        for pk, address in MerchantGateway.objects.filter(wallet_address__in=lookup).values_list(
+            'pk', 'wallet_address'
+        ):
+            owners.setdefault(address.lower(), ('gateway', pk, None))
+
+        deposits = []
+        for transfer in candidates:
+            owner = owners.get(transfer.to_address.lower())
+            if owner is None:
+                self.false_positives += 1
+            else:
+                deposits.append(Deposit(*transfer, *owner))
+        self.deposits += len(deposits)
+        return deposits
+
+    def _batches(self, first, last):
+        for start in range(first, last + 1, self.blocks_per_batch):
+            end = min(start + self.blocks_per_batch - 1, last)
+            yield end, self.match(self.fetch_transfers(start, end))
+
+    def scan(self, first, last):
+        """Deposits in blocks first..last, without recording them"""
+        return [deposit for _, deposits in self._batches(first, last) for deposit in deposits]
+
+    def record(self, deposits):
+        """
+        Store deposits not recorded yet, with a ledger credit for tokens we
+        issue received on a wallet address. Returns the newly stored ones.
+        """
+        if not deposits:
+            return []
+        existing = set(ChainDeposit.objects.filter(
+            transaction_hash__in={deposit.tx_hash for deposit in deposits}
+        ).values_list('transaction_hash', 'log_index'))
+        new = []
+        for deposit in deposits:
+            key = (deposit.tx_hash, -1 if deposit.log_index is None else deposit.log_index)
+            if key not in existing:
+                existing.add(key)
+                new.append(deposit)
+        if not new:
+            return []
+
+        contracts = {deposit.token_contract for deposit in new if deposit.token_contract}
+        tokens = {
+            token.contract_address.lower(): token
+            for token in Token.objects.filter(contract_address__in=_addresses(contracts))
+        } if contracts else {}
+        owners = dict(Wallet.objects.filter(
+            pk__in={deposit.wallet_id for deposit in new if deposit.wallet_id}
+        ).values_list('pk', 'user_id'))
+
+        transfers, rows = [], []
+        for deposit in new:
+            token = tokens.get((deposit.token_contract or '').lower())
+            transfer = None
+            if token is not None and deposit.wallet_id in owners and deposit.value:
+                transfer = TokenTransfer(
+                    token=token,
+                    to_user_id=owners[deposit.wallet_id],
+                    from_address=deposit.from_address,
+                    to_address=deposit.to_address,
+                    amount=token_amount(deposit.value, token),
+                    transfer_type='RECEIVE',
+                    block_number=deposit.block_number,
+                    notes=f'Deposit {deposit.tx_hash}:{deposit.log_index}',
+                )
+                transfers.append(transfer)
+            rows.append(ChainDeposit(
+                transaction_hash=deposit.tx_hash,
+                log_index=-1 if deposit.log_index is None else deposit.log_index,
+                block_number=deposit.block_number,
+                block_hash=deposit.block_hash,
+                token_contract=deposit.token_contract,
+                from_address=deposit.from_address,
+                to_address=deposit.to_address,
+                value=deposit.value,
+                wallet_address_id=deposit.owner_id if deposit.owner_kind == 'address' else None,
+                gateway_id=deposit.owner_id if deposit.owner_kind == 'gateway' else None,
+                transfer=transfer,
+            ))
+        TokenTransfer.objects.bulk_create(transfers)
+        ChainDeposit.objects.bulk_create(rows)
+        self.recorded += len(rows)
+        return new
+
+    def _save_cursor(self, number):
+        ScanCursor.objects.update_or_create(name=self.name, defaults={'block_number': number})
+        self.cursor = number
+
+    def confirm(self, head):
+        """
+        Finalize deposits that reached the required depth, crediting their
+        transfers; drop the ones whose block is no longer canonical
+        """
+        depth = head - self.required + 1
+        due = list(ChainDeposit.objects.filter(status='PENDING', block_number__lte=depth).values_list(
+            'pk', 'block_number', 'block_hash', 'transfer_id'
+        ))
+        if not due:
+            return
+        numbers = sorted({row[1] for row in due})
+        blocks = self.node.batch([('eth_getBlockByNumber', [to_hex(number), False]) for number in numbers])
+        canonical = {number: block and block['hash'] for number, block in zip(numbers, blocks)}
+        final = [row for row in due if canonical[row[1]] == row[2]]
+        orphaned = [row for row in due if canonical[row[1]] != row[2]]
+        now = timezone.now()
+
+        if orphaned:
+            fork = min(row[1] for row in orphaned)
+            logger.warning('%d deposits from before block %d were reorged away; re-scanning', len(orphaned), fork)
+            with transaction.atomic():
+                TokenTransfer.objects.filter(
+                    pk__in=[row[3] for row in orphaned if row[3]], status__in=OPEN_STATUSES
+                ).update(status='CANCELLED', notes='Deposit block reorged away', updated_at=now)
+                ChainDeposit.objects.filter(pk__in=[row[0] for row in orphaned]).delete()
+                self._save_cursor(min(self.cursor, fork - 1))
+            self.orphaned += len(orphaned)
+
+        if final:
+            with transaction.atomic():
+                self.confirmed += ChainDeposit.objects.filter(pk__in=[row[0] for row in final]).update(
+                    status='CONFIRMED', confirmed_at=now,
+                )
+                transfer_ids = [row[3] for row in final if row[3]]
+                if transfer_ids:
+                    TokenTransfer.objects.filter(pk__in=transfer_ids).update(confirmed_at=now)
+                    apply_transfers(transfer_ids)
+
+    def poll(self):
+        """
+        Refresh the filter, record deposits in every block since the stored
+        cursor (the head, the first time) and confirm the ones deep enough.
+        Returns the newly recorded deposits.
+        """
+        self.filter.refresh()
+        head = to_int(self.node.call('eth_blockNumber'))
+        if self.cursor is None:
+            stored = ScanCursor.objects.filter(name=self.name).values_list('block_number', flat=True).first()
+            self.cursor = head - 1 if stored is None else stored
+        recorded = []
+        if head > self.cursor:
+            for end, deposits in self._batches(self.cursor + 1, head):
+                with transaction.atomic():
+                    recorded += self.record(deposits)
+                    self._save_cursor(end)
+        self.confirm(head)
+        return recorded
+
+    def stats(self):
+        return {
+            'cursor': self.cursor,
+            'addresses': self.filter.bloom.count if self.filter.bloom else 0,
+            'filter_bytes': len(self.filter.bloom.bits) if self.filter.bloom else 0,
+            'scanned': self.scanned,
+            'candidates': self.candidates,
+            'false_positives': self.false_positives,
+            'deposits': self.deposits,
+            'recorded': self.recorded,
+            'confirmed': self.confirmed,
+            'orphaned': self.orphaned,
+        }
@@ -0,0 +1,206 @@
+"""
+BIP32 public-key derivation for deposit addresses.
+
+A wallet's ``public_key`` may hold the extended public key (xpub) of its
+receive branch, e.g. m/44'/60'/0'/0. Child addresses are derived from it
+without any private key material, so address pools can be filled by a
+background job that never touches encrypted secrets.
+"""
+import hashlib
+import hmac
+
+from Crypto.Hash import keccak
+
+# secp256k1 domain parameters
+P = 2 ** 256 - 2 ** 32 - 977
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (
+    0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+    0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8,
+)
+
+HARDENED = 0x80000000
+B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+class DerivationError(ValueError):
+    """Raised for malformed extended keys or underivable children"""
+
+
+def _b58decode_check(value):
+    number = 0
+    for char in value:
+        index = B58_ALPHABET.find(char)
+        if index < 0:
+            raise DerivationError('Invalid base58 character')
+        number = number * 58 + index
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    raw = b'\x00' * (len(value) - len(value.lstrip('1'))) + raw
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise DerivationError('Bad extended key checksum')
+    return payload
+
+
+# Jacobian-coordinate point arithmetic; None is the point at infinity
+
+def _to_jacobian(point):
+    return (point[0], point[1], 1)
+
+
+def _from_jacobian(point):
+    if point is None:
+        return None
+    x, y, z = point
+    inverse = pow(z, -1, P)
+    return (x * inverse * inverse % P, y * inverse * inverse * inverse % P)
+
+
+def _double(point):
+    if point is None or point[1] == 0:
+        return None
+    x, y, z = point
+    ysq = y * y % P
+    s = 4 * x * ysq % P
+    m = 3 * x * x % P
+    nx = (m * m - 2 * s) % P
+    ny = (m * (s - nx) - 8 * ysq * ysq) % P
+    return (nx, ny, 2 * y * z % P)
+
+
+def _add(p1, p2):
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    z1sq, z2sq = z1 * z1 % P, z2 * z2 % P
+    u1, u2 = x1 * z2sq % P, x2 * z1sq % P
+    s1, s2 = y1 * z2sq * z2 % P, y2 * z1sq * z1 % P
+    if u1 == u2:
+        return _double(p1) if s1 == s2 else None
+    h, r = u2 - u1, s2 - s1
+    hsq = h * h % P
+    hcu = hsq * h % P
+    nx = (r * r - hcu - 2 * u1 * hsq) % P
+    ny = (r * (u1 * hsq - nx) - s1 * hcu) % P
+    return (nx, ny, h * z1 * z2 % P)
+
+
+def _multiply(point, scalar):
+    result, addend = None, _to_jacobian(point)
+    while scalar:
+        if scalar & 1:
+            result = _add(result, addend)
+        addend = _double(addend)
+        scalar >>= 1
+    return result
+
+
+_G_WINDOW = 8
+_g_table = None
+
+
+def _multiply_g(scalar):
+    """
+    scalar * G from a precomputed table of j * 2^(8i) * G: 32 additions and
+    no doublings, several times faster than ``_multiply`` for key generation
+    and child derivation
+    """
+    global _g_table
+    if _g_table is None:
+        table, base = [], _to_jacobian(G)
+        for _ in range(256 // _G_WINDOW):
+            row, point = [None], None
+            for _ in range((1 << _G_WINDOW) - 1):
+                point = _add(point, base)
+                row.append(point)
+            table.append(row)
+            for _ in range(_G_WINDOW):
+                base = _double(base)
+        _g_table = table
+    result, mask = None, (1 << _G_WINDOW) - 1
+    for row in _g_table:
+        result = _add(result, row[scalar & mask])
+        scalar >>= _G_WINDOW
+    return result
+
+
+def _decompress(key):
+    if len(key) != 33 or key[0] not in (2, 3):
+        raise DerivationError('Expected a compressed public key')
+    x = int.from_bytes(key[1:], 'big')
+    y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+    if y % 2 != key[0] % 2:
+        y = P - y
+    return (x, y)
+
+
+def _compress(point):
+    return bytes([2 + (point[1] & 1)]) + point[0].to_bytes(32, 'big')
+
+
+def parse_xpub(xpub):
+    """Return (public point, chain code) of a serialized extended public key"""
+    payload = _b58decode_check(xpub.strip())
+    if len(payload) != 78:
+        raise DerivationError('Extended key must be 78 bytes')
+    return _decompress(payload[45:]), payload[13:45]
+
+
+def derive_child(point, chain_code, index):
+    """CKDpub: non-hardened child public key and chain code"""
+    if index >= HARDENED:
+        raise DerivationError('Hardened children cannot be derived from a public key')
+    digest = hmac.new(chain_code, _compress(point) + index.to_bytes(4, 'big'), hashlib.sha512).digest()
+    tweak = int.from_bytes(digest[:32], 'big')
+    if tweak >= N:
+        raise DerivationError(f'Invalid child {index}')
+    child = _from_jacobian(_add(_multiply_g(tweak), _to_jacobian(point)))
+    if child is None:
+        raise DerivationError(f'Invalid child {index}')
+    return child, digest[32:]
+
+
+def checksum_address(point):
+    """EIP-55 checksummed Ethereum address of a public point"""
+    digest = keccak.new(digest_bits=256)
+    digest.update(point[0].to_bytes(32, 'big') + point[1].to_bytes(32, 'big'))
+    return to_checksum(digest.hexdigest()[-40:])
+
+
+def to_checksum(address):
+    """EIP-55 form of a hex address, with or without 0x, in any case"""
+    address = address.lower()
+    if address.startswith('0x'):
+        address = address[2:]
+    address_hash = keccak.new(digest_bits=256, data=address.encode()).hexdigest()
+    return '0x' + ''.join(
+        char.upper() if int(address_hash[i], 16) >= 8 else char
+        for i, char in enumerate(address)
+    )
+
+
+def public_point(secret):
+    """Public point of a 32-byte private key"""
+    scalar = int.from_bytes(secret, 'big')
+    if not 0 < scalar < N:
+        raise DerivationError('Private key out of range')
+    return _from_jacobian(_multiply_g(scalar))
+
+
+def uncompressed_hex(point):
+    """0x04-prefixed uncompressed public key, as stored in Wallet.public_key"""
+    return '0x04' + point[0].to_bytes(32, 'big').hex() + point[1].to_bytes(32, 'big').hex()
+
+
+def derive_addresses(xpub, start, count):
+    """Yield (index, address) for ``count`` consecutive children from ``start``"""
+    point, chain_code = parse_xpub(xpub)
+    for index in range(start, start + count):
+        try:
+            child, _ = derive_child(point, chain_code, index)
+        except DerivationError:
+            continue  # BIP32: skip the (astronomically rare) invalid index
+        yield index, checksum_address(child)
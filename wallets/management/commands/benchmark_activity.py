@@ -0,0 +1,44 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mtt_gateway.activity import TouchBuffer
+from wallets.models import Wallet
+
+
+class Command(BaseCommand):
+    help = 'Per-request cost of recording Wallet.last_activity: direct UPDATE vs write-behind touch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--touches', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        wallet_ids = list(Wallet.objects.values_list('id', flat=True)[:1000])
+        if not wallet_ids:
+            self.stderr.write('No wallets to touch')
+            return
+        picks = [random.choice(wallet_ids) for _ in range(options['touches'])]
+
+        started = time.perf_counter()
+        for pk in picks:
+            Wallet.objects.filter(pk=pk).update(last_activity=timezone.now())
+        direct = (time.perf_counter() - started) / len(picks)
+
+        buffer = TouchBuffer()
+        started = time.perf_counter()
+        for pk in picks:
+            buffer.touch('wallet', pk)
+        touched = (time.perf_counter() - started) / len(picks)
+        started = time.perf_counter()
+        rows = buffer.flush()
+        flushed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"direct UPDATE: {direct * 1e6:7.1f} us/request | touch: {touched * 1e6:5.1f} us/request | "
+            f"{direct / touched:,.0f}x"
+        )
+        self.stdout.write(
+            f"one flush wrote {rows} rows for {len(picks)} touches in {flushed * 1000:.1f} ms"
+        )
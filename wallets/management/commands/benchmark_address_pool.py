@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from wallets.address_pool import claim, refill
+from wallets.hd import derive_addresses
+from wallets.models import Wallet, WalletAddress, WalletType
+
+# BIP32 test vector 1, m/0'/1/2'/2
+BENCH_XPUB = (
+    'xpub6FHa3pjLCk84BayeJxFW2SP4XRrFd1JYnxeLeU8EqN3vDfZmbqBqaGJAyiLjTAwm6Z'
+    'LRQUMv1ZACTj37sR62cfN7fe5JnJ7dh8zL4fiyLHV'
+)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measure pooled address claims against inline derive-and-insert'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--claims', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'pool-bench-{run_id}')
+        wallet_type, _ = WalletType.objects.get_or_create(
+            name='Pool Benchmark', defaults={'category': 'CUSTODIAL'}
+        )
+        wallet = Wallet.objects.create(
+            user=user, wallet_type=wallet_type, name='bench',
+            address=f'0x{run_id:0>40}', public_key=BENCH_XPUB,
+        )
+        try:
+            claims, workers = options['claims'], options['workers']
+            started = time.perf_counter()
+            refill(wallet, low_water=claims, target=claims)
+            self.stdout.write(f"pre-derived {claims:,} addresses in {time.perf_counter() - started:.1f}s")
+
+            latencies, claimed = self._run(workers, claims // workers, lambda: claim(wallet.pk))
+            self._report('pooled claim', latencies)
+            if len(set(claimed)) != len(claimed) or None in claimed:
+                self.stdout.write(self.style.ERROR('Duplicate or missing claims'))
+
+            next_index = [claims + 10_000]
+            lock = threading.Lock()
+
+            def inline():
+                with lock:
+                    index = next_index[0]
+                    next_index[0] += 1
+                _, address = next(derive_addresses(BENCH_XPUB, index, 1))
+                return WalletAddress.objects.create(
+                    wallet=wallet, address=address, address_index=index
+                ).pk
+
+            latencies, _ = self._run(workers, min(claims, 400) // workers, inline)
+            self._report('inline derive', latencies)
+        finally:
+            user.delete()
+
+    def _run(self, workers, per_worker, func):
+        latencies, results = [], []
+        lock = threading.Lock()
+
+        def work():
+            local_latencies, local_results = [], []
+            try:
+                for _ in range(per_worker):
+                    started = time.perf_counter()
+                    local_results.append(func())
+                    local_latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                results.extend(local_results)
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, results
+
+    def _report(self, name, latencies):
+        self.stdout.write(
+            f"{name:>14}: p50 {percentile(latencies, 0.50) * 1000:7.3f} ms | "
+            f"p99 {percentile(latencies, 0.99) * 1000:7.3f} ms ({len(latencies):,} allocations)"
+        )
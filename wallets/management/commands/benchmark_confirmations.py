@@ -0,0 +1,105 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mtt_gateway.rpc import LocalNode, to_int
+from wallets.confirmations import ConfirmationTracker
+from wallets.models import Wallet, WalletTransaction, WalletType
+
+GAS_COSTS = [21000, 21000, 21000, 51234, 34512, 62001]
+
+
+class Command(BaseCommand):
+    help = 'Measure confirmations/sec of the block tracker against per-hash receipt polling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=20_000)
+        parser.add_argument('--per-block', type=int, default=200, help='Tracked transactions per block')
+        parser.add_argument('--noise', type=int, default=150, help='Untracked transactions per block')
+        parser.add_argument('--rtt-ms', type=float, default=2.0, help='Simulated RPC round-trip time')
+        parser.add_argument('--baseline', type=int, default=2000, help='Transactions for the per-hash baseline')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'confirm-bench-{run_id}')
+        wallet_type, _ = WalletType.objects.get_or_create(
+            name='Confirmation Benchmark', defaults={'category': 'CUSTODIAL'}
+        )
+        wallet = Wallet.objects.create(
+            user=user, wallet_type=wallet_type, name='bench', address=f'0x{run_id:0>40}',
+        )
+        try:
+            rtt = options['rtt_ms'] / 1000
+            self._tracker(wallet, run_id, options, rtt)
+            self._baseline(wallet, run_id, options, rtt)
+        finally:
+            user.delete()
+
+    def _create(self, wallet, prefix, count):
+        hashes = [f'0x{prefix}{i:0>{64 - len(prefix)}x}' for i in range(count)]
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(
+                wallet=wallet, transaction_hash=tx_hash, from_address=wallet.address,
+                to_address='0x' + '1' * 40, amount=Decimal('1'), transaction_type='SEND',
+            )
+            for tx_hash in hashes
+        ], batch_size=2000)
+        return hashes
+
+    def _mine(self, node, hashes, per_block, noise, required):
+        for start in range(0, len(hashes), per_block):
+            # Plain sends plus token transfers of a few distinct gas costs
+            txs = [
+                {'hash': tx_hash, 'gasUsed': GAS_COSTS[i % len(GAS_COSTS)]}
+                for i, tx_hash in enumerate(hashes[start:start + per_block])
+            ]
+            txs += [{'hash': f'0x{uuid.uuid4().hex:0>64}'} for _ in range(noise)]
+            node.chain.mine(txs)
+        node.chain.mine(count=required)
+
+    def _tracker(self, wallet, run_id, options, rtt):
+        node = LocalNode(latency=rtt)
+        tracker = ConfirmationTracker(node=node)
+        tracker.poll()  # start following at the current head
+        hashes = self._create(wallet, f'a{run_id}', options['transactions'])
+        self._mine(node, hashes, options['per_block'], options['noise'], tracker.required)
+
+        node.round_trips = 0
+        started = time.perf_counter()
+        tracker.poll()
+        elapsed = time.perf_counter() - started
+        confirmed = WalletTransaction.objects.filter(
+            transaction_hash__in=hashes, status='CONFIRMED'
+        ).count()
+        blocks = to_int(node.call('eth_blockNumber'))
+        self.stdout.write(
+            f"tracker : {confirmed:,}/{len(hashes):,} confirmed over {blocks} blocks in {elapsed:.2f}s "
+            f"= {confirmed / elapsed:,.0f} confirmations/sec ({node.round_trips} RPC round trips)"
+        )
+
+    def _baseline(self, wallet, run_id, options, rtt):
+        node = LocalNode(latency=rtt)
+        hashes = self._create(wallet, f'b{run_id}', options['baseline'])
+        self._mine(node, hashes, options['per_block'], options['noise'], 12)
+        head = to_int(node.call('eth_blockNumber'))
+
+        node.round_trips = 0
+        started = time.perf_counter()
+        confirmed = 0
+        for tx_hash in hashes:
+            receipt = node.call('eth_getTransactionReceipt', tx_hash)
+            block_number = to_int(receipt['blockNumber'])
+            confirmed += WalletTransaction.objects.filter(transaction_hash=tx_hash, status='PENDING').update(
+                block_number=block_number, block_hash=receipt['blockHash'],
+                gas_used=to_int(receipt['gasUsed']), confirmations=head - block_number + 1,
+                status='CONFIRMED', confirmed_at=timezone.now(),
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"per-hash: {confirmed:,}/{len(hashes):,} confirmed in {elapsed:.2f}s "
+            f"= {confirmed / elapsed:,.0f} confirmations/sec ({node.round_trips} RPC round trips)"
+        )
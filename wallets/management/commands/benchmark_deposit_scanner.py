@@ -0,0 +1,108 @@
+import os
+import random
+import sys
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from merchant.models import MerchantGateway
+from mtt_gateway.rpc import LocalNode
+from wallets.deposits import TRANSFER_TOPIC, AddressFilter, DepositScanner
+from wallets.models import Wallet, WalletAddress, WalletType
+
+
+def random_address():
+    return '0x' + os.urandom(20).hex()
+
+
+class Command(BaseCommand):
+    help = 'Scan synthetic blocks of transfers with the Bloom-fronted detector vs per-transfer lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--addresses', type=int, default=1_000_000, help='Watched addresses in the filter')
+        parser.add_argument('--stored', type=int, default=5000, help='Watched addresses actually in the database')
+        parser.add_argument('--blocks', type=int, default=5)
+        parser.add_argument('--transfers', type=int, default=10_000, help='Transfers per block')
+        parser.add_argument('--deposit-ratio', type=float, default=0.002)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'deposit-bench-{run_id}')
+        wallet_type, _ = WalletType.objects.get_or_create(
+            name='Deposit Benchmark', defaults={'category': 'CUSTODIAL'}
+        )
+        wallet = Wallet.objects.create(
+            user=user, wallet_type=wallet_type, name='bench', address=f'0x{run_id:0>40}',
+        )
+        try:
+            stored = [random_address() for _ in range(options['stored'])]
+            WalletAddress.objects.bulk_create(
+                [WalletAddress(wallet=wallet, address=address) for address in stored], batch_size=2000
+            )
+            self._run(stored, options)
+        finally:
+            user.delete()
+
+    def _run(self, stored, options):
+        rng = random.Random(11)
+        started = time.perf_counter()
+        address_filter = AddressFilter(capacity=options['addresses'])
+        address_filter.refresh()
+        for _ in range(options['addresses'] - address_filter.bloom.count):
+            address_filter.add(random_address())
+        self.stdout.write(
+            f"filter: {address_filter.bloom.count:,} addresses in {len(address_filter.bloom.bits) / 2**20:.1f} MiB "
+            f"(a set of the same strings is ~{self._set_size(options['addresses']) / 2**20:.0f} MiB), "
+            f"built in {time.perf_counter() - started:.1f}s"
+        )
+
+        node = LocalNode()
+        token_contract = random_address()
+        for _ in range(options['blocks']):
+            txs = []
+            for i in range(options['transfers']):
+                to = rng.choice(stored) if rng.random() < options['deposit_ratio'] else random_address()
+                tx_hash = f'0x{uuid.uuid4().hex:0>64}'
+                if i % 2:
+                    txs.append({'hash': tx_hash, 'from': random_address(), 'to': to, 'value': hex(10 ** 16)})
+                else:
+                    txs.append({'hash': tx_hash, 'from': random_address(), 'to': token_contract, 'value': '0x0',
+                                'logs': [{'address': token_contract, 'data': hex(10 ** 18), 'topics': [
+                                    TRANSFER_TOPIC, '0x' + random_address()[2:].rjust(64, '0'),
+                                    '0x' + to[2:].rjust(64, '0'),
+                                ]}]})
+            node.chain.mine(txs)
+
+        scanner = DepositScanner(node=node, address_filter=address_filter, blocks_per_batch=1)
+        blocks = range(1, options['blocks'] + 1)
+        fetched = [scanner.fetch_transfers(number, number) for number in blocks]
+
+        started = time.perf_counter()
+        deposits = sum(len(scanner.match(transfers)) for transfers in fetched)
+        filtered = (time.perf_counter() - started) / len(fetched)
+        stats = scanner.stats()
+        self.stdout.write(
+            f"bloom   : {filtered * 1000:7.1f} ms/block, {deposits} deposits, "
+            f"{stats['false_positives']} false positives in {stats['scanned']:,} transfers"
+        )
+
+        started = time.perf_counter()
+        found = 0
+        for transfer in fetched[0]:
+            found += WalletAddress.objects.filter(address=transfer.to_address).exists() or \
+                MerchantGateway.objects.filter(wallet_address=transfer.to_address).exists()
+        lookup = time.perf_counter() - started
+        self.stdout.write(f"per-row : {lookup * 1000:7.1f} ms/block ({len(fetched[0]) * 2:,} queries) "
+                          f"| {lookup / filtered:.0f}x")
+
+        started = time.perf_counter()
+        scanner.scan(1, options['blocks'])
+        self.stdout.write(
+            f"end-to-end incl. stand-in RPC decode: {(time.perf_counter() - started) * 1000 / len(fetched):.1f} ms/block"
+        )
+
+    def _set_size(self, count):
+        sample = random_address()
+        return count * (sys.getsizeof(sample) + 16) + sys.getsizeof(set(range(1000))) * count // 1000
@@ -0,0 +1,67 @@
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from mtt_gateway.gas import GasOracle
+from mtt_gateway.rpc import GWEI, LocalNode, to_int
+
+ERC20_TRANSFER = '0xa9059cbb'
+
+
+class Command(BaseCommand):
+    help = 'Price pending sends with the cached, batched gas oracle vs per-send RPC calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sends', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=100, help='Sends priced per oracle call')
+        parser.add_argument('--token-ratio', type=float, default=0.3, help='Share of sends that call a contract')
+        parser.add_argument('--rtt-ms', type=float, default=2.0, help='Simulated RPC round-trip time')
+
+    def handle(self, *args, **options):
+        rng = random.Random(5)
+        node = LocalNode()
+        for _ in range(30):
+            node.chain.mine([
+                {'hash': '0x' + os.urandom(32).hex(), 'gasUsed': rng.choice([21000, 52000, 180000]),
+                 'maxPriorityFeePerGas': hex(int(rng.uniform(0.5, 5) * GWEI))}
+                for _ in range(rng.randint(50, 250))
+            ])
+        token = '0x' + os.urandom(20).hex()
+        sends = []
+        for _ in range(options['sends']):
+            recipient = os.urandom(20).hex()
+            if rng.random() < options['token_ratio']:
+                data = ERC20_TRANSFER + recipient.rjust(64, '0') + hex(rng.randint(1, 10 ** 20))[2:].rjust(64, '0')
+                sends.append({'to': token, 'data': data})
+            else:
+                sends.append({'to': '0x' + recipient, 'value': hex(10 ** 16)})
+        node.latency = options['rtt_ms'] / 1000
+
+        oracle = GasOracle(node=node, window=12)
+        node.round_trips = 0
+        started = time.perf_counter()
+        size = options['batch_size']
+        for start in range(0, len(sends), size):
+            oracle.estimate(sends[start:start + size])
+        self._report('oracle', started, node, len(sends))
+        fees = oracle.suggestions()
+        self.stdout.write(
+            f"          base fee {fees['base_fee'] / GWEI:.2f} gwei, tips "
+            + ', '.join(f"{speed} {fees[speed]['max_priority_fee'] / GWEI:.2f}" for speed in ('slow', 'standard', 'fast'))
+        )
+
+        node.round_trips = 0
+        started = time.perf_counter()
+        for send in sends:
+            to_int(node.call('eth_gasPrice'))
+            to_int(node.call('eth_estimateGas', send))
+        self._report('per-send', started, node, len(sends))
+
+    def _report(self, name, started, node, count):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{name:>9}: {count / elapsed:8,.0f} sends priced/sec, "
+            f"{node.round_trips / count:.3f} RPC round trips per send"
+        )
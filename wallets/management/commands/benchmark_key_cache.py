@@ -0,0 +1,46 @@
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from mtt_gateway import keystore
+
+
+class Command(BaseCommand):
+    help = 'Measure cached custodial key borrows against decrypting on every use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=200)
+        parser.add_argument('--signatures', type=int, default=50_000)
+
+    def handle(self, *args, **options):
+        count, signatures = options['wallets'], options['signatures']
+        ciphertexts = {str(i): keystore.encrypt_secret(os.urandom(32)) for i in range(count)}
+        rng = random.Random(7)
+        # Settlement traffic concentrates on a few busy gateways
+        picks = [str(min(int(rng.paretovariate(1.2)) - 1, count - 1)) for _ in range(signatures)]
+
+        cache = keystore.KeyCache(max_entries=max(count // 4, 1), ttl=300)
+        started = time.perf_counter()
+        for pk in picks:
+            with cache.lease(('wallet', pk), ciphertexts[pk]) as key:
+                key[0]
+        cached = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for pk in picks:
+            key = keystore._decrypt(ciphertexts[pk])
+            key[0]
+            keystore._zero(key)
+        uncached = time.perf_counter() - started
+
+        stats = cache.stats()
+        self.stdout.write(f"{signatures:,} borrows over {count} keys, cache size {cache.max_entries}")
+        self.stdout.write(
+            f"cached {cached * 1e6 / signatures:6.1f} us/borrow | "
+            f"decrypt {uncached * 1e6 / signatures:6.1f} us/borrow | {uncached / cached:5.1f}x"
+        )
+        self.stdout.write(
+            f"hit rate {stats['hit_rate']:.2%}, evictions {stats['evictions']}"
+        )
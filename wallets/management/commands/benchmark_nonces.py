@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from mtt_gateway.rpc import LocalNode, RpcError, encode_local_tx, to_int
+from wallets.models import AddressNonce, BroadcastNonce
+from wallets.nonces import broadcast, reserve
+
+
+class Command(BaseCommand):
+    help = 'Parallel sends from one hot wallet: nonce allocator vs asking the node per send'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--sends', type=int, default=400)
+        parser.add_argument('--rtt-ms', type=float, default=2.0, help='Simulated RPC round-trip time')
+
+    def handle(self, *args, **options):
+        rtt = options['rtt_ms'] / 1000
+        for name, send in (('allocator', self._allocated_send), ('per-send', self._node_send)):
+            address = '0x' + os.urandom(20).hex()
+            node = LocalNode(latency=rtt)
+            retries = [0]
+            elapsed = self._run(options['workers'], options['sends'], lambda: send(node, address, retries))
+            node.latency = 0
+            node.chain.mine()
+            mined = to_int(node.call('eth_getTransactionCount', address, 'latest'))
+            self.stdout.write(
+                f"{name:>9}: {options['sends'] / elapsed:7.0f} sends/sec, {retries[0]} nonce collisions retried, "
+                f"{mined} of {options['sends']} mined in the next block"
+            )
+            AddressNonce.objects.filter(address=address).delete()
+            BroadcastNonce.objects.filter(address=address).delete()
+
+    def _allocated_send(self, node, address, retries):
+        nonce, = reserve(address, node=node)
+        tx_hash = node.call('eth_sendRawTransaction', encode_local_tx(
+            {'from': address, 'nonce': hex(nonce), 'to': '0x' + '2' * 40, 'value': '0x1'}
+        ))
+        broadcast(address, nonce, tx_hash)
+
+    def _node_send(self, node, address, retries):
+        while True:
+            nonce = to_int(node.call('eth_getTransactionCount', address, 'pending'))
+            try:
+                node.call('eth_sendRawTransaction', encode_local_tx(
+                    {'from': address, 'nonce': hex(nonce), 'to': '0x' + '2' * 40, 'value': '0x1'}
+                ))
+                return
+            except RpcError:
+                retries[0] += 1
+
+    def _run(self, workers, sends, send):
+        per_worker = sends // workers
+
+        def work():
+            try:
+                for _ in range(per_worker):
+                    send()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
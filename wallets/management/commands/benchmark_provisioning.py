@@ -0,0 +1,63 @@
+import os
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from mtt_gateway import keystore
+from wallets import hd
+from wallets.models import Wallet, WalletAddress, WalletType
+from wallets.provisioning import provision
+
+
+class Command(BaseCommand):
+    help = 'Bulk wallet provisioning vs creating wallets one save() at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--baseline', type=int, default=500, help='Wallets created one at a time')
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        wallet_type, _ = WalletType.objects.get_or_create(name='Custodial', defaults={'category': 'CUSTODIAL'})
+        User.objects.bulk_create([User(username=f'provision-bench-{run_id}-{i}') for i in range(options['users'])])
+        users = list(User.objects.filter(username__startswith=f'provision-bench-{run_id}-').values_list('id', flat=True))
+        try:
+            started = time.perf_counter()
+            for i in range(options['baseline']):
+                secret = os.urandom(32)
+                point = hd.public_point(secret)
+                wallet = Wallet.objects.create(
+                    user_id=users[i % len(users)], wallet_type=wallet_type, name=f'baseline {i}',
+                    address=hd.checksum_address(point), public_key=hd.uncompressed_hex(point),
+                    private_key_encrypted=keystore.encrypt_secret(secret), is_primary=i < len(users),
+                )
+                WalletAddress.objects.create(wallet=wallet, address=wallet.address, label='default', address_index=0)
+            per_save = options['baseline'] / (time.perf_counter() - started)
+
+            specs = [
+                {'user_id': users[i % len(users)], 'name': f'bulk {i}', 'wallet_type_id': wallet_type.pk,
+                 'is_primary': i < len(users)}
+                for i in range(options['wallets'])
+            ]
+            started = time.perf_counter()
+            summary = provision(specs, workers=options['workers'])
+            bulk = summary['created'] / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            resumed = provision(specs, workers=options['workers'])
+            resume_seconds = time.perf_counter() - started
+
+            primaries = Wallet.objects.filter(user_id__in=users, is_primary=True).count()
+            self.stdout.write(f"one at a time: {per_save:8,.0f} wallets/sec ({options['baseline']} wallets)")
+            self.stdout.write(f"         bulk: {bulk:8,.0f} wallets/sec ({summary['created']} wallets)")
+            self.stdout.write(
+                f"re-run skipped {resumed['skipped']} existing wallets in {resume_seconds:.2f}s; "
+                f"{primaries} primaries for {len(users)} users; "
+                f"100k wallets would take about {100_000 / bulk / 60:.1f} min"
+            )
+        finally:
+            User.objects.filter(pk__in=users).delete()
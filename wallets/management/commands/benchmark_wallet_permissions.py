@@ -0,0 +1,63 @@
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from wallets import permissions
+from wallets.models import Wallet, WalletPermission
+
+
+class Command(BaseCommand):
+    help = 'Queries and time per wallet-heavy request: cached permission resolver vs a lookup per check'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to check as (default: the non-staff user with most wallets)')
+        parser.add_argument('--wallets', type=int, default=200, help='Wallet checks per request')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.get(username=options['user'])
+        else:
+            user = User.objects.filter(is_staff=False, wallets__isnull=False).order_by('-id').first()
+        if user is None:
+            self.stderr.write('No non-staff user with wallets to check as')
+            return
+        wallet_ids = list(Wallet.objects.values_list('id', flat=True)[:options['wallets']])
+        requests = options['requests']
+
+        baseline = self._run(requests, lambda: [self._check_directly(user, pk) for pk in wallet_ids])
+        cache = permissions.get_cache()
+        cache.invalidate(user.pk)
+
+        def resolved():
+            request = SimpleNamespace(user=user)
+            return [permissions.has_wallet_permission(request, pk, 'READ') for pk in wallet_ids]
+
+        cached = self._run(requests, resolved)
+        stats = cache.stats()
+        self.stdout.write(f"{requests} requests as {user.username}, {len(wallet_ids)} wallet checks each")
+        for name, (elapsed, queries) in (('per-check', baseline), ('resolver', cached)):
+            self.stdout.write(
+                f"{name:>9}: {queries / requests:7.2f} queries/request, {elapsed * 1000 / requests:7.2f} ms/request"
+            )
+        self.stdout.write(f"cache hit rate {stats['hit_rate']:.2%}")
+
+    def _check_directly(self, user, wallet_id):
+        return Wallet.objects.filter(pk=wallet_id, user=user).exists() or WalletPermission.objects.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()),
+            wallet_id=wallet_id, user=user, is_active=True,
+        ).exists()
+
+    def _run(self, requests, handle):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(requests):
+                handle()
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries)
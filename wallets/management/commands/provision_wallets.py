@@ -0,0 +1,46 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallets.provisioning import provision, specs_from_rows
+
+
+class Command(BaseCommand):
+    help = 'Create wallets in bulk from a CSV file; re-run the same file to resume after a failure'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='CSV with a header: username, name and optionally wallet_type, is_primary, '
+                 'is_merchant, is_gateway, status, address, public_key',
+        )
+        parser.add_argument('--wallet-type', help='Wallet type name for rows without one')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None, help='Key derivation processes')
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='') as source:
+            specs, errors = specs_from_rows(csv.DictReader(source), options['wallet_type'])
+        if errors:
+            for number, message in errors[:20]:
+                self.stderr.write(f'Row {number}: {message}')
+            raise CommandError(f'{len(errors)} invalid rows; nothing was provisioned')
+
+        started = time.perf_counter()
+
+        def progress(summary):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"chunk {summary['chunks']}: {summary['created']} created, {summary['skipped']} already existed "
+                f"({summary['created'] / elapsed:,.0f} wallets/sec)"
+            )
+
+        try:
+            summary = provision(specs, options['chunk_size'], options['workers'], progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            f"Provisioned {summary['created']} wallets ({summary['skipped']} already existed) "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
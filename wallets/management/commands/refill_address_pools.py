@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallets.address_pool import refill_all
+
+
+class Command(BaseCommand):
+    help = 'Derive deposit addresses for every wallet pool below its low-water mark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--low-water', type=int, default=None)
+        parser.add_argument('--target', type=int, default=None)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, refilling every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            added = refill_all(options['low_water'], options['target'])
+            self.stdout.write(
+                f"Derived {sum(added.values())} addresses across {len(added)} wallets"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallets.nonces import resync_all
+
+
+class Command(BaseCommand):
+    help = 'Reconcile allocated nonces of every sending address with the node'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help='Idle seconds before unbroadcast nonces are reclaimed')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, resyncing every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            summaries = resync_all(stale_after=options['stale_after'])
+            drifted = [s for s in summaries if s['advanced'] or s['rewound'] or s['released']]
+            self.stdout.write(f"Resynced {len(summaries)} addresses, {len(drifted)} had drifted")
+            for summary in drifted:
+                self.stdout.write(
+                    f"  {summary['address']}: next {summary['next_nonce']} "
+                    f"(advanced {summary['advanced']}, rewound {summary['rewound']}, "
+                    f"released {summary['released']})"
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallets.deposits import DepositScanner
+
+
+class Command(BaseCommand):
+    help = 'Record transfers to our wallet and gateway addresses in new blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-block', type=int, default=None, help='Start here instead of after the stored cursor')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, scanning every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        scanner = DepositScanner()
+        if options['from_block'] is not None:
+            scanner.cursor = options['from_block'] - 1
+        while True:
+            for deposit in scanner.poll():
+                self.stdout.write(
+                    f"Recorded deposit {deposit.value} {deposit.token_contract or 'ETH'} to {deposit.to_address} "
+                    f"({deposit.owner_kind} {deposit.owner_id}) in {deposit.tx_hash}"
+                )
+            stats = scanner.stats()
+            self.stdout.write(
+                f"Block {stats['cursor']}: {stats['scanned']} transfers scanned, "
+                f"{stats['recorded']} deposits recorded, {stats['confirmed']} confirmed, "
+                f"{stats['orphaned']} reorged away, {stats['false_positives']} filter false positives"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
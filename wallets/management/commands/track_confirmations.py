@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallets.confirmations import ConfirmationTracker
+
+
+class Command(BaseCommand):
+    help = 'Follow new blocks and confirm pending wallet transactions and token transfers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--required', type=int, default=None, help='Confirmations before a tx is final')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, polling every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        tracker = ConfirmationTracker(required=options['required'])
+        while True:
+            head = tracker.poll()
+            stats = tracker.stats()
+            self.stdout.write(
+                f"Head {head}: {stats['confirmed']} confirmed, {stats['failed']} failed, "
+                f"{stats['pending']} awaiting inclusion"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
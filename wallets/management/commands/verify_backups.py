@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wallets.backups import verify
+
+
+class Command(BaseCommand):
+    help = 'Check WalletBackup checksums in parallel; mismatches raise SystemAlerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Re-verify backups last verified more than N days ago (default: REVERIFY_DAYS)')
+        parser.add_argument('--all', action='store_true', help='Verify every backup')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None, help='Hashing processes')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, verifying every N seconds',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'BACKUP_VERIFY_SETTINGS', {}).get('REVERIFY_DAYS', 7)
+        while True:
+            summary = verify(None if options['all'] else days, options['chunk_size'], options['workers'])
+            self.stdout.write(
+                f"Verified {summary['backups']} backups ({summary['mismatched']} mismatched), "
+                f"{summary['bytes'] / 2 ** 20:.1f} MiB in {summary['seconds']:.2f}s: "
+                f"{summary['mb_per_second']:.1f} MB/s"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0002_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='walletaddress',
+            name='allocated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='walletaddress',
+            name='is_allocated',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='walletaddress',
+            index=models.Index(condition=models.Q(('is_allocated', False)), fields=['wallet', 'address_index'], name='wallets_address_pool_idx'),
+        ),
+    ]
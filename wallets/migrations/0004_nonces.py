@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0003_address_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressNonce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=42, unique=True)),
+                ('next_nonce', models.PositiveBigIntegerField(default=0)),
+                ('synced_nonce', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('reserved_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'wallets_address_nonce',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReleasedNonce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=42)),
+                ('nonce', models.PositiveBigIntegerField()),
+                ('released_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'wallets_released_nonce',
+                'unique_together': {('address', 'nonce')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0004_nonces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastNonce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=42)),
+                ('nonce', models.PositiveBigIntegerField()),
+                ('transaction_hash', models.CharField(max_length=66)),
+                ('broadcast_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'wallets_broadcast_nonce',
+                'unique_together': {('address', 'nonce')},
+            },
+        ),
+    ]
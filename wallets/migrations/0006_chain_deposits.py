@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import tokens.fixedpoint
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tokens', '0005_keyset_index'),
+        ('merchant', '0005_settlement_attempt'),
+        ('wallets', '0005_broadcast_nonces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'wallets_scan_cursor',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChainDeposit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_hash', models.CharField(max_length=66)),
+                ('log_index', models.IntegerField(default=-1)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('block_hash', models.CharField(max_length=66)),
+                ('token_contract', models.CharField(blank=True, max_length=42, null=True)),
+                ('from_address', models.CharField(blank=True, max_length=42, null=True)),
+                ('to_address', models.CharField(max_length=42)),
+                ('value', tokens.fixedpoint.WeiAmountField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed')], default='PENDING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True)),
+                ('gateway', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='merchant.merchantgateway')),
+                ('transfer', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deposit', to='tokens.tokentransfer')),
+                ('wallet_address', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='wallets.walletaddress')),
+            ],
+            options={
+                'db_table': 'wallets_chain_deposit',
+                'indexes': [models.Index(fields=['status', 'block_number'], name='wallets_cha_status_d99df6_idx')],
+                'unique_together': {('transaction_hash', 'log_index')},
+            },
+        ),
+    ]
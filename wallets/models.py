@@ -4,6 +4,8 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 import uuid
 
+from tokens.fixedpoint import WeiAmountField
+
 class WalletType(models.Model):
     """Wallet type definitions (custodial, non-custodial, etc.)"""
     WALLET_CATEGORIES = [
@@ -101,6 +103,8 @@ class WalletAddress(models.Model):
     address_index = models.PositiveIntegerField(null=True, blank=True)
     used_count = models.PositiveIntegerField(default=0)
     last_used = models.DateTimeField(null=True, blank=True)
+    is_allocated = models.BooleanField(default=True)  # False while waiting in the pre-derived pool
+    allocated_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -109,6 +113,11 @@ class WalletAddress(models.Model):
             models.Index(fields=['wallet', 'is_active']),
             models.Index(fields=['address']),
             models.Index(fields=['is_change_address']),
+            models.Index(
+                fields=['wallet', 'address_index'],
+                name='wallets_address_pool_idx',
+                condition=models.Q(is_allocated=False),
+            ),
         ]
     
     def __str__(self):
@@ -165,6 +174,7 @@ class WalletTransaction(models.Model):
     class Meta:
         db_table = 'wallets_transaction'
         indexes = [
+            models.Index(fields=['created_at', 'id']),  # keyset pagination
             models.Index(fields=['wallet', 'created_at']),
             models.Index(fields=['transaction_hash']),
             models.Index(fields=['status', 'created_at']),
@@ -241,3 +251,95 @@ class WalletPermission(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.wallet.name} ({self.permission_type})"
+
+class AddressNonce(models.Model):
+    """Next transaction nonce to hand out for a sending address"""
+    address = models.CharField(max_length=42, unique=True)
+    next_nonce = models.PositiveBigIntegerField(default=0)
+    synced_nonce = models.PositiveBigIntegerField(null=True, blank=True)  # node's pending count at last sync
+    synced_at = models.DateTimeField(null=True, blank=True)
+    reserved_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'wallets_address_nonce'
+    
+    def __str__(self):
+        return f"{self.address[:10]}... next {self.next_nonce}"
+
+class ReleasedNonce(models.Model):
+    """Reserved nonce that was never broadcast; handed out again before fresh ones"""
+    address = models.CharField(max_length=42)
+    nonce = models.PositiveBigIntegerField()
+    released_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'wallets_released_nonce'
+        unique_together = ['address', 'nonce']
+    
+    def __str__(self):
+        return f"{self.address[:10]}... nonce {self.nonce}"
+
+class BroadcastNonce(models.Model):
+    """Reserved nonce whose transaction reached the node; kept until the node's pending count passes it"""
+    address = models.CharField(max_length=42)
+    nonce = models.PositiveBigIntegerField()
+    transaction_hash = models.CharField(max_length=66)
+    broadcast_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'wallets_broadcast_nonce'
+        unique_together = ['address', 'nonce']
+    
+    def __str__(self):
+        return f"{self.address[:10]}... nonce {self.nonce} ({self.transaction_hash[:10]}...)"
+
+class ChainDeposit(models.Model):
+    """Transfer to one of our receiving addresses, recorded once per (transaction hash, log index)"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('CONFIRMED', 'Confirmed'),
+    ]
+    
+    transaction_hash = models.CharField(max_length=66)
+    log_index = models.IntegerField(default=-1)  # -1 for the transaction's own (native) value
+    block_number = models.PositiveBigIntegerField()
+    block_hash = models.CharField(max_length=66)
+    token_contract = models.CharField(max_length=42, null=True, blank=True)  # None for native ETH
+    from_address = models.CharField(max_length=42, null=True, blank=True)
+    to_address = models.CharField(max_length=42)
+    value = WeiAmountField()
+    wallet_address = models.ForeignKey(WalletAddress, on_delete=models.SET_NULL, null=True, blank=True)
+    gateway = models.ForeignKey('merchant.MerchantGateway', on_delete=models.SET_NULL, null=True, blank=True)
+    transfer = models.OneToOneField(
+        'tokens.TokenTransfer',
+        on_delete=models.SET_NULL,
+        related_name='deposit',
+        null=True,
+        blank=True
+    )  # ledger credit, for tokens we issue received on a wallet address
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'wallets_chain_deposit'
+        unique_together = ['transaction_hash', 'log_index']
+        indexes = [
+            models.Index(fields=['status', 'block_number']),
+        ]
+    
+    def __str__(self):
+        return f"{self.value} {self.token_contract or 'ETH'} to {self.to_address[:10]}... ({self.status})"
+
+class ScanCursor(models.Model):
+    """Last block a chain scanner has fully processed, so a restart resumes where it stopped"""
+    name = models.CharField(max_length=50, unique=True)
+    block_number = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'wallets_scan_cursor'
+    
+    def __str__(self):
+        return f"{self.name} at block {self.block_number}"
@@ -0,0 +1,196 @@
+"""
+Per-address transaction nonces for custodial sends.
+
+``reserve()`` hands out nonces for a sending address without asking the
+node: released nonces are reused lowest-first, then fresh ones are taken by
+bumping ``AddressNonce.next_nonce`` in a single ``UPDATE ... RETURNING``,
+so any number of workers can sign for one hot wallet in parallel and put
+many transactions into the same block.
+
+A sender whose broadcast fails permanently must ``release()`` its nonce,
+otherwise every later transaction from the address is stuck behind the gap;
+one whose broadcast succeeds must record it with ``broadcast()``.
+``resync()`` (run periodically by ``resync_nonces``) reconciles with the
+node's view: it jumps ahead past transactions sent from elsewhere, drops
+released nonces the chain has since used, and recovers nonces that were
+reserved but never reached the node (e.g. after a crash between reserve
+and broadcast) once the address has been idle for ``NONCE_STALE_SECONDS``.
+
+The node's pending count stops at the first gap, so a transaction queued
+behind one looks unused to it. Recorded broadcasts and the nonces of
+PENDING WalletTransactions therefore count as in flight and are never
+handed out again, unless the node no longer knows the recorded
+transaction (it was dropped from the mempool).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from mtt_gateway.rpc import get_node, to_int
+
+from .hd import to_checksum
+from .models import AddressNonce, BroadcastNonce, ReleasedNonce, WalletTransaction
+
+logger = logging.getLogger('mtt_gateway')
+
+
+def _chain_setting(name, default):
+    return getattr(settings, 'BLOCKCHAIN_SETTINGS', {}).get(name, default)
+
+
+def _claim_released(address, count):
+    table = ReleasedNonce._meta.db_table
+    skip_locked = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE address = %s '
+            f'ORDER BY nonce LIMIT %s{skip_locked}) RETURNING nonce',
+            [address, count],
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def _bump(address, count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {AddressNonce._meta.db_table} SET next_nonce = next_nonce + %s, reserved_at = %s '
+            f'WHERE address = %s RETURNING next_nonce',
+            [count, AddressNonce._meta.get_field('reserved_at').get_db_prep_value(timezone.now(), connection),
+             address],
+        )
+        row = cursor.fetchone()
+    return None if row is None else list(range(row[0] - count, row[0]))
+
+
+def _initialize(address, node):
+    """Start tracking an address at the node's pending transaction count"""
+    pending = to_int((node or get_node()).call('eth_getTransactionCount', address, 'pending'))
+    try:
+        with transaction.atomic():
+            AddressNonce.objects.get_or_create(
+                address=address,
+                defaults={'next_nonce': pending, 'synced_nonce': pending, 'synced_at': timezone.now()},
+            )
+    except IntegrityError:
+        pass  # another worker initialized it first
+
+
+def reserve(address, count=1, node=None):
+    """Reserve ``count`` nonces for ``address``; returns them in ascending order"""
+    address = address.lower()
+    with transaction.atomic():
+        nonces = _claim_released(address, count)
+        if len(nonces) < count:
+            fresh = _bump(address, count - len(nonces))
+            if fresh is None:
+                _initialize(address, node)
+                fresh = _bump(address, count - len(nonces))
+            nonces += fresh
+    return nonces
+
+
+def release(address, nonces):
+    """Return nonces whose transactions were never accepted by the node"""
+    if isinstance(nonces, int):
+        nonces = [nonces]
+    ReleasedNonce.objects.bulk_create(
+        [ReleasedNonce(address=address.lower(), nonce=nonce) for nonce in nonces],
+        ignore_conflicts=True,
+    )
+
+
+def broadcast(address, nonce, transaction_hash):
+    """Record that the node accepted the transaction using ``nonce``, so resyncs never reclaim it"""
+    BroadcastNonce.objects.bulk_create(
+        [BroadcastNonce(address=address.lower(), nonce=nonce, transaction_hash=transaction_hash)],
+        update_conflicts=True, unique_fields=['address', 'nonce'], update_fields=['transaction_hash', 'broadcast_at'],
+    )
+
+
+def _dropped(node, pending_counts):
+    """{address: nonces} of recorded broadcasts above the pending count that the node no longer knows"""
+    markers = [
+        (address, nonce, tx_hash)
+        for address, nonce, tx_hash in BroadcastNonce.objects.filter(
+            address__in=list(pending_counts),
+        ).values_list('address', 'nonce', 'transaction_hash')
+        if nonce >= pending_counts[address]
+    ]
+    found = node.batch([('eth_getTransactionByHash', [tx_hash]) for _, _, tx_hash in markers])
+    dropped = {}
+    for (address, nonce, _), tx in zip(markers, found):
+        if tx is None:
+            dropped.setdefault(address, set()).add(nonce)
+    return dropped
+
+
+def _apply_sync(address, pending, stale_after, dropped=()):
+    summary = {'address': address, 'next_nonce': None, 'advanced': 0, 'rewound': 0, 'released': 0}
+    now = timezone.now()
+    with transaction.atomic():
+        tracker = AddressNonce.objects.select_for_update().filter(address=address).first()
+        if tracker is None:
+            return summary
+        # Everything below the node's pending count is mined or in its mempool
+        ReleasedNonce.objects.filter(address=address, nonce__lt=pending).delete()
+        BroadcastNonce.objects.filter(address=address, nonce__lt=pending).delete()
+
+        if pending > tracker.next_nonce:
+            # Transactions were sent from this address outside the allocator
+            summary['advanced'] = pending - tracker.next_nonce
+            tracker.next_nonce = pending
+        elif pending < tracker.next_nonce and (
+            tracker.reserved_at is None or tracker.reserved_at < now - timedelta(seconds=stale_after)
+        ):
+            if dropped:
+                BroadcastNonce.objects.filter(address=address, nonce__in=list(dropped)).delete()
+            in_flight = set(WalletTransaction.objects.filter(
+                from_address__in=[address, to_checksum(address)],
+                nonce__gte=pending, nonce__lt=tracker.next_nonce, status='PENDING',
+            ).values_list('nonce', flat=True))
+            in_flight.update(BroadcastNonce.objects.filter(
+                address=address, nonce__gte=pending, nonce__lt=tracker.next_nonce,
+            ).values_list('nonce', flat=True))
+            released = set(ReleasedNonce.objects.filter(address=address).values_list('nonce', flat=True))
+            unused = [nonce for nonce in range(pending, tracker.next_nonce) if nonce not in in_flight]
+            # Unused nonces at the top are simply handed out again; the rest become gaps to refill
+            while unused and unused[-1] == tracker.next_nonce - 1:
+                unused.pop()
+                tracker.next_nonce -= 1
+                summary['rewound'] += 1
+            ReleasedNonce.objects.filter(address=address, nonce__gte=tracker.next_nonce).delete()
+            missing = [nonce for nonce in unused if nonce not in released]
+            release(address, missing)
+            summary['released'] = len(missing)
+
+        tracker.synced_nonce, tracker.synced_at = pending, now
+        tracker.save(update_fields=['next_nonce', 'synced_nonce', 'synced_at'])
+    if summary['advanced'] or summary['rewound'] or summary['released']:
+        logger.warning('Nonce drift for %s: %s', address, summary)
+    summary['next_nonce'] = tracker.next_nonce
+    return summary
+
+
+def resync_all(node=None, stale_after=None):
+    """Reconcile every tracked address with the node, in one batched RPC round trip"""
+    node = node or get_node()
+    stale_after = _chain_setting('NONCE_STALE_SECONDS', 120) if stale_after is None else stale_after
+    addresses = list(AddressNonce.objects.values_list('address', flat=True))
+    counts = node.batch([('eth_getTransactionCount', [address, 'pending']) for address in addresses])
+    pending_counts = {address: to_int(pending) for address, pending in zip(addresses, counts)}
+    dropped = _dropped(node, pending_counts)
+    return [
+        _apply_sync(address, pending, stale_after, dropped.get(address, ()))
+        for address, pending in pending_counts.items()
+    ]
+
+
+def resync(address, node=None, stale_after=None):
+    node = node or get_node()
+    stale_after = _chain_setting('NONCE_STALE_SECONDS', 120) if stale_after is None else stale_after
+    address = address.lower()
+    pending = to_int(node.call('eth_getTransactionCount', address, 'pending'))
+    return _apply_sync(address, pending, stale_after, _dropped(node, {address: pending}).get(address, ()))
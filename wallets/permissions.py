@@ -0,0 +1,195 @@
+"""
+Effective wallet permissions.
+
+A user's permissions (wallets they own plus active WalletPermission grants)
+are loaded in two queries into a ``PermissionSet`` and kept in a
+per-process cache, then memoized on the request. Grants carry their
+``expires_at``, so an expiring grant stops counting at the right moment
+without another query.
+
+Each user's cache entry is versioned: granting, changing or revoking a
+permission (or creating or deleting a wallet) publishes an invalidation over
+the broadcast channel once the transaction commits; so does reassigning a
+wallet to another user, for both owners. Every process bumps that
+user's version and drops the entry, and a load that started before the bump
+is never stored. The TTL is only a safety net for lost messages.
+
+Queryset ``update()`` and ``bulk_create()`` send no signals: revoke grants
+in bulk with ``revoke_grants()`` and call ``invalidate_users()`` after
+other bulk writes, or the change only shows once the TTL runs out.
+
+Permission types are ordered: ADMIN implies MANAGE, which implies SEND,
+which implies READ. Owners hold ADMIN on their wallets.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from mtt_gateway import broadcast
+
+from .models import Wallet, WalletPermission
+
+CHANNEL = 'mtt:wallet-permissions'
+
+LEVELS = {
+    'READ': 1,
+    'SEND': 2,
+    'MANAGE': 3,
+    'ADMIN': 4,
+}
+OWNER_LEVEL = LEVELS['ADMIN']
+
+
+class PermissionSet:
+    """One user's effective wallet permissions as loaded"""
+
+    def __init__(self, user_id, owned, grants):
+        self.user_id = user_id
+        self.owned = frozenset(owned)
+        self.grants = {}  # wallet id -> [(level, expires_at or None)]
+        for wallet_id, permission_type, expires_at in grants:
+            self.grants.setdefault(wallet_id, []).append((LEVELS[permission_type], expires_at))
+
+    def level(self, wallet_id, now=None):
+        """Highest permission level held on a wallet right now (0 for none)"""
+        if wallet_id in self.owned:
+            return OWNER_LEVEL
+        now = now or timezone.now()
+        return max(
+            (level for level, expires_at in self.grants.get(wallet_id, ()) if expires_at is None or expires_at > now),
+            default=0,
+        )
+
+    def has(self, wallet_id, permission='READ', now=None):
+        return self.level(wallet_id, now) >= LEVELS[permission]
+
+    def wallet_ids(self, permission='READ', now=None):
+        """Every wallet the user holds at least ``permission`` on"""
+        now = now or timezone.now()
+        required = LEVELS[permission]
+        granted = {wallet_id for wallet_id in self.grants if self.level(wallet_id, now) >= required}
+        return self.owned | granted
+
+
+def load_permissions(user_id):
+    now = timezone.now()
+    owned = Wallet.objects.filter(user_id=user_id).values_list('id', flat=True)
+    grants = WalletPermission.objects.filter(user_id=user_id, is_active=True).filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+    ).values_list('wallet_id', 'permission_type', 'expires_at')
+    return PermissionSet(user_id, list(owned), list(grants))
+
+
+class PermissionCache:
+    """Per-process user -> PermissionSet map with per-user versions"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._versions = {}
+        self._generation = 0  # bumped by a full flush
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, user_id, loader):
+        now = time.monotonic()
+        with self._lock:
+            permissions, expires = self._entries.get(user_id, (None, 0))
+            if expires > now:
+                self.hits += 1
+                return permissions
+            self.misses += 1
+            version = (self._generation, self._versions.get(user_id, 0))
+        permissions = loader(user_id)
+        with self._lock:
+            if (self._generation, self._versions.get(user_id, 0)) == version:
+                self._entries[user_id] = (permissions, now + self.ttl)
+        return permissions
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                self._generation += 1
+            else:
+                self._entries.pop(user_id, None)
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process permission cache, subscribed to invalidations on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            ttl = getattr(settings, 'WALLET_PERMISSION_SETTINGS', {}).get('CACHE_TTL_SECONDS', 300)
+            _cache = PermissionCache(ttl)
+            broadcast.subscribe(CHANNEL, _on_message)
+        return _cache
+
+
+def permissions_for(request):
+    """The requesting user's PermissionSet, loaded at most once per request"""
+    permissions = getattr(request, '_wallet_permissions', None)
+    if permissions is None:
+        permissions = get_cache().get(request.user.pk, load_permissions)
+        request._wallet_permissions = permissions
+    return permissions
+
+
+def has_wallet_permission(request, wallet_id, permission='READ'):
+    """Staff may do anything; everyone else needs ``permission`` on the wallet"""
+    if request.user.is_staff:
+        return True
+    return permissions_for(request).has(wallet_id, permission)
+
+
+def invalidate(user_id):
+    """Drop a user's cached permissions in every process once the current transaction commits"""
+    message = {'user_id': user_id}
+    transaction.on_commit(lambda: broadcast.publish(CHANNEL, message))
+
+
+def invalidate_users(user_ids):
+    """``invalidate`` for many users in a single message, e.g. after a bulk insert"""
+    message = {'user_ids': sorted(set(user_ids))}
+    transaction.on_commit(lambda: broadcast.publish(CHANNEL, message))
+
+
+def revoke_grants(grants):
+    """Deactivate a WalletPermission queryset and invalidate its grantees; returns the number revoked"""
+    grants = grants.filter(is_active=True)
+    with transaction.atomic():
+        user_ids = list(grants.values_list('user_id', flat=True).distinct())
+        revoked = grants.update(is_active=False, updated_at=timezone.now())
+        if revoked:
+            invalidate_users(user_ids)
+    return revoked
+
+
+def _on_message(message):
+    if message is None:
+        _cache.invalidate()
+        return
+    for user_id in message.get('user_ids') or [message['user_id']]:
+        _cache.invalidate(user_id)
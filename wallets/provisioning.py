@@ -0,0 +1,307 @@
+"""
+Bulk wallet provisioning for merchant onboarding and migrations.
+
+``provision()`` takes wallet specs (dicts with ``user_id``, ``name`` and
+``wallet_type_id``, optionally ``is_primary``, ``is_merchant``, ``status``
+and, for imported non-custodial wallets, ``address`` / ``public_key``) and
+creates each wallet together with its default WalletAddress row, so the
+deposit scanner watches it straight away.
+
+Custodial wallets get a fresh secp256k1 key. Deriving the public key is the
+expensive part, so it runs in a process pool whose workers also encrypt the
+private key, so plaintext never leaves the worker. Rows are inserted with
+``bulk_create`` one chunk per transaction. The one-primary-per-user rule
+that ``Wallet.save()`` enforces one row at a time is applied set-wise
+instead: only the last primary spec per user is kept, and a single UPDATE
+per chunk demotes those users' older primaries.
+
+Runs are resumable: (user, name) is unique, so each chunk first drops the
+specs that already exist and re-running the same input after a failure
+only creates what is missing.
+"""
+import itertools
+import logging
+import os
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from mtt_gateway import keystore
+
+from . import hd, permissions
+from .models import Wallet, WalletAddress, WalletType
+
+logger = logging.getLogger('mtt_gateway')
+
+WALLET_FIELDS = ('is_primary', 'is_merchant', 'is_gateway', 'status', 'public_key')
+FLAGS = ('is_primary', 'is_merchant', 'is_gateway')
+STATUSES = {status for status, _ in Wallet.STATUS_CHOICES}
+
+
+def _provisioning_setting(name, default):
+    return getattr(settings, 'WALLET_PROVISIONING_SETTINGS', {}).get(name, default)
+
+
+_worker_fernet = None
+
+
+def _init_worker(key):
+    global _worker_fernet
+    _worker_fernet = Fernet(key)
+
+
+def _generate_keypair(_):
+    """(address, public key, encrypted private key) for a fresh custodial key"""
+    while True:
+        secret = os.urandom(32)
+        try:
+            point = hd.public_point(secret)
+        except hd.DerivationError:
+            continue
+        return hd.checksum_address(point), hd.uncompressed_hex(point), _worker_fernet.encrypt(secret).decode()
+
+
+class _InlineExecutor:
+    """Stand-in for small batches, where starting a pool costs more than it saves"""
+
+    def __init__(self):
+        _init_worker(keystore.encryption_key())
+
+    def map(self, function, iterable, chunksize=1):
+        return map(function, iterable)
+
+    def shutdown(self):
+        pass
+
+
+def _demote_duplicate_primaries(specs):
+    """Keep only each user's last primary spec, as saving them in order would"""
+    last = {}
+    for index, spec in enumerate(specs):
+        if spec.get('is_primary'):
+            last[spec['user_id']] = index
+    for index, spec in enumerate(specs):
+        if spec.get('is_primary') and last[spec['user_id']] != index:
+            spec['is_primary'] = False
+
+
+def resolve_users(usernames, chunk_size=5000):
+    """{username: id} for the usernames that exist"""
+    usernames = list(set(usernames))
+    ids = {}
+    for start in range(0, len(usernames), chunk_size):
+        ids.update(User.objects.filter(
+            username__in=usernames[start:start + chunk_size]
+        ).values_list('username', 'id'))
+    return ids
+
+
+def _existing_user_ids(user_ids, chunk_size=5000):
+    user_ids = list(set(user_ids))
+    existing = set()
+    for start in range(0, len(user_ids), chunk_size):
+        existing.update(User.objects.filter(pk__in=user_ids[start:start + chunk_size]).values_list('pk', flat=True))
+    return existing
+
+
+def _address_owners(addresses, chunk_size=5000):
+    """{checksum address: (user_id, wallet name)} for addresses already taken by a Wallet or WalletAddress"""
+    # Stored addresses are not all checksummed, so look both forms up
+    forms = list({form for address in addresses for form in (address, address.lower())})
+    owners = {}
+    for start in range(0, len(forms), chunk_size):
+        chunk = forms[start:start + chunk_size]
+        rows = itertools.chain(
+            WalletAddress.objects.filter(address__in=chunk).values_list('address', 'wallet__user_id', 'wallet__name'),
+            Wallet.objects.filter(address__in=chunk).values_list('address', 'user_id', 'name'),
+        )
+        for address, user_id, name in rows:
+            owners[hd.to_checksum(address)] = (user_id, name)
+    return owners
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def _row_error(row, wallet_type, wallet_types):
+    """The first problem with a row's own fields, or None"""
+    for field in ('username', 'name', 'wallet_type', 'status', 'address', 'public_key'):
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return f'{field} must be a string'
+    for flag in FLAGS:
+        if row.get(flag) is not None and not isinstance(row[flag], (str, int)):
+            return f'{flag} must be a boolean'
+    name = (row.get('name') or '').strip()
+    address = (row.get('address') or '').strip()
+    status = row.get('status') or 'ACTIVE'
+    if not name or len(name) > Wallet._meta.get_field('name').max_length:
+        return 'name is required and must fit 100 characters'
+    if not isinstance(wallet_type, str) or wallet_type not in wallet_types:
+        return f'Unknown wallet type {wallet_type!r}'
+    if status not in STATUSES:
+        return f'Unknown status {status!r}'
+    if address and not (len(address) == 42 and address[:2] == '0x' and _is_hex(address[2:])):
+        return f'Invalid address {address!r}'
+    public_key = row.get('public_key') or ''
+    if len(public_key) > Wallet._meta.get_field('public_key').max_length:
+        return 'public_key must fit 132 characters'
+    return None
+
+
+def specs_from_rows(rows, default_wallet_type=None):
+    """
+    Validate input rows (``username`` or ``user`` id, ``name``,
+    ``wallet_type`` name, flags, ``status``, ``address``, ``public_key``)
+    into provisioning specs. Returns (specs, errors); errors are
+    (row number, message) pairs. Imported addresses must not belong to
+    another wallet, in the database or earlier in ``rows``.
+    """
+    rows = list(rows)
+    wallet_types = dict(WalletType.objects.filter(is_active=True).values_list('name', 'id'))
+    user_ids = resolve_users(
+        row['username'] for row in rows if row.get('username') and isinstance(row['username'], str)
+    )
+    valid, errors = [], []
+    for number, row in enumerate(rows, 1):
+        wallet_type = row.get('wallet_type') or default_wallet_type
+        error = _row_error(row, wallet_type, wallet_types)
+        if error:
+            errors.append((number, error))
+            continue
+        user_id = user_ids.get(row['username']) if row.get('username') else row.get('user')
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            errors.append((number, f"Unknown user {row.get('username') or row.get('user')!r}"))
+            continue
+        address = (row.get('address') or '').strip()
+        valid.append((number, row, user_id, wallet_type, hd.to_checksum(address) if address else None))
+
+    existing_users = _existing_user_ids(user_id for _, _, user_id, _, _ in valid)
+    owners = _address_owners([address for *_, address in valid if address])
+    specs = []
+    for number, row, user_id, wallet_type, address in valid:
+        name = row['name'].strip()
+        if user_id not in existing_users:
+            errors.append((number, f'Unknown user {user_id!r}'))
+            continue
+        if address:
+            # The same (user, name) again is a re-run, which provision() skips
+            owner = owners.setdefault(address, (user_id, name))
+            if owner != (user_id, name):
+                errors.append((number, f'Address {address} already belongs to another wallet'))
+                continue
+        specs.append({
+            'user_id': user_id, 'name': name, 'wallet_type_id': wallet_types[wallet_type],
+            'status': row.get('status') or 'ACTIVE', 'address': address, 'public_key': row.get('public_key') or None,
+            **{flag: _flag(row.get(flag)) for flag in FLAGS},
+        })
+    errors.sort()
+    return specs, errors
+
+
+def _is_hex(value):
+    return all(char in string.hexdigits for char in value)
+
+
+def _pending(chunk):
+    existing = set(Wallet.objects.filter(
+        user_id__in={spec['user_id'] for spec in chunk},
+        name__in={spec['name'] for spec in chunk},
+    ).values_list('user_id', 'name'))
+    return [spec for spec in chunk if (spec['user_id'], spec['name']) not in existing]
+
+
+def _check_addresses(specs):
+    """specs_from_rows' address check, for specs that did not come through it"""
+    owners = _address_owners([hd.to_checksum(spec['address']) for spec in specs if spec.get('address')])
+    for spec in specs:
+        if spec.get('address'):
+            address = hd.to_checksum(spec['address'])
+            if owners.setdefault(address, (spec['user_id'], spec['name'])) != (spec['user_id'], spec['name']):
+                raise ValueError(f'Address {address} already belongs to another wallet')
+
+
+def _insert(specs, keypairs):
+    wallets, addresses = [], []
+    for spec in specs:
+        wallet = Wallet(
+            user_id=spec['user_id'], wallet_type_id=spec['wallet_type_id'], name=spec['name'],
+            **{field: spec[field] for field in WALLET_FIELDS if spec.get(field) is not None},
+        )
+        if spec.get('address'):
+            wallet.address = hd.to_checksum(spec['address'])
+        else:
+            wallet.address, wallet.public_key, wallet.private_key_encrypted = next(keypairs)
+        wallets.append(wallet)
+        addresses.append(WalletAddress(wallet=wallet, address=wallet.address, label='default', address_index=0))
+
+    primaries = [wallet for wallet in wallets if wallet.is_primary]
+    with transaction.atomic():
+        Wallet.objects.bulk_create(wallets)
+        WalletAddress.objects.bulk_create(addresses)
+        if primaries:
+            Wallet.objects.filter(
+                user_id__in={wallet.user_id for wallet in primaries}, is_primary=True
+            ).exclude(pk__in=[wallet.pk for wallet in primaries]).update(is_primary=False)
+        if wallets:
+            permissions.invalidate_users(wallet.user_id for wallet in wallets)
+    return len(wallets)
+
+
+def provision(specs, chunk_size=None, workers=None, progress=None):
+    """
+    Create the wallets described by ``specs`` that do not exist yet.
+    Returns {'created', 'skipped', 'chunks'}; ``progress(summary)`` is called
+    after every chunk. Raises ValueError before creating anything if an
+    imported address belongs to another wallet.
+    """
+    unique = {}
+    for spec in specs:
+        unique.setdefault((spec['user_id'], spec['name']), dict(spec))
+    specs = list(unique.values())
+    _check_addresses(specs)
+    chunk_size = chunk_size or _provisioning_setting('CHUNK_SIZE', 1000)
+    workers = workers or _provisioning_setting('WORKERS', 0) or os.cpu_count()
+    _demote_duplicate_primaries(specs)
+    # Grouping users into as few chunks as possible keeps the existence check narrow
+    specs.sort(key=lambda spec: spec['user_id'])
+
+    custodial = sum(1 for spec in specs if not spec.get('address'))
+    if workers > 1 and custodial >= _provisioning_setting('POOL_THRESHOLD', 64):
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(keystore.encryption_key(),))
+    else:
+        executor = _InlineExecutor()
+
+    def submit(chunk):
+        # Keys for a chunk are generated while the previous chunk is being inserted
+        pending = _pending(chunk)
+        needed = sum(1 for spec in pending if not spec.get('address'))
+        return chunk, pending, executor.map(
+            _generate_keypair, range(needed), chunksize=max(1, needed // (workers * 4))
+        )
+
+    chunks = [specs[start:start + chunk_size] for start in range(0, len(specs), chunk_size)]
+    summary = {'created': 0, 'skipped': 0, 'chunks': 0}
+    try:
+        upcoming = submit(chunks[0]) if chunks else None
+        for index in range(len(chunks)):
+            chunk, pending, keypairs = upcoming
+            keypairs = list(keypairs)
+            upcoming = submit(chunks[index + 1]) if index + 1 < len(chunks) else None
+            summary['created'] += _insert(pending, iter(keypairs))
+            summary['skipped'] += len(chunk) - len(pending)
+            summary['chunks'] += 1
+            if progress:
+                progress(summary)
+    except Exception:
+        logger.exception('Wallet provisioning stopped after %s chunks; re-run to resume', summary['chunks'])
+        raise
+    finally:
+        executor.shutdown()
+    return summary
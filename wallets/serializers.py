@@ -0,0 +1,47 @@
+from rest_framework import serializers
+
+from .models import Wallet, WalletAddress, WalletTransaction, WalletType
+
+
+class WalletTypeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WalletType
+        fields = [
+            'id', 'name', 'category', 'description', 'is_active', 'supports_mtt',
+            'requires_kyc', 'created_at',
+        ]
+
+
+class WalletSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    wallet_type = serializers.CharField(source='wallet_type.name', read_only=True)
+
+    class Meta:
+        model = Wallet
+        fields = [
+            'id', 'user_id', 'username', 'wallet_type', 'name', 'address', 'status',
+            'is_primary', 'is_merchant', 'is_gateway', 'last_activity', 'created_at',
+        ]
+
+
+class WalletAddressSerializer(serializers.ModelSerializer):
+    wallet_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = WalletAddress
+        fields = [
+            'id', 'wallet_id', 'address', 'label', 'is_active', 'is_change_address',
+            'derivation_path', 'used_count', 'created_at',
+        ]
+
+
+class WalletTransactionSerializer(serializers.ModelSerializer):
+    wallet_id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = WalletTransaction
+        fields = [
+            'id', 'wallet_id', 'transaction_hash', 'transaction_type', 'amount', 'fee',
+            'status', 'confirmations', 'block_number', 'created_at',
+        ]
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from mtt_gateway import keystore
+
+from . import permissions
+from .models import Wallet, WalletPermission
+
+
+@receiver(post_save, sender=Wallet)
+def evict_inactive_wallet_key(sender, instance, **kwargs):
+    """Stop serving a cached private key once the wallet can no longer sign"""
+    if instance.status != 'ACTIVE':
+        keystore.evict('wallet', instance.pk)
+
+
+@receiver(post_delete, sender=Wallet)
+def evict_deleted_wallet_key(sender, instance, **kwargs):
+    keystore.evict('wallet', instance.pk)
+
+
+@receiver(pre_save, sender=Wallet)
+def remember_previous_owner(sender, instance, update_fields=None, **kwargs):
+    instance._previous_user_id = None
+    if instance._state.adding or (update_fields is not None and 'user' not in update_fields):
+        return
+    instance._previous_user_id = Wallet.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=Wallet)
+def invalidate_owner_permissions(sender, instance, created, **kwargs):
+    """A new wallet gains its owner ADMIN; a reassigned one moves it from the previous owner"""
+    previous = getattr(instance, '_previous_user_id', None)
+    if created:
+        permissions.invalidate(instance.user_id)
+    elif previous is not None and previous != instance.user_id:
+        permissions.invalidate_users([previous, instance.user_id])
+
+
+@receiver(post_delete, sender=Wallet)
+def invalidate_deleted_owner_permissions(sender, instance, **kwargs):
+    permissions.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=WalletPermission)
+@receiver(post_delete, sender=WalletPermission)
+def invalidate_grantee_permissions(sender, instance, **kwargs):
+    permissions.invalidate(instance.user_id)
@@ -1,3 +1,478 @@
-from django.test import TestCase
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from canasale.models import SystemAlert
+from mtt_gateway import keystore
+from mtt_gateway.rpc import LocalNode, encode_local_tx
+from mtt_gateway.testing import PageQueryCountMixin
+from tokens.models import Token, TokenBalance, TokenTransfer
+
+from . import address_pool, backups, hd, nonces, permissions, provisioning
+from .confirmations import ConfirmationTracker
+from .deposits import TRANSFER_TOPIC, DepositScanner
+from .models import (
+    ChainDeposit, ReleasedNonce, ScanCursor, Wallet, WalletAddress, WalletBackup, WalletPermission, WalletTransaction,
+    WalletType,
+)
+from .provisioning import provision
+
+
+def create_wallet(username='owner', address='0x' + '1' * 40):
+    user = User.objects.create_user(username)
+    wallet_type, _ = WalletType.objects.get_or_create(name='Hot', defaults={'category': 'CUSTODIAL'})
+    return Wallet.objects.create(user=user, wallet_type=wallet_type, name='Main', address=address)
+
+
+class ConfirmationTrackerTests(TestCase):
+    def setUp(self):
+        self.node = LocalNode()
+        self.chain = self.node.chain
+        self.tracker = ConfirmationTracker(node=self.node, required=3)
+        wallet = create_wallet()
+        self.tx = WalletTransaction.objects.create(
+            wallet=wallet, transaction_hash='0x' + 'a' * 64, from_address=wallet.address,
+            to_address='0x' + '2' * 40, amount=1, transaction_type='SEND',
+        )
+        self.tracker.poll()
+
+    def mine(self, success=True, count=1):
+        self.chain.mine([{'hash': self.tx.transaction_hash, 'success': success}], count=count)
+        self.tracker.poll()
+        self.tx.refresh_from_db()
+
+    def test_reverted_transaction_fails_only_at_the_required_depth(self):
+        self.mine(success=False)
+        self.assertEqual((self.tx.status, self.tx.confirmations), ('PENDING', 1))
+        self.chain.mine(count=2)
+        self.tracker.poll()
+        self.tx.refresh_from_db()
+        self.assertEqual((self.tx.status, self.tx.error_message), ('FAILED', 'Transaction reverted'))
+
+    def test_reverted_transaction_reorged_out_and_included_again_confirms(self):
+        self.mine(success=False)
+        self.chain.reorg(1)
+        self.mine(success=True, count=3)
+        self.assertEqual(self.tracker.stats()['reorgs'], 1)
+        self.assertEqual(self.tx.status, 'CONFIRMED')
+        self.assertIsNone(self.tx.error_message)
+
+
+    def test_row_committed_after_its_block_was_scanned_is_tracked(self):
+        late = '0x' + 'b' * 64
+        self.chain.mine([{'hash': late}])
+        self.tracker.poll()
+        tx = WalletTransaction.objects.create(
+            wallet=self.tx.wallet, transaction_hash=late, from_address=self.tx.from_address,
+            to_address='0x' + '2' * 40, amount=1, transaction_type='SEND',
+        )
+        self.chain.mine(count=2)
+        self.tracker.poll()
+        tx.refresh_from_db()
+        self.assertEqual((tx.status, tx.block_number), ('CONFIRMED', 1))
+
+    def test_hash_set_after_the_row_was_created_is_tracked(self):
+        transfer = TokenTransfer.objects.create(
+            token=Token.objects.create(contract_address='0x' + '0' * 40), to_user=self.tx.wallet.user,
+            amount=1, transfer_type='PURCHASE',
+        )
+        self.tracker.poll()
+        transfer.transaction_hash = '0x' + 'c' * 64
+        transfer.save()
+        self.chain.mine([{'hash': transfer.transaction_hash}], count=3)
+        self.tracker.poll()
+        transfer.refresh_from_db()
+        self.assertEqual((transfer.block_number, transfer.status), (1, 'COMPLETED'))
+
+    def test_pending_receipts_are_rechecked_periodically(self):
+        with mock.patch.object(self.tracker, 'catch_up', wraps=self.tracker.catch_up) as catch_up:
+            self.tracker.poll()
+            catch_up.assert_not_called()
+            self.tracker.recheck_seconds = 0.001
+            time.sleep(0.002)
+            self.tracker.poll()
+            catch_up.assert_called_once()
+
+class DepositScannerTests(TestCase):
+    def setUp(self):
+        self.node = LocalNode()
+        self.chain = self.node.chain
+        self.wallet = create_wallet()
+        self.address = WalletAddress.objects.create(wallet=self.wallet, address='0x' + '3' * 40)
+        self.token = Token.objects.create(contract_address='0x' + '4' * 40)
+        self.scanner = self.new_scanner()
+        self.scanner.poll()
+
+    def new_scanner(self):
+        return DepositScanner(node=self.node, required=3)
+
+    def token_deposit(self, tx_hash, amount=10 ** 18):
+        return {'hash': tx_hash, 'from': '0x' + '5' * 40, 'to': self.token.contract_address, 'value': '0x0',
+                'logs': [{'address': self.token.contract_address, 'data': hex(amount), 'topics': [
+                    TRANSFER_TOPIC, '0x' + '5' * 64, '0x' + self.address.address[2:].rjust(64, '0'),
+                ]}]}
+
+    def balance(self):
+        row = TokenBalance.objects.filter(user=self.wallet.user, token=self.token).first()
+        return row.balance if row else 0
+
+    def test_token_deposit_is_credited_at_the_required_depth(self):
+        self.chain.mine([self.token_deposit('0x' + 'a' * 64)])
+        self.assertEqual(len(self.scanner.poll()), 1)
+        deposit = ChainDeposit.objects.get()
+        self.assertEqual((deposit.status, deposit.value, deposit.log_index), ('PENDING', 10 ** 18, 0))
+        self.assertEqual((deposit.transfer.status, self.balance()), ('PENDING', 0))
+
+        self.chain.mine(count=2)
+        self.scanner.poll()
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.status, deposit.transfer.status), ('CONFIRMED', 'COMPLETED'))
+        self.assertEqual(self.balance(), 1)
+
+    def test_native_deposit_is_recorded_without_a_credit(self):
+        self.chain.mine([{'hash': '0x' + 'a' * 64, 'from': '0x' + '5' * 40, 'to': self.address.address,
+                          'value': hex(10 ** 16)}])
+        self.scanner.poll()
+        deposit = ChainDeposit.objects.get()
+        self.assertEqual((deposit.log_index, deposit.token_contract, deposit.transfer), (-1, None, None))
+        self.assertEqual(deposit.wallet_address, self.address)
+
+    def test_restart_resumes_from_the_stored_cursor_without_duplicates(self):
+        self.chain.mine([self.token_deposit('0x' + 'a' * 64)])
+        self.scanner.poll()
+        self.chain.mine([self.token_deposit('0x' + 'b' * 64)])
+
+        restarted = self.new_scanner()
+        self.assertEqual(len(restarted.poll()), 1)
+        self.assertEqual(ScanCursor.objects.get(name='deposits').block_number, 2)
+        self.assertEqual(ChainDeposit.objects.count(), 2)
+
+        # Rescanning already recorded blocks records nothing new
+        restarted.cursor = 0
+        self.assertEqual(restarted.poll(), [])
+        self.assertEqual(TokenTransfer.objects.count(), 2)
+
+    def test_deposit_reorged_away_is_dropped_and_rescanned(self):
+        tx = self.token_deposit('0x' + 'a' * 64)
+        self.chain.mine([tx])
+        self.scanner.poll()
+        orphaned = ChainDeposit.objects.get().transfer
+        self.chain.reorg(1)
+        self.chain.mine(count=2)
+        self.scanner.poll()
+        orphaned.refresh_from_db()
+        self.assertEqual(orphaned.status, 'CANCELLED')
+        self.assertFalse(ChainDeposit.objects.exists())
+        self.assertEqual(self.scanner.stats()['orphaned'], 1)
+
+        # Included again in a later block: recorded and credited once
+        self.chain.mine([tx], count=3)
+        self.scanner.poll()
+        self.scanner.poll()
+        deposit = ChainDeposit.objects.get()
+        self.assertEqual((deposit.block_number, deposit.status), (4, 'CONFIRMED'))
+        self.assertEqual(self.balance(), 1)
+
+
+class ProvisionViewTests(TestCase):
+    path = '/api/wallets/provision/'
+    address = '0x' + 'ab' * 20
+
+    def setUp(self):
+        self.wallet = create_wallet()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def post(self, *rows):
+        return self.client.post(self.path, {'wallets': list(rows), 'wallet_type': 'Hot'}, format='json')
+
+    def row(self, **fields):
+        return {'user': self.wallet.user_id, 'name': 'Imported', **fields}
+
+    def assertRejected(self, *rows):
+        response = self.post(*rows)
+        self.assertEqual(response.status_code, 400, response.data)
+        return response.data['rows']
+
+    def test_creates_wallets_and_skips_them_on_a_rerun(self):
+        self.assertEqual(self.post(self.row(address=self.address)).data['created'], 1)
+        self.assertEqual(self.post(self.row(address=self.address)).data['skipped'], 1)
+
+    def test_address_of_an_existing_wallet_is_rejected(self):
+        self.assertRejected(self.row(address=self.wallet.address))
+
+    def test_address_of_an_existing_wallet_address_is_rejected(self):
+        WalletAddress.objects.create(wallet=self.wallet, address=self.address)
+        self.assertRejected(self.row(address=self.address.upper().replace('0X', '0x')))
+
+    def test_address_repeated_within_the_batch_is_rejected(self):
+        rows = self.assertRejected(self.row(address=self.address), self.row(name='Other', address=self.address))
+        self.assertEqual([row['row'] for row in rows], [2])
+
+    def test_wrongly_typed_fields_are_rejected(self):
+        for fields in ({'name': 5}, {'wallet_type': ['Hot']}, {'status': ['ACTIVE']}, {'is_primary': {}}):
+            with self.subTest(fields=fields):
+                self.assertRejected(self.row(**fields))
+
+    def test_unknown_user_id_is_rejected(self):
+        self.assertRejected(self.row(user=10 ** 6))
+
+
+class ProvisionTests(TestCase):
+    def setUp(self):
+        self.wallet = create_wallet()
+        self.spec = {'user_id': self.wallet.user_id, 'wallet_type_id': self.wallet.wallet_type_id}
+
+    @override_settings(WALLET_PROVISIONING_SETTINGS={'POOL_THRESHOLD': 2})
+    def test_keys_derived_in_a_process_pool_match_their_addresses(self):
+        specs = [dict(self.spec, name=f'Custodial {n}') for n in range(5)]
+        with mock.patch.object(provisioning, 'ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            summary = provision(specs, chunk_size=2, workers=2)
+        pool.assert_called_once()
+        self.assertEqual((summary['created'], summary['chunks']), (5, 3))
+
+        fernet = Fernet(keystore.encryption_key())
+        wallets = Wallet.objects.filter(name__startswith='Custodial')
+        self.assertEqual(len({wallet.address for wallet in wallets}), 5)
+        for wallet in wallets:
+            secret = fernet.decrypt(wallet.private_key_encrypted.encode())
+            self.assertEqual(hd.checksum_address(hd.public_point(secret)), wallet.address)
+            self.assertEqual(wallet.addresses.get().address, wallet.address)
+
+    def test_address_of_another_wallet_is_refused_before_creating_anything(self):
+        specs = [dict(self.spec, name='New'), dict(self.spec, name='Imported', address=self.wallet.address)]
+        with self.assertRaisesMessage(ValueError, 'already belongs to another wallet'):
+            provision(specs)
+        self.assertFalse(Wallet.objects.filter(name='New').exists())
+
+    def test_address_repeated_across_specs_is_refused(self):
+        address = '0x' + 'ab' * 20
+        with self.assertRaises(ValueError):
+            provision([dict(self.spec, name='A', address=address), dict(self.spec, name='B', address=address)])
+
+
+class AddressPoolTests(TestCase):
+    # BIP32 test vector 1, m/0'/1/2'/2
+    xpub = (
+        'xpub6FHa3pjLCk84BayeJxFW2SP4XRrFd1JYnxeLeU8EqN3vDfZmbqBqaGJAyiLjTAwm6Z'
+        'LRQUMv1ZACTj37sR62cfN7fe5JnJ7dh8zL4fiyLHV'
+    )
+
+    def setUp(self):
+        self.wallet = create_wallet()
+        self.wallet.public_key = self.xpub
+        self.wallet.save()
+
+    def pooled(self):
+        return WalletAddress.objects.filter(wallet=self.wallet, is_allocated=False)
+
+    def test_refill_tops_up_below_the_low_water_mark(self):
+        self.assertEqual(address_pool.refill(self.wallet, low_water=2, target=5), 5)
+        self.assertEqual(
+            [(row.address_index, row.address) for row in self.pooled().order_by('address_index')],
+            list(hd.derive_addresses(self.xpub, 0, 5)),
+        )
+        address_pool.claim(self.wallet.pk)
+        self.assertEqual(address_pool.refill(self.wallet, low_water=2, target=5), 0)
+        for _ in range(3):
+            address_pool.claim(self.wallet.pk)
+        self.assertEqual(address_pool.refill(self.wallet, low_water=2, target=5), 4)
+        self.assertEqual(self.pooled().order_by('address_index').first().address_index, 4)
+
+    def test_refill_counts_only_rows_it_inserted(self):
+        # As if a concurrent refill had already stored index 3
+        (_, address), = hd.derive_addresses(self.xpub, 3, 1)
+        WalletAddress.objects.create(wallet=create_wallet('other', '0x' + '2' * 40), address=address)
+        self.assertEqual(address_pool.refill(self.wallet, low_water=1, target=5), 4)
+
+    def test_claims_hand_out_the_lowest_index_once(self):
+        address_pool.refill(self.wallet, low_water=1, target=2)
+        first, second = address_pool.claim(self.wallet.pk, 'order 1'), address_pool.claim(self.wallet.pk)
+        self.assertEqual((first[3], second[3]), (0, 1))
+        self.assertEqual(WalletAddress.objects.get(pk=first[0]).label, 'order 1')
+        self.assertIsNone(address_pool.claim(self.wallet.pk))
+
+    def test_allocate_derives_inline_when_the_pool_is_dry(self):
+        claimed = address_pool.allocate(self.wallet)
+        self.assertEqual(claimed[1:], (list(hd.derive_addresses(self.xpub, 0, 1))[0][1], "m/44'/60'/0'/0/0", 0))
+        self.assertFalse(self.pooled().exists())
+
+
+class BackupVerifyTests(TestCase):
+    def setUp(self):
+        self.wallet = create_wallet()
+
+    def backup(self, data, checksum=None, backup_type='KEYSTORE'):
+        return WalletBackup.objects.create(
+            wallet=self.wallet, backup_type=backup_type, encrypted_data=data,
+            checksum=hashlib.sha256(data.encode()).hexdigest() if checksum is None else checksum,
+        )
+
+    def alerts(self):
+        return SystemAlert.objects.filter(related_object_type=backups.ALERT_OBJECT_TYPE)
+
+    def test_matching_checksums_are_verified(self):
+        good = self.backup('ciphertext')
+        upper = self.backup('other', hashlib.sha256(b'other').hexdigest().upper(), 'SEED_PHRASE')
+        summary = backups.verify(chunk_size=1, workers=2)
+        self.assertEqual((summary['verified'], summary['mismatched'], summary['bytes']), (2, 0, 15))
+        for backup in (good, upper):
+            backup.refresh_from_db()
+            self.assertTrue(backup.is_verified)
+            self.assertIsNotNone(backup.last_verified)
+        self.assertFalse(self.alerts().exists())
+
+    def test_mismatch_is_flagged_and_alerted_once(self):
+        tampered = self.backup('ciphertext', '0' * 64)
+        self.assertEqual(backups.verify(workers=1)['mismatched'], 1)
+        self.assertEqual(backups.verify(days=7, workers=1)['mismatched'], 1)  # failing backups stay due
+        tampered.refresh_from_db()
+        self.assertFalse(tampered.is_verified)
+        alert = self.alerts().get()
+        self.assertEqual(
+            (alert.alert_type, alert.category, alert.related_object_id), ('CRITICAL', 'SECURITY', tampered.pk)
+        )
+
+    def test_incremental_runs_skip_recent_verifications(self):
+        self.backup('ciphertext')
+        backups.verify(workers=1)
+        self.assertEqual(backups.verify(days=7, workers=1)['backups'], 0)
+        WalletBackup.objects.update(last_verified=timezone.now() - timedelta(days=8))
+        self.assertEqual(backups.verify(days=7, workers=1)['backups'], 1)
+
+
+class GasFeesViewTests(TestCase):
+    path = '/api/wallets/gas/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('user'))
+
+    def test_non_string_fields_are_rejected(self):
+        for body in (
+            {'sends': [{'to': ['0x1'], 'data': '0x01'}]},
+            {'sends': [{'to': '0x1', 'data': {'a': 1}}]},
+            {'sends': [], 'speed': ['fast']},
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post(self.path, body, format='json').status_code, 400)
+
+    def test_invalid_requests_never_reach_the_oracle(self):
+        with mock.patch('wallets.views.get_oracle') as get_oracle:
+            self.client.post(self.path, {'sends': 'nope'}, format='json')
+        get_oracle.assert_not_called()
+
+
+class NonceResyncTests(TestCase):
+    address = '0x' + '4' * 40
+
+    def setUp(self):
+        self.node = LocalNode()
+        self.reserved = nonces.reserve(self.address, count=3, node=self.node)
+
+    def send(self, nonce):
+        return self.node.call('eth_sendRawTransaction', encode_local_tx(
+            {'from': self.address, 'nonce': hex(nonce), 'to': '0x' + '2' * 40, 'value': '0x1'}
+        ))
+
+    def released(self):
+        return sorted(ReleasedNonce.objects.filter(address=self.address).values_list('nonce', flat=True))
+
+    def test_broadcasts_queued_behind_a_gap_are_not_reclaimed(self):
+        for nonce in self.reserved[1:]:
+            nonces.broadcast(self.address, nonce, self.send(nonce))
+        summary = nonces.resync(self.address, node=self.node, stale_after=0)
+        self.assertEqual((summary['next_nonce'], summary['released']), (3, 1))
+        self.assertEqual(self.released(), [0])
+
+    def test_broadcasts_the_node_dropped_are_reclaimed(self):
+        nonces.broadcast(self.address, 1, '0x' + 'f' * 64)
+        summary = nonces.resync(self.address, node=self.node, stale_after=0)
+        self.assertEqual((summary['next_nonce'], summary['rewound']), (0, 3))
+
+
+class ListQueryCountTests(PageQueryCountMixin, TestCase):
+    """Every page is one query, whatever its size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('owner')
+        wallet_types = WalletType.objects.bulk_create([
+            WalletType(name=f'Type {n}', category='CUSTODIAL') for n in range(50)
+        ])
+        wallets = Wallet.objects.bulk_create([
+            Wallet(user=user, wallet_type=wallet_types[0], name=f'Wallet {n}', address=f'0x{n:040x}')
+            for n in range(50)
+        ])
+        WalletAddress.objects.bulk_create([
+            WalletAddress(wallet=wallet, address=f'0x{n + 100:040x}') for n, wallet in enumerate(wallets)
+        ])
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(
+                wallet=wallet, transaction_hash=f'0x{n:064x}', from_address=wallet.address,
+                to_address=wallet.address, amount=1, transaction_type='SEND',
+            )
+            for n, wallet in enumerate(wallets)
+        ])
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_wallet_types(self):
+        # Not paginated: all 50 types in one query
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/wallets/types/')
+        self.assertEqual(response.data['count'], 50)
+
+    def test_wallets(self):
+        self.assertPageQueries('/api/wallets/list/')
+
+    def test_addresses(self):
+        self.assertPageQueries('/api/wallets/addresses/')
+
+    def test_transactions(self):
+        self.assertPageQueries('/api/wallets/transactions/')
+
+
+class PermissionInvalidationTests(TestCase):
+    def setUp(self):
+        self.wallet = create_wallet()
+        self.owner = self.wallet.user
+        self.other = User.objects.create_user('other')
+        self.cache = permissions.get_cache()
+        self.cache.invalidate()
+
+    def level(self, user):
+        return self.cache.get(user.pk, permissions.load_permissions).level(self.wallet.pk)
+
+    def test_reassigning_a_wallet_invalidates_both_owners(self):
+        self.assertEqual((self.level(self.owner), self.level(self.other)), (permissions.OWNER_LEVEL, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.user = self.other
+            self.wallet.save()
+        self.assertEqual((self.level(self.owner), self.level(self.other)), (0, permissions.OWNER_LEVEL))
+
+    def test_saving_other_fields_does_not_invalidate(self):
+        self.level(self.owner)
+        invalidations = self.cache.invalidations
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.name = 'Renamed'
+            self.wallet.save()
+        self.assertEqual(self.cache.invalidations, invalidations)
+
+    def test_revoke_grants_invalidates_the_grantees(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            WalletPermission.objects.create(
+                wallet=self.wallet, user=self.other, permission_type='SEND', granted_by=self.owner,
+            )
+        self.assertEqual(self.level(self.other), permissions.LEVELS['SEND'])
+        with self.captureOnCommitCallbacks(execute=True):
+            revoked = permissions.revoke_grants(WalletPermission.objects.filter(wallet=self.wallet))
+        self.assertEqual(revoked, 1)
+        self.assertEqual(self.level(self.other), 0)
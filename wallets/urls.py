@@ -12,9 +12,17 @@ urlpatterns = [
     
     # Wallets
     path('list/', views.wallets_list, name='wallets_list'),
+    path('provision/', views.wallets_provision, name='wallets_provision'),
     
     # Wallet Addresses  
     path('addresses/', views.wallet_addresses_list, name='wallet_addresses_list'),
+    path('addresses/allocate/', views.wallet_address_allocate, name='wallet_address_allocate'),
+    
+    # Custodial key cache
+    path('keys/cache-stats/', views.key_cache_stats, name='key_cache_stats'),
+    
+    # Gas fees
+    path('gas/', views.gas_fees, name='gas_fees'),
     
     # Wallet Transactions
     path('transactions/', views.wallet_transactions_list, name='wallet_transactions_list'),
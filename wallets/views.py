@@ -1,8 +1,20 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.http import JsonResponse
+from mtt_gateway import activity, keystore
+from mtt_gateway.filters import filter_params
+from mtt_gateway.gas import SEND_FIELDS, SPEEDS, get_oracle
+from mtt_gateway.pagination import KeysetPagination
+from .address_pool import allocate
 from .models import WalletType, Wallet, WalletAddress, WalletTransaction
+from .permissions import has_wallet_permission, permissions_for
+from .provisioning import provision, specs_from_rows
+from .serializers import (
+    WalletAddressSerializer, WalletSerializer, WalletTransactionSerializer, WalletTypeSerializer,
+)
 
 @api_view(['GET'])
 def api_root(request):
@@ -16,7 +28,11 @@ def api_root(request):
             'wallet_types': '/api/wallets/types/',
             'wallets': '/api/wallets/list/',
             'addresses': '/api/wallets/addresses/',
+            'allocate_address': '/api/wallets/addresses/allocate/',
+            'provision': '/api/wallets/provision/',
             'transactions': '/api/wallets/transactions/',
+            'key_cache_stats': '/api/wallets/keys/cache-stats/',
+            'gas': '/api/wallets/gas/',
         },
         'description': 'Custodial and non-custodial wallet management with security features'
     })
@@ -27,17 +43,8 @@ def wallet_types_list(request):
     List all wallet types or create a new one
     """
     if request.method == 'GET':
-        wallet_types = WalletType.objects.all()
-        data = []
-        for wt in wallet_types:
-            data.append({
-                'id': wt.id,
-                'name': wt.name,
-                'description': wt.description,
-                'is_custodial': wt.is_custodial,
-                'security_level': wt.security_level,
-                'created_at': wt.created_at.isoformat()
-            })
+        wallet_types = WalletType.objects.only(*WalletTypeSerializer.Meta.fields).order_by('name')
+        data = WalletTypeSerializer(wallet_types, many=True).data
         return Response({
             'count': len(data),
             'results': data
@@ -53,27 +60,21 @@ def wallet_types_list(request):
 @api_view(['GET', 'POST'])
 def wallets_list(request):
     """
-    List all wallets or create a new one
+    List all wallets or create a new one (non-staff see wallets they own
+    or hold READ on)
     """
     if request.method == 'GET':
-        wallets = Wallet.objects.all()[:10]  # Limit to 10 for demo
-        data = []
-        for wallet in wallets:
-            data.append({
-                'id': wallet.id,
-                'wallet_id': str(wallet.wallet_id),
-                'user_id': wallet.user.id if wallet.user else None,
-                'username': wallet.user.username if wallet.user else None,
-                'wallet_type': wallet.wallet_type.name if wallet.wallet_type else None,
-                'balance': str(wallet.balance),
-                'currency': wallet.currency,
-                'is_active': wallet.is_active,
-                'created_at': wallet.created_at.isoformat()
-            })
-        return Response({
-            'count': len(data),
-            'results': data
-        })
+        wallets = Wallet.objects.select_related('user', 'wallet_type').only(
+            'id', 'user__username', 'wallet_type__name', 'name', 'address', 'status',
+            'is_primary', 'is_merchant', 'is_gateway', 'last_activity', 'created_at',
+        )
+        if not request.user.is_staff:
+            wallets = wallets.filter(pk__in=permissions_for(request).wallet_ids('READ'))
+        wallets = filter_params(wallets, request, ('user', 'status'))
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(wallets, request)
+        return paginator.get_paginated_response(WalletSerializer(page, many=True).data)
     
     elif request.method == 'POST':
         return Response({
@@ -81,49 +82,131 @@ def wallets_list(request):
             'note': 'Implementation would create new wallet here'
         }, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+def wallets_provision(request):
+    """
+    Create wallets in bulk (staff only; body: {"wallets": [{"username" or "user",
+    "name", "wallet_type", "is_primary", "is_merchant", "address", ...}],
+    "wallet_type": <default type name>}). Existing (user, name) pairs are
+    skipped, so a failed request can simply be retried.
+    """
+    if not request.user.is_staff:
+        return Response({'error': 'Staff only'}, status=status.HTTP_403_FORBIDDEN)
+    rows = request.data.get('wallets')
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return Response({'error': 'wallets must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = getattr(settings, 'WALLET_PROVISIONING_SETTINGS', {}).get('MAX_API_WALLETS', 5000)
+    if len(rows) > limit:
+        return Response(
+            {'error': f'At most {limit} wallets per request; use the provision_wallets command'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    specs, errors = specs_from_rows(rows, request.data.get('wallet_type'))
+    if errors:
+        return Response(
+            {'error': 'Invalid wallets', 'rows': [{'row': number, 'error': message} for number, message in errors]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        summary = provision(specs)
+    except ValueError as exc:  # an address was taken after validation
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(summary, status=status.HTTP_201_CREATED)
+
 @api_view(['GET'])
 def wallet_addresses_list(request):
     """
-    List wallet addresses
-    """
-    addresses = WalletAddress.objects.all()[:10]
-    data = []
-    for addr in addresses:
-        data.append({
-            'id': addr.id,
-            'wallet_id': str(addr.wallet.wallet_id) if addr.wallet else None,
-            'address': addr.address,
-            'blockchain': addr.blockchain,
-            'address_type': addr.address_type,
-            'is_active': addr.is_active,
-            'created_at': addr.created_at.isoformat()
-        })
-    
+    List wallet addresses (?wallet=<id>)
+    """
+    addresses = WalletAddress.objects.only(*WalletAddressSerializer.Meta.fields)
+    if not request.user.is_staff:
+        addresses = addresses.filter(wallet_id__in=permissions_for(request).wallet_ids('READ'))
+    addresses = filter_params(addresses, request, ('wallet',))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(addresses, request)
+    return paginator.get_paginated_response(WalletAddressSerializer(page, many=True).data)
+
+@api_view(['POST'])
+def wallet_address_allocate(request):
+    """
+    Allocate a deposit address from the wallet's pre-derived pool; needs
+    MANAGE on the wallet (body: {"wallet": <id>, "label": <optional label>})
+    """
+    try:
+        wallet = Wallet.objects.filter(
+            pk=request.data.get('wallet'), status='ACTIVE'
+        ).only('id', 'public_key').first()
+    except ValidationError:
+        wallet = None
+    if wallet is None or not has_wallet_permission(request, wallet.pk, 'MANAGE'):
+        return Response({'error': 'Wallet not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    claimed = allocate(wallet, request.data.get('label', ''))
+    activity.touch('wallet', wallet.pk)
+    if claimed is None:
+        return Response(
+            {'error': 'Wallet has no address pool'},
+            status=status.HTTP_409_CONFLICT
+        )
+    address_id, address, derivation_path, address_index = claimed
     return Response({
-        'count': len(data),
-        'results': data
-    })
+        'id': address_id,
+        'wallet_id': wallet.pk,
+        'address': address,
+        'derivation_path': derivation_path,
+        'address_index': address_index,
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+def key_cache_stats(request):
+    """
+    Hit rate and occupancy of this process's decrypted key cache (staff only)
+    """
+    if not request.user.is_staff:
+        return Response({'error': 'Staff only'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(keystore.get_cache().stats())
+
+@api_view(['GET', 'POST'])
+def gas_fees(request):
+    """
+    Cached fee suggestions (?stats=1 for the oracle counters), or gas
+    estimates for a batch of sends
+    (POST body: {"sends": [{"to", "from", "value", "data"}, ...], "speed": "standard"})
+    """
+    if request.method == 'GET':
+        if request.query_params.get('stats'):
+            return Response(get_oracle().stats())
+        return Response(get_oracle().suggestions())
+
+    sends = request.data.get('sends')
+    speed = request.data.get('speed', 'standard')
+    if not isinstance(sends, list) or not all(isinstance(send, dict) for send in sends):
+        return Response({'error': 'sends must be a list of transactions'}, status=status.HTTP_400_BAD_REQUEST)
+    if not all(isinstance(send.get(field), (str, type(None))) for send in sends for field in SEND_FIELDS):
+        return Response(
+            {'error': f"{', '.join(SEND_FIELDS)} must be hex strings"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not isinstance(speed, str) or speed not in SPEEDS:
+        return Response(
+            {'error': f"speed must be one of {', '.join(SPEEDS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({'speed': speed, 'results': get_oracle().estimate(sends, speed)})
 
 @api_view(['GET'])
 def wallet_transactions_list(request):
     """
-    List wallet transactions
-    """
-    transactions = WalletTransaction.objects.all()[:10]
-    data = []
-    for tx in transactions:
-        data.append({
-            'id': tx.id,
-            'transaction_id': str(tx.transaction_id),
-            'wallet_id': str(tx.wallet.wallet_id) if tx.wallet else None,
-            'transaction_type': tx.transaction_type,
-            'amount': str(tx.amount),
-            'currency': tx.currency,
-            'status': tx.status,
-            'created_at': tx.created_at.isoformat()
-        })
-    
-    return Response({
-        'count': len(data),
-        'results': data
-    })
+    List wallet transactions, newest first, with cursor pagination
+    (?wallet=<id>|status=<status>&cursor=<next cursor>)
+    """
+    transactions = WalletTransaction.objects.only(*WalletTransactionSerializer.Meta.fields)
+    if not request.user.is_staff:
+        transactions = transactions.filter(wallet_id__in=permissions_for(request).wallet_ids('READ'))
+    transactions = filter_params(transactions, request, ('wallet', 'status'))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(transactions, request)
+    return paginator.get_paginated_response(WalletTransactionSerializer(page, many=True).data)